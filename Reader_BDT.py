@@ -6,12 +6,46 @@ import argparse
 import math
 from array import *
 import numpy as np
-import ROOT
-from ROOT import TMVA, TFile, TTree, TCut, TString, TH1F
+try:
+    import ROOT
+    from ROOT import TMVA, TFile, TTree, TCut, TString, TH1F
+except ImportError:
+    ROOT = None  # Only the --batch path can run without ROOT
 
-ROOT.gStyle.SetOptStat(0)
-ROOT.gROOT.SetBatch(True)
-ROOT.TH1.SetDefaultSumw2(True)
+if ROOT is not None:
+    ROOT.gStyle.SetOptStat(0)
+    ROOT.gROOT.SetBatch(True)
+    ROOT.TH1.SetDefaultSumw2(True)
+
+HIST_BINS = (20, -1.0, 1.0)
+
+INPUT_VARS = ["jet1_pt","jet1_eta","jet2_pt","jet2_eta","met_pt","met_sig","meff","mjj","pTjj","dRjj","dEtajj","mbb","pTbb","dRbb","dEtabb","dPhibb","R_met_jet","R_met_meff","sum_jet_pt","jet2_gn2pcbt"]
+
+#-------------------------------------------------
+def parameters_string(hp):
+    """Hyperparameter string as it appears in the weights and output file names."""
+    optNTrees, optMaxDepth, optMinNodeSize, optLearnRate = hp.split("_")
+    return optNTrees+"_"+optMaxDepth+"_"+optMinNodeSize.replace(".","")+"_"+optLearnRate.replace(".","")
+
+def weights_file(channel, n, parameters_str):
+    return f"mva/weights/TMVAClassification_{channel}_5fold_BDT{n}_{parameters_str}_all.weights.xml"
+
+def output_file(sample, channel, option, parameters_str):
+    return f"/eos/user/m/minlin/monobc/MLoutputs/reader_output/hist_Run3_BDT_{sample}_{channel}_{option}_Val_{parameters_str}_all.root"
+
+def score_fold_batched(indir, sample, fold, treename, weights_path, bins=HIST_BINS):
+    """
+    Scores a whole fold view in one vectorized call and returns (weighted score histogram, number of events).
+    bins: (nbins, xmin, xmax) of the histogram, HIST_BINS by default.
+    """
+    from mva_batch import load_evaluator, ScoreHist
+    from fold_index import read_fold_arrays
+    evaluator = load_evaluator(weights_path)
+    X, weights = read_fold_arrays(indir, sample, fold, treename, evaluator.variables)
+    print(f"nentries: {len(X)}")
+    hist = ScoreHist(*bins)
+    hist.fill(evaluator.evaluate(X), weights)
+    return hist, len(X)
 
 #-------------------------------------------------
 def main(arguments):
@@ -25,6 +59,7 @@ def main(arguments):
     parser.add_argument('--hp', default='300_10_1_0.01')
     parser.add_argument('--set', default='Validation')
     parser.add_argument('--sample', default='')
+    parser.add_argument('--batch', action='store_true', help='Score whole folds with the vectorized, ROOT-free evaluator')
     args = parser.parse_args()
 
     indir = args.indir
@@ -35,42 +70,62 @@ def main(arguments):
     sample = args.sample # "Signal", "Fakes", "Fakes_MC", "Ztt", "Others"
 
     # Parse hyperparameters
-    parameters = hp.split("_")
-    optNTrees, optMaxDepth, optMinNodeSize, optLearnRate = parameters
-    parameters_str = optNTrees+"_"+optMaxDepth+"_"+optMinNodeSize.replace(".","")+"_"+optLearnRate.replace(".","")
+    parameters_str = parameters_string(hp)
 
     if iset=="Validation":
         treename = "validation"
     else:
         treename = "test"
 
+    outfile_name = output_file(sample, channel, option, parameters_str)
+
+    if args.batch:
+        from mva_batch import write_hists
+        hist = None
+        for n in range(1, 6):
+            rfilename = f"{indir}/{sample}_fold{n}.root"
+            print(f"rfile: {rfilename}")
+            fold_hist, _ = score_fold_batched(indir, sample, n, treename, weights_file(channel, n, parameters_str))
+            if hist is None:
+                hist = fold_hist
+            else:
+                hist.merge(fold_hist)
+        print(f"rfile_out: {outfile_name}")
+        write_hists(outfile_name, {f"h_score_{sample}": hist})
+        return
+
+    if ROOT is None:
+        print("FATAL: ROOT is not available; use --batch for the ROOT-free scoring path")
+        return 1
+
+    from fold_index import open_fold_tree
+
     # TMVA and reader
     TMVA.Tools.Instance()
     TMVA.PyMethodBase.PyInitialize()
 
-    input_vars = ["jet1_pt","jet1_eta","jet2_pt","jet2_eta","met_pt","met_sig","meff","mjj","pTjj","dRjj","dEtajj","mbb","pTbb","dRbb","dEtabb","dPhibb","R_met_jet","R_met_meff","sum_jet_pt","jet2_gn2pcbt"]
+    input_vars = INPUT_VARS
 
     input_vars_arrays = {i: array('f', [0]) for i in input_vars}
 
-    hists = TH1F(f"h_score_{sample}", "", 20, -1.0, 1.0)
+    hists = TH1F(f"h_score_{sample}", "", *HIST_BINS)
     hists.SetDirectory(0)
 
     for n in range(1, 6):
         rfilename = f"{indir}/{sample}_fold{n}.root"
         print(f"rfile: {rfilename}")
-        rfile = TFile(rfilename, "READ")
-        ttree = rfile.Get(treename)
-        nentries = ttree.GetEntries()
+        rfile, ttree, entries = open_fold_tree(indir, sample, n, treename)
+        nentries = len(entries)
         print(f"nentries: {nentries}")
 
         reader = TMVA.Reader()
         for i in input_vars:
             reader.AddVariable(i, input_vars_arrays[i])
 
-        reader.BookMVA(f"BDT{n}", f"mva/weights/TMVAClassification_{channel}_5fold_BDT{n}_{parameters_str}_all.weights.xml")
+        reader.BookMVA(f"BDT{n}", weights_file(channel, n, parameters_str))
 
-        for k in range(nentries):
-            ttree.GetEntry(k)
+        for k in entries:
+            ttree.GetEntry(int(k))
 
             for j in input_vars:
                 input_vars_arrays[j][0] = getattr(ttree, j)
@@ -83,7 +138,6 @@ def main(arguments):
         del reader
         rfile.Close()
 
-    outfile_name = f"/eos/user/m/minlin/monobc/MLoutputs/reader_output/hist_Run3_BDT_{sample}_{channel}_{option}_Val_{parameters_str}_all.root"
     print(f"rfile_out: {outfile_name}")
     rfile_out = TFile(outfile_name, "RECREATE")
     hists.Write()
@@ -6,12 +6,53 @@ import argparse
 import math
 from array import *
 import numpy as np
-import ROOT
-from ROOT import TMVA, TFile, TTree, TCut, TString, TH1F
+try:
+    import ROOT
+    from ROOT import TMVA, TFile, TTree, TCut, TString, TH1F
+except ImportError:
+    ROOT = None  # Only the --batch path can run without ROOT
 
-ROOT.gStyle.SetOptStat(0)
-ROOT.gROOT.SetBatch(True)
-ROOT.TH1.SetDefaultSumw2(True)
+if ROOT is not None:
+    ROOT.gStyle.SetOptStat(0)
+    ROOT.gROOT.SetBatch(True)
+    ROOT.TH1.SetDefaultSumw2(True)
+
+HIST_BINS = (20, 0.0, 1.0)
+
+INPUT_VARS = ["jet1_pt","jet1_eta","met_pt","met_sig","meff","mjj","dRjj","dEtajj","jet2_pt","R_met_jet","R_met_meff","sum_jet_pt"]
+
+#-------------------------------------------------
+def parameters_string(hp):
+    """Hyperparameter string as it appears in the weights and output file names."""
+    parameters = hp.split("_")
+    para_len = len(parameters)
+    if para_len == 6:
+        layer1, layer2, layer3, learnrate, nepochs, batchsize = parameters
+        return layer1 + "_" + layer2 + "_" + layer3 + "_" + learnrate.replace(".","") + "_" + nepochs+ "_" +batchsize
+    elif para_len == 7:
+        layer1, layer2, layer3, layer4, learnrate, nepochs, batchsize = parameters
+        return layer1 + "_" + layer2 + "_" + layer3 + "_" + layer4 + "_" + learnrate.replace(".","") + "_" + nepochs+ "_" +batchsize
+    raise ValueError(f"Expected 6 or 7 hyperparameters, got '{hp}'")
+
+def weights_file(channel, n, parameters_str, cl):
+    return f"mva/weights/TMVAClassification_Run3_DNN_{channel}_5fold_Keras{n}_{parameters_str}_{cl}.weights.xml"
+
+def output_file(sample, channel, option, parameters_str, cl):
+    return f"/eos/user/m/minlin/monobc/MLoutputs/reader_output/hist_Run3_DNN_{sample}_{channel}_{option}_Val_{parameters_str}_{cl}.root"
+
+def score_fold_batched(indir, sample, fold, treename, weights_path, engine="keras", bins=HIST_BINS):
+    """
+    Scores a whole fold view in one vectorized call and returns (weighted score histogram, number of events).
+    bins: (nbins, xmin, xmax) of the histogram, HIST_BINS by default.
+    """
+    from mva_batch import load_evaluator, ScoreHist
+    from fold_index import read_fold_arrays
+    evaluator = load_evaluator(weights_path, engine)
+    X, weights = read_fold_arrays(indir, sample, fold, treename, evaluator.variables)
+    print(f"nentries: {len(X)}")
+    hist = ScoreHist(*bins)
+    hist.fill(evaluator.evaluate(X), weights)
+    return hist, len(X)
 
 #-------------------------------------------------
 def main(arguments):
@@ -26,6 +67,8 @@ def main(arguments):
     parser.add_argument('--set', default='Validation')
     parser.add_argument('--sample', default='')
     parser.add_argument('--cl', default='')
+    parser.add_argument('--batch', action='store_true', help='Score whole folds with the vectorized, ROOT-free evaluator')
+    parser.add_argument('--engine', choices=["keras", "numpy"], default="keras", help="With --batch: 'numpy' runs the model without TensorFlow")
     args = parser.parse_args()
 
     indir = args.indir
@@ -37,46 +80,61 @@ def main(arguments):
     cl = args.cl
 
     # Parse hyperparameters
-    parameters = hp.split("_")
-    para_len = len(parameters)
-    if para_len == 6:
-        layer1, layer2, layer3, learnrate, nepochs, batchsize = parameters
-        parameters_str = layer1 + "_" + layer2 + "_" + layer3 + "_" + learnrate.replace(".","") + "_" + nepochs+ "_" +batchsize
-    elif para_len == 7:
-        layer1, layer2, layer3, layer4, learnrate, nepochs, batchsize = parameters
-        parameters_str = layer1 + "_" + layer2 + "_" + layer3 + "_" + layer4 + "_" + learnrate.replace(".","") + "_" + nepochs+ "_" +batchsize
+    parameters_str = parameters_string(hp)
 
     if iset=="Validation":
         treename = "validation"
     else:
         treename = "test"
 
+    outfile_name = output_file(sample, channel, option, parameters_str, cl)
+
+    if args.batch:
+        from mva_batch import write_hists
+        hist = None
+        for n in range(1, 6):
+            rfilename = f"{indir}/{sample}_fold{n}.root"
+            print(f"rfile: {rfilename}")
+            fold_hist, _ = score_fold_batched(indir, sample, n, treename, weights_file(channel, n, parameters_str, cl), args.engine)
+            if hist is None:
+                hist = fold_hist
+            else:
+                hist.merge(fold_hist)
+        print(f"rfile_out: {outfile_name}")
+        write_hists(outfile_name, {f"h_score_{sample}": hist})
+        return
+
+    if ROOT is None:
+        print("FATAL: ROOT is not available; use --batch for the ROOT-free scoring path")
+        return 1
+
+    from fold_index import open_fold_tree
+
     # TMVA and reader
     TMVA.Tools.Instance()
     TMVA.PyMethodBase.PyInitialize()
 
-    input_vars = ["jet1_pt","jet1_eta","met_pt","met_sig","meff","mjj","dRjj","dEtajj","jet2_pt","R_met_jet","R_met_meff","sum_jet_pt"]
+    input_vars = INPUT_VARS
     input_vars_arrays = {i: array('f', [0]) for i in input_vars}
 
-    hists = TH1F(f"h_score_{sample}", "", 20, 0.0, 1.0)
+    hists = TH1F(f"h_score_{sample}", "", *HIST_BINS)
     hists.SetDirectory(0)
 
     for n in range(1, 6):
         rfilename = f"{indir}/{sample}_fold{n}.root"
         print(f"rfile: {rfilename}")
-        rfile = TFile(rfilename, "READ")
-        ttree = rfile.Get(treename)
-        nentries = ttree.GetEntries()
+        rfile, ttree, entries = open_fold_tree(indir, sample, n, treename)
+        nentries = len(entries)
         print(f"nentries: {nentries}")
 
         reader = TMVA.Reader()
         for i in input_vars:
             reader.AddVariable(i, input_vars_arrays[i])
 
-        reader.BookMVA(f"DNN{n}", f"mva/weights/TMVAClassification_Run3_DNN_{channel}_5fold_Keras{n}_{parameters_str}_{cl}.weights.xml")
+        reader.BookMVA(f"DNN{n}", weights_file(channel, n, parameters_str, cl))
 
-        for k in range(nentries):
-            ttree.GetEntry(k)
+        for k in entries:
+            ttree.GetEntry(int(k))
 
             for j in input_vars:
                 input_vars_arrays[j][0] = getattr(ttree, j)
@@ -89,7 +147,6 @@ def main(arguments):
         del reader
         rfile.Close()
 
-    outfile_name = f"/eos/user/m/minlin/monobc/MLoutputs/reader_output/hist_Run3_DNN_{sample}_{channel}_{option}_Val_{parameters_str}_{cl}.root"
     print(f"rfile_out: {outfile_name}")
     rfile_out = TFile(outfile_name, "RECREATE")
     hists.Write()
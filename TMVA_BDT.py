@@ -5,26 +5,11 @@ import argparse
 import ROOT
 from ROOT import *
 from array import *
+from tmva_inputs import add_fold_trees, add_fold_arrays, has_fold_index, load_fold_data, parse_folds, run_folds
 
-def main(arguments):
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--indir', default='/eos/user/m/minlin/monobc/MLinputs/')
-    parser.add_argument('--channel', default='sT_bC1')
-    parser.add_argument('--option', default='5fold')
-    parser.add_argument('--BDT', default='1')
-    parser.add_argument('--hp', default='300_10_1_0.01')
-    parser.add_argument('--sample', default='all')
-
-    args = parser.parse_args()
-
-    indir = args.indir
-    channel = args.channel
-    option = args.option
-    ibdt = args.BDT
-    hp = args.hp
-    sam = args.sample
-    out_dir = "/eos/user/m/minlin/monobc/MLoutputs/"
-
+def train_bdt(indir, out_dir, channel, option, hp, sam, samples, input_vars, fold_data, ibdt):
+    """Trains the BDT of fold ibdt, reading its fold files, or selecting its events from fold_data (load_fold_data) if given."""
+    ibdt = str(ibdt)
     parameters = hp.split("_")
     optNTrees, optMaxDepth, optMinNodeSize, optLearnRate = parameters
     parameters_str = optNTrees+"_"+optMaxDepth+"_"+optMinNodeSize.replace(".","")+"_"+optLearnRate.replace(".","")
@@ -41,65 +26,17 @@ def main(arguments):
 
     loader = TMVA.DataLoader("mva")
 
-    # Define input variables
-    input_vars = ["jet1_pt","jet1_eta","jet2_pt","jet2_eta","met_pt","met_sig","meff","mjj","pTjj","dRjj","dEtajj","mbb","pTbb","dRbb","dEtabb","dPhibb","R_met_jet","R_met_meff","sum_jet_pt","jet2_gn2pcbt"]
-
     for var in input_vars:
         loader.AddVariable(var)
     print("Input variables:", len(input_vars), input_vars)
 
-    # Add samples
-    if sam == "all":
-        samples = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "ttbar", "singletop", "znunu", "diboson", "dijet", "wlnu", "zll"]
-    elif sam == "znunu":
-        samples = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "znunu"]
-    elif sam == "ttbar":
-        samples = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "ttbar"]
-    elif sam == "others":
-        samples = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "singletop", "diboson", "dijet", "wlnu", "zll"]
-
-    s_train_weights = 0.
-    b_train_weights = 0.
-    s_test_weights = 0.
-    b_test_weights = 0.
-    for sample in samples:
-        print("")
-        print("Sample:",sample)
-        rfilename = indir+"/"+sample+"_fold"+ibdt+".root"
-        rfile = TFile(rfilename,"READ")
-        TrainTree = rfile.Get("training")
-        trainEntries = TrainTree.GetEntries()
-        print("training nentries",trainEntries)
-        for i in range(trainEntries):
-            TrainTree.GetEntry(i)
-            tvars = ROOT.std.vector('double')()
-            for j in input_vars:
-                tvars.push_back( getattr(TrainTree,j) )
-            if "sT" in sample:
-                loader.AddSignalTrainingEvent(tvars,abs(TrainTree.weight))
-                s_train_weights+=abs(TrainTree.weight)
-            else:
-                loader.AddBackgroundTrainingEvent(tvars,abs(TrainTree.weight))
-                b_train_weights+=abs(TrainTree.weight)
-        ValTree = rfile.Get("validation")
-        ValNentries = ValTree.GetEntries()
-        print("validation nentries",ValNentries)
-        for i in range(ValNentries):
-            ValTree.GetEntry(i)
-            tvars = ROOT.std.vector('double')()
-            for j in input_vars:
-                tvars.push_back( getattr(ValTree,j) )
-            if "sT" in sample:
-                loader.AddSignalTestEvent(tvars,abs(ValTree.weight))
-                s_test_weights+=abs(ValTree.weight)
-            else:
-                loader.AddBackgroundTestEvent(tvars,abs(ValTree.weight))
-                b_test_weights+=abs(ValTree.weight)
-        rfile.Close()
-    print("s_test_weights", s_test_weights)
-    print("s_train_weights", s_train_weights)
-    print("b_test_weights", b_test_weights)
-    print("b_train_weights", b_train_weights)
+    # Training trees -> training events, validation trees -> test events, weighted by abs(weight)
+    if fold_data is None:
+        open_files, weight_sums = add_fold_trees(loader, indir, samples, ibdt)
+    else:
+        open_files, weight_sums = [], add_fold_arrays(loader, fold_data, samples, int(ibdt))
+    for name, value in weight_sums.items():
+        print(name, value)
 
 
     loader.PrepareTrainingAndTestTree(TCut(""), "SplitMode=Random:NormMode=EqualNumEvents:!V")
@@ -112,8 +49,59 @@ def main(arguments):
     factory.EvaluateAllMethods()
 
     fout.Close()
+    for rfile in open_files:
+        rfile.Close()
     
     print("finished")
 
+def main(arguments):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--indir', default='/eos/user/m/minlin/monobc/MLinputs/')
+    parser.add_argument('--channel', default='sT_bC1')
+    parser.add_argument('--option', default='5fold')
+    parser.add_argument('--BDT', default='1')
+    parser.add_argument('--hp', default='300_10_1_0.01')
+    parser.add_argument('--sample', default='all')
+    parser.add_argument('--folds', default=None, help="'all' or e.g. '1,3': read the inputs once and train these folds in one run (replaces --BDT)")
+    parser.add_argument('--jobs', type=int, default=None, help='Folds trained in parallel with --folds (default: one per fold, up to the number of cores)')
+
+    args = parser.parse_args()
+
+    indir = args.indir
+    channel = args.channel
+    option = args.option
+    ibdt = args.BDT
+    hp = args.hp
+    sam = args.sample
+    out_dir = "/eos/user/m/minlin/monobc/MLoutputs/"
+
+    # Define input variables
+    input_vars = ["jet1_pt","jet1_eta","jet2_pt","jet2_eta","met_pt","met_sig","meff","mjj","pTjj","dRjj","dEtajj","mbb","pTbb","dRbb","dEtabb","dPhibb","R_met_jet","R_met_meff","sum_jet_pt","jet2_gn2pcbt"]
+
+    # Add samples
+    if sam == "all":
+        samples = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "ttbar", "singletop", "znunu", "diboson", "dijet", "wlnu", "zll"]
+    elif sam == "znunu":
+        samples = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "znunu"]
+    elif sam == "ttbar":
+        samples = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "ttbar"]
+    elif sam == "others":
+        samples = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "singletop", "diboson", "dijet", "wlnu", "zll"]
+
+    common = (indir, out_dir, channel, option, hp, sam, samples, input_vars)
+    if args.folds is None:
+        # Fold-index sidecars have no per-fold trees: the fold's events are selected from sel_tree in memory
+        fold_data = load_fold_data(indir, samples, input_vars) if has_fold_index(indir, samples) else None
+        train_bdt(*common, fold_data, ibdt)
+        return
+
+    # Every sample is read once; the folds select their training/test events in memory
+    folds = parse_folds(args.folds)
+    fold_data = load_fold_data(indir, samples, input_vars)
+    failed = run_folds(train_bdt, common, fold_data, folds, args.jobs or min(len(folds), os.cpu_count() or 1))
+    if failed:
+        print(f"ERROR: folds {failed} failed")
+        return 1
+
 if __name__ == '__main__':
     sys.exit(main(sys.argv[1:]))
\ No newline at end of file
@@ -5,6 +5,7 @@ import argparse
 import ROOT
 from ROOT import *
 from array import *
+from tmva_inputs import add_fold_trees, add_fold_arrays, has_fold_index, load_fold_data, parse_folds, run_folds
 import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras.models import Sequential
@@ -12,28 +13,18 @@ from tensorflow.keras import layers
 from tensorflow.keras.layers import Dense, LeakyReLU, BatchNormalization
 from tensorflow.keras.regularizers import l2
 
-def main(arguments):
-    # Parse arguments
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--channel', default='sT_bC1')
-    parser.add_argument('--option', default='5fold')
-    parser.add_argument('--hp', default='416_160_416_480_0.0001_100_128')
-    parser.add_argument('--acti', default='leakyrelu')
-    parser.add_argument('--opt', default='Adam')
-    parser.add_argument('--NN', default='1')
-    parser.add_argument('--sample', default='all')
-    args = parser.parse_args()
+def weights_xml(channel, option, hp, sam, iNN):
+    """TMVA weights file that train_dnn writes for fold iNN once its training has finished."""
+    from Reader_DNN import parameters_string
+    outputstr = "Run3_DNN_" + channel + "_" + option + "_Keras" + str(iNN) + "_" + parameters_string(hp) + "_" + sam
+    return f"mva/weights/TMVAClassification_{outputstr}.weights.xml"
 
-    channel = args.channel
-    option = args.option
-    hp = args.hp
-    acti = args.acti
-    optim = args.opt
-    sam = args.sample
-    iNN = args.NN
-
-    indir = "/eos/user/m/minlin/monobc/MLinputs/"
-    out_dir = "/eos/user/m/minlin/monobc/MLoutputs/"
+def train_dnn(indir, out_dir, channel, option, hp, acti, optim, sam, samples, input_vars, resume, fold_data, iNN):
+    """
+    Trains the Keras DNN of fold iNN, reading its fold files, or selecting its events from fold_data (load_fold_data) if given.
+    With resume, training continues from the checkpoint an interrupted run of this fold left next to its model.
+    """
+    iNN = str(iNN)
 
     # Parse hyperparameters
     parameters = hp.split("_")
@@ -59,59 +50,17 @@ def main(arguments):
     
     loader = TMVA.DataLoader("mva")
 
-    # Define input variables
-    input_vars = ["jet1_pt","jet1_eta","met_pt","met_sig","meff","mjj","dRjj","dEtajj","jet2_pt","R_met_jet","R_met_meff","sum_jet_pt"]
     for var in input_vars:
         loader.AddVariable(var)
     print("Input variables:", len(input_vars), input_vars)
 
-    # Add samples
-    if sam == "all":
-        samples = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "ttbar", "singletop", "znunu", "diboson", "dijet", "wlnu", "zll"]
-    elif sam == "znunu":
-        samples = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "znunu"]
-    elif sam == "top":
-        samples = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "ttbar", "singletop"]
-    elif sam == "others":
-        samples = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "diboson", "dijet", "wlnu", "zll"]
-
-    for sample in samples:
-        print("")
-        print("Sample:", sample)
-        rfilename = indir+"/"+sample+"_fold"+iNN+".root"
-        print("reading", rfilename)
-        rfile = TFile(rfilename, "READ")
-        if "sT" in sample:
-            SigTrainTree = rfile.Get("training")
-            SigValTree = rfile.Get("validation")
-            for i in range(SigValTree.GetEntries()):
-                SigValTree.GetEntry(i)
-                tvars = ROOT.std.vector('double')()
-                for j in input_vars:
-                    tvars.push_back(getattr(SigValTree, j))
-                loader.AddSignalTestEvent(tvars, abs(SigValTree.weight))
-            for i in range(SigTrainTree.GetEntries()):
-                SigTrainTree.GetEntry(i)
-                tvars = ROOT.std.vector('double')()
-                for j in input_vars:
-                    tvars.push_back(getattr(SigTrainTree, j))
-                loader.AddSignalTrainingEvent(tvars, abs(SigTrainTree.weight))
-        else:
-            BKGTrainTree = rfile.Get("training")
-            BKGValTree = rfile.Get("validation")
-            for i in range(BKGValTree.GetEntries()):
-                BKGValTree.GetEntry(i)
-                tvars = ROOT.std.vector('double')()
-                for j in input_vars:
-                    tvars.push_back(getattr(BKGValTree, j))
-                loader.AddBackgroundTestEvent(tvars, abs(BKGValTree.weight))
-            for i in range(BKGTrainTree.GetEntries()):
-                BKGTrainTree.GetEntry(i)
-                tvars = ROOT.std.vector('double')()
-                for j in input_vars:
-                    tvars.push_back(getattr(BKGTrainTree, j))
-                loader.AddBackgroundTrainingEvent(tvars, abs(BKGTrainTree.weight))
-        rfile.Close()
+    # Training trees -> training events, validation trees -> test events, weighted by abs(weight)
+    if fold_data is None:
+        open_files, weight_sums = add_fold_trees(loader, indir, samples, iNN)
+    else:
+        open_files, weight_sums = [], add_fold_arrays(loader, fold_data, samples, int(iNN))
+    for name, value in weight_sums.items():
+        print(name, value)
 
     loader.PrepareTrainingAndTestTree(TCut(""), "SplitMode=Random:NormMode=EqualNumEvents:!V")
     
@@ -176,9 +125,15 @@ def main(arguments):
 
     model.summary()
     modelOutFile = f"{out_dir}model/model_{outputstr}.h5"
+    trainedOutFile = f"{out_dir}model/model_{outputstr}_trained.h5"
     model.save(modelOutFile)
 
-    options = "!H:!V:FilenameModel=" + modelOutFile + ":NumEpochs=" + nepochs + ":BatchSize=" + batchsize + ":Verbose=2" + ":TriesEarlyStopping=5"
+    # PyKeras checkpoints the best epoch so far to FilenameTrainedModel; ContinueTraining starts from that checkpoint
+    # (for up to NumEpochs more epochs, early stopping still applies) instead of from the untrained model
+    options = "!H:!V:FilenameModel=" + modelOutFile + ":FilenameTrainedModel=" + trainedOutFile + ":NumEpochs=" + nepochs + ":BatchSize=" + batchsize + ":Verbose=2" + ":TriesEarlyStopping=5"
+    if resume and os.path.exists(trainedOutFile):
+        print(f"Resuming fold {iNN} from {trainedOutFile}")
+        options += ":ContinueTraining=True"
     factory.BookMethod(loader, TMVA.Types.kPyKeras, outputstr, options)
 
     factory.TrainAllMethods()
@@ -186,8 +141,79 @@ def main(arguments):
     factory.EvaluateAllMethods()
 
     fout.Close()
+    for rfile in open_files:
+        rfile.Close()
     
     print("finished")
 
+def main(arguments):
+    # Parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--channel', default='sT_bC1')
+    parser.add_argument('--option', default='5fold')
+    parser.add_argument('--hp', default='416_160_416_480_0.0001_100_128')
+    parser.add_argument('--acti', default='leakyrelu')
+    parser.add_argument('--opt', default='Adam')
+    parser.add_argument('--NN', default='1')
+    parser.add_argument('--sample', default='all')
+    parser.add_argument('--folds', default=None, help="'all' or e.g. '1,3': read the inputs once and train these folds in one run (replaces --NN)")
+    parser.add_argument('--jobs', type=int, default=None, help='Folds trained in parallel with --folds (default: one per fold, up to the number of cores)')
+    parser.add_argument('--resume', action='store_true', help='Skip the folds whose TMVA weights were written by an earlier run and continue interrupted ones from their last checkpoint')
+    args = parser.parse_args()
+
+    channel = args.channel
+    option = args.option
+    hp = args.hp
+    acti = args.acti
+    optim = args.opt
+    sam = args.sample
+    iNN = args.NN
+
+    indir = "/eos/user/m/minlin/monobc/MLinputs/"
+    out_dir = "/eos/user/m/minlin/monobc/MLoutputs/"
+
+    # Define input variables
+    input_vars = ["jet1_pt","jet1_eta","met_pt","met_sig","meff","mjj","dRjj","dEtajj","jet2_pt","R_met_jet","R_met_meff","sum_jet_pt"]
+
+    # Add samples
+    if sam == "all":
+        samples = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "ttbar", "singletop", "znunu", "diboson", "dijet", "wlnu", "zll"]
+    elif sam == "znunu":
+        samples = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "znunu"]
+    elif sam == "top":
+        samples = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "ttbar", "singletop"]
+    elif sam == "others":
+        samples = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "diboson", "dijet", "wlnu", "zll"]
+
+    common = (indir, out_dir, channel, option, hp, acti, optim, sam, samples, input_vars, args.resume)
+    folds = [iNN] if args.folds is None else parse_folds(args.folds)
+    if args.resume:
+        # Finished folds are not loaded or trained again; interrupted ones continue from their checkpoint (train_dnn)
+        done = [fold for fold in folds if os.path.exists(weights_xml(channel, option, hp, sam, fold))]
+        if done:
+            print(f"Resuming: folds {done} are already trained, skipping them")
+        folds = [fold for fold in folds if fold not in done]
+        if not folds:
+            print("All folds are already trained")
+            return
+
+    if args.folds is None:
+        # Fold-index sidecars have no per-fold trees: the fold's events are selected from sel_tree in memory
+        fold_data = load_fold_data(indir, samples, input_vars) if has_fold_index(indir, samples) else None
+        train_dnn(*common, fold_data, iNN)
+        return
+
+    # Every sample is read once; the folds select their training/test events in memory
+    jobs = args.jobs or min(len(folds), os.cpu_count() or 1)
+    fold_data = load_fold_data(indir, samples, input_vars)
+    # Every spawned fold starts its own TF runtime from the inherited environment; split the cores between them
+    threads = str(max(1, (os.cpu_count() or 1) // jobs))
+    for var in ("OMP_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"):
+        os.environ[var] = threads
+    failed = run_folds(train_dnn, common, fold_data, folds, jobs)
+    if failed:
+        print(f"ERROR: folds {failed} failed")
+        return 1
+
 if __name__ == '__main__':
     sys.exit(main(sys.argv[1:]))
\ No newline at end of file
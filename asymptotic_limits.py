@@ -0,0 +1,371 @@
+"""
+Asymptotic CLs upper limits on the signal strength (the Job POI, SigXsecOverSM) of binned TRexFitter setups
+without systematics, without TRexFitter / RooFit. Every bin is an independent Poisson count with expectation
+gamma * (mu * s + b), where gamma is the MC-stat parameter TRexFitter adds per bin by default: constrained by a
+Poisson term with tau = 1 / delta^2 (delta: relative MC-stat uncertainty of the bin, from the sample sumw2) and
+profiled analytically (Barlow-Beeston lite). StatOnly: TRUE or MCstatThreshold: NONE drop the gammas, a
+threshold drops those of bins with delta below it. The test statistic is q~_mu (mu_hat bounded at 0) with the
+asymptotic formulae of Cowan, Cranmer, Gross, Vitells (arXiv:1007.1727), as used by LimitType: ASYMPTOTIC:
+
+    expected (band N)   sqrt(q_mu,A) = Phi^-1(1 - alpha * Phi(N)) + N     (q_mu,A on the background-only Asimov data)
+    observed            CLs(mu) = p_mu / (1 - p_b) = alpha
+
+All functions take the signal and background yields as (hypotheses, bins) arrays and solve every hypothesis
+at once by bisection in log(mu), so a grid of signal points x magnifications costs a few array operations.
+Configs are read with trex_config.py (ReadFrom: NTUP or HIST, see trex_config.hist_mode); fixed NormFactors
+scale their samples (and their sumw2 by the square), anything beyond that (systematics, weights, selections,
+Gaussian MC-stat constraints) is rejected. Limits are clipped to the Min / Max of the POI NormFactor and flagged.
+
+    python asymptotic_limits.py config_*_ctagged.txt --scale 1 0.1 0.01 --compare
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import numpy as np
+from scipy.special import ndtr, ndtri, xlogy
+import trex_config
+
+CL = 0.95
+BANDS = (-2, -1, 0, 1, 2)
+BISECT_STEPS = 60
+UNSUPPORTED = ("MCweight", "Selection", "Binning", "UseMCstat")
+# Branches of the "stats" tree TRexFitter writes to <Job>/Limits/
+TREX_BRANCHES = {"exp_upperlimit_minus2": -2, "exp_upperlimit_minus1": -1, "exp_upperlimit": 0,
+                 "exp_upperlimit_plus1": 1, "exp_upperlimit_plus2": 2, "obs_upperlimit": "obs"}
+
+# --- Likelihood ---
+
+def _no_gammas(s):
+    """tau of a model without MC-stat parameters (every gamma fixed at 1)."""
+    return np.full(np.shape(s), np.inf)
+
+def profile_gamma(nu, n, tau):
+    """Conditional ML gamma of every bin: the root of d/dgamma [Poisson(n | gamma nu) Poisson(tau | gamma tau)]."""
+    with np.errstate(invalid="ignore"):
+        return np.where(np.isinf(tau), 1.0, (n + tau) / (nu + tau))
+
+def nll(mu, s, b, n, tau):
+    """-2 ln L(mu, gamma_hat(mu)) up to a constant, the gammas profiled (tau = inf: no gamma in that bin)."""
+    nu = mu[:, None] * s + b
+    gamma = profile_gamma(nu, n, tau)
+    lam = gamma * nu
+    with np.errstate(invalid="ignore"):
+        constraint = np.where(np.isinf(tau), 0.0, tau * (gamma - 1 - np.log(gamma)))
+    return 2 * np.sum(lam - xlogy(n, lam) + constraint, axis=1)
+
+def q_mu(mu, s, b, n, mu_hat, tau=None):
+    """-2 ln L(mu) / L(mu_hat) for every hypothesis (mu, mu_hat: (H,), s / b / n / tau: (H, bins) or broadcastable)."""
+    tau = _no_gammas(s) if tau is None else tau
+    return nll(mu, s, b, n, tau) - nll(mu_hat, s, b, n, tau)
+
+def _bisect(too_high, lo, hi):
+    """Geometric bisection of the monotone condition too_high(mu) -> bool array between lo and hi."""
+    for _ in range(BISECT_STEPS):
+        mid = np.sqrt(lo * hi)
+        high = too_high(mid)
+        hi = np.where(high, mid, hi)
+        lo = np.where(high, lo, mid)
+    return np.sqrt(lo * hi)
+
+def _bracket(too_high, s, b):
+    """(lo, hi) around the root, starting from the Gaussian scale 1 / sqrt(sum s^2 / b)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = 1.0 / np.sqrt(np.sum(np.where(b > 0, s * s / np.where(b > 0, b, 1.0), s), axis=1))
+    lo, hi = scale * 1e-3, scale * 1e3
+    for _ in range(20):
+        low_ok, high_ok = ~too_high(lo), too_high(hi)
+        if low_ok.all() and high_ok.all():
+            break
+        lo = np.where(low_ok, lo, lo * 1e-3)
+        hi = np.where(high_ok, hi, hi * 1e3)
+    return lo, hi
+
+def fit_mu_hat(s, b, n, tau=None):
+    """Maximum-likelihood mu >= 0 of every hypothesis (0 when the data have no excess), the gammas profiled."""
+    tau = _no_gammas(s) if tau is None else tau
+    s, b, n, tau = np.broadcast_arrays(s, b, n, tau)
+
+    def score(mu):
+        # d/dmu of the profiled likelihood: the gamma derivative vanishes at gamma_hat
+        nu = mu[:, None] * s + b
+        gamma = profile_gamma(nu, n, tau)
+        lam = gamma * nu
+        return np.sum(gamma * s * (np.divide(n, lam, out=np.zeros_like(lam), where=lam > 0) - 1), axis=1)
+
+    excess = score(np.zeros(len(s))) > 0
+    if not excess.any():
+        return np.zeros(len(s))
+    lo, hi = _bracket(lambda mu: score(mu) < 0, s, b)
+    return np.where(excess, _bisect(lambda mu: score(mu) < 0, lo, hi), 0.0)
+
+# --- Limits ---
+
+def expected_limits(s, b, cl=CL, bands=BANDS, tau=None):
+    """
+    (H, len(bands)) median (band 0) and +-N sigma expected upper limits on mu from the Asimov data n = b
+    (tau: (H, bins) MC-stat constraints, None for no gammas).
+    """
+    tau = _no_gammas(np.atleast_2d(s)) if tau is None else tau
+    s, b, tau = np.broadcast_arrays(*(np.atleast_2d(a).astype(np.float64) for a in (s, b, tau)))
+    zeros = np.zeros(len(s))
+    alpha = 1 - cl
+    out = np.empty((len(s), len(bands)))
+    for i, band in enumerate(bands):
+        target = ndtri(1 - alpha * ndtr(band)) + band
+        too_high = lambda mu: np.sqrt(np.maximum(q_mu(mu, s, b, b, zeros, tau), 0)) > target
+        out[:, i] = _bisect(too_high, *_bracket(too_high, s, b))
+    return out
+
+def cls(mu, s, b, n, mu_hat, tau=None):
+    """CLs of every hypothesis at mu, with q~_mu on the data n and q_mu,A on the background-only Asimov data."""
+    zeros = np.zeros(len(mu))
+    q_obs = np.where(mu_hat > mu, 0.0, np.maximum(q_mu(mu, s, b, n, mu_hat, tau), 0))
+    q_asimov = np.maximum(q_mu(mu, s, b, b, zeros, tau), 1e-300)
+    sqrt_obs, sqrt_asimov = np.sqrt(q_obs), np.sqrt(q_asimov)
+    below = q_obs <= q_asimov
+    p_mu = np.where(below, 1 - ndtr(sqrt_obs), 1 - ndtr((q_obs + q_asimov) / (2 * sqrt_asimov)))
+    one_minus_p_b = np.where(below, ndtr(sqrt_asimov - sqrt_obs), ndtr((q_asimov - q_obs) / (2 * sqrt_asimov)))
+    return p_mu / np.maximum(one_minus_p_b, 1e-300)
+
+def observed_limits(s, b, n, cl=CL, tau=None):
+    """(H,) observed upper limits on mu; for n = b they equal the median expected limits."""
+    tau = _no_gammas(np.atleast_2d(s)) if tau is None else tau
+    s, b, n, tau = np.broadcast_arrays(*(np.atleast_2d(a).astype(np.float64) for a in (s, b, n, tau)))
+    mu_hat = fit_mu_hat(s, b, n, tau)
+    too_high = lambda mu: cls(mu, s, b, n, mu_hat, tau) < 1 - cl
+    return _bisect(too_high, *_bracket(too_high, s, b))
+
+# --- TRexFitter configs ---
+
+def _hist_counts(path, name):
+    """(sumw, sumw2) of the bins of histogram name in path."""
+    import uproot
+    with uproot.open(path) as f:
+        hist = f[name]
+        return hist.values(flow=False).astype(np.float64), hist.variances(flow=False).astype(np.float64)
+
+def _ntuple_counts(path, tree, branch, nbins, xmin, xmax):
+    """(sumw, sumw2) of branch in tree, unweighted (MCweight is not supported)."""
+    import uproot
+    from mva_batch import ScoreHist
+    with uproot.open(path) as f:
+        x = f[tree][branch].array(library="np")
+    hist = ScoreHist(nbins, xmin, xmax)
+    hist.fill(x, np.ones(len(x)))
+    return hist.sumw[1:-1], hist.sumw2[1:-1]
+
+def _sample_counts(job_options, region, sample, hist_mode):
+    """(sumw, sumw2) of the bins of sample in region, summed over all its paths x files x names."""
+    prefix = "Histo" if hist_mode else "Ntuple"
+    options = sample["options"]
+
+    def values(*keys):
+        for source in (options, job_options):
+            for key in keys:
+                if key in source:
+                    return trex_config.split_values(source[key])
+        return None
+
+    paths = values(f"{prefix}Paths", f"{prefix}Path") or ["./"]
+    files = values(f"{prefix}Files", f"{prefix}File") or []
+    names = values(f"{prefix}Names", f"{prefix}Name") or []
+    name_suffix = trex_config.unquote(region["options"].get(f"{prefix}NameSuff", ""))
+    if not hist_mode:
+        branch, nbins, xmin, xmax = trex_config.split_values(region["options"]["Variable"])[:4]
+    total = None
+    for path in paths:
+        for file_name in files:
+            full = os.path.join(path, file_name if file_name.endswith(".root") else file_name + ".root")
+            for name in names:
+                if hist_mode:
+                    counts = _hist_counts(full, name + name_suffix)
+                else:
+                    counts = _ntuple_counts(full, name + name_suffix, branch, int(nbins), float(xmin), float(xmax))
+                total = counts if total is None else (total[0] + counts[0], total[1] + counts[1])
+    if total is None:
+        raise ValueError(f"sample '{sample['name']}' has no input files or names")
+    return total
+
+def mc_stat_tau(sumw, sumw2, threshold=0.0):
+    """
+    Poisson constraint tau = 1 / delta^2 of every bin, delta = sqrt(sumw2) / sumw of all MC samples; inf (no gamma)
+    for bins without MC or with delta below threshold (threshold None: no gammas at all, MCstatThreshold: NONE).
+    """
+    tau = np.full(len(sumw), np.inf)
+    if threshold is None:
+        return tau
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta = np.sqrt(sumw2) / sumw
+    use = (sumw > 0) & (sumw2 > 0) & (delta >= threshold)
+    tau[use] = 1.0 / delta[use] ** 2
+    return tau
+
+def _poi_range(blocks, poi):
+    """(Min, Max) of the POI NormFactor (0, inf if it has none)."""
+    for block in blocks:
+        if block["type"] == "NormFactor" and block["name"] == poi:
+            return float(block["options"].get("Min", 0)), float(block["options"].get("Max", np.inf))
+    return 0.0, np.inf
+
+def _mc_stat_threshold(path, job_options):
+    """MCstatThreshold of the Job (0: every bin gets a gamma, TRexFitter's default; None: no gammas)."""
+    if trex_config.unquote(job_options.get("StatOnly", "FALSE")).upper() == "TRUE":
+        return None
+    constraint = trex_config.unquote(job_options.get("MCstatConstraint", "POISSON")).upper()
+    if constraint != "POISSON":
+        raise ValueError(f"{path}: MCstatConstraint: {constraint} is not supported (only Poisson)")
+    threshold = trex_config.unquote(job_options.get("MCstatThreshold", "0"))
+    return None if threshold.upper() == "NONE" else float(threshold)
+
+def config_yields(path):
+    """
+    {'job', 'job_dir', 'poi', 'poi_range', 's', 'b', 'n', 'tau'} of a config without systematics, the bins of all
+    regions concatenated. s is the signal at POI = 1 (with the fixed NormFactors applied), n the data (None for
+    DataType: ASIMOV), tau the MC-stat constraint of every bin (see mc_stat_tau).
+    """
+    blocks = trex_config.read_config(path)
+    job = trex_config.job(blocks)
+    job_options = job["options"]
+    hist_mode = trex_config.unquote(job_options.get("ReadFrom", "NTUP")).upper().startswith("HIST")
+    poi = trex_config.unquote(job_options.get("POI", "SigXsecOverSM"))
+    threshold = _mc_stat_threshold(path, job_options)
+    if any(block["type"] == "Systematic" for block in blocks):
+        raise ValueError(f"{path}: systematics are not supported (MC-stat-only model)")
+    for block in blocks:
+        bad = [key for key in UNSUPPORTED if key in block["options"]]
+        if bad:
+            raise ValueError(f"{path}: {block['type']} '{block['name']}' uses unsupported options {bad}")
+
+    # --- Fixed normalisations of every sample ---
+    factors = {}
+    for block in blocks:
+        if block["type"] != "NormFactor" or block["name"] == poi:
+            continue
+        options = block["options"]
+        nominal = float(options.get("Nominal", 1))
+        fixed = float(options.get("Min", nominal)) == float(options.get("Max", nominal)) or "Constant" in options
+        if not fixed:
+            print(f"WARNING: {path}: NormFactor '{block['name']}' floats in TRexFitter, kept at its nominal value {nominal}")
+        for sample in trex_config.split_values(options.get("Samples", "")):
+            factors[sample] = factors.get(sample, 1.0) * nominal
+
+    regions = [block for block in blocks if block["type"] == "Region"]
+    samples = [block for block in blocks if block["type"] == "Sample"]
+    s, b, n, tau = [], [], [], []
+    asimov = False
+    for region in regions:
+        asimov |= trex_config.unquote(region["options"].get("DataType", "DATA")).upper() == "ASIMOV"
+        parts = {"SIGNAL": None, "BACKGROUND": None, "DATA": None}
+        mc_sumw2 = None
+        for sample in samples:
+            kind = trex_config.unquote(sample["options"].get("Type", "BACKGROUND")).upper()
+            in_regions = trex_config.split_values(sample["options"].get("Regions", "all"))
+            if kind not in parts or not ({"all", region["name"]} & set(in_regions)):
+                continue
+            sumw, sumw2 = _sample_counts(job_options, region, sample, hist_mode)
+            factor = factors.get(sample["name"], 1.0)
+            counts = sumw * factor
+            parts[kind] = counts if parts[kind] is None else parts[kind] + counts
+            if kind != "DATA":
+                mc_sumw2 = sumw2 * factor ** 2 if mc_sumw2 is None else mc_sumw2 + sumw2 * factor ** 2
+        if parts["SIGNAL"] is None or parts["BACKGROUND"] is None:
+            raise ValueError(f"{path}: region '{region['name']}' needs a signal and a background sample")
+        s.append(parts["SIGNAL"])
+        b.append(parts["BACKGROUND"])
+        n.append(parts["DATA"])
+        tau.append(mc_stat_tau(parts["SIGNAL"] + parts["BACKGROUND"], mc_sumw2, threshold))
+    data = None if asimov or any(part is None for part in n) else np.concatenate(n)
+    return {"job": job["name"], "job_dir": trex_config.job_dir(blocks), "poi": poi, "poi_range": _poi_range(blocks, poi),
+            "s": np.concatenate(s), "b": np.concatenate(b), "n": data, "tau": np.concatenate(tau)}
+
+def _stack(rows, fill=0.0):
+    """(H, max bins) array of the 1D rows, padded with empty bins (which do not change the likelihood)."""
+    out = np.full((len(rows), max(len(row) for row in rows)), fill)
+    for i, row in enumerate(rows):
+        out[i, :len(row)] = row
+    return out
+
+def grid_limits(yields, scales=(1.0,), cl=CL):
+    """
+    Limits of every config_yields entry x signal scale, all hypotheses solved at once. Returns a list of
+    {'job', 'scale', 'expected': {band: limit}, 'observed', 'clipped'} in the order of yields, then scales;
+    limits outside the POI range are clipped to it and 'clipped' lists the bands (and 'obs') that were.
+    """
+    points = [(y, scale) for y in yields for scale in scales]
+    s = _stack([y["s"] * scale for y, scale in points])
+    b = _stack([y["b"] for y, _ in points])
+    n = _stack([y["b"] if y["n"] is None else y["n"] for y, _ in points])
+    tau = _stack([y["tau"] for y, _ in points], fill=np.inf)
+    expected = expected_limits(s, b, cl, tau=tau)
+    observed = observed_limits(s, b, n, cl, tau=tau)
+    results = []
+    for i, (y, scale) in enumerate(points):
+        lo, hi = y.get("poi_range", (0.0, np.inf))
+        limits = dict(zip(BANDS, expected[i]), obs=observed[i])
+        clipped = [band for band, limit in limits.items() if not lo <= limit <= hi]
+        limits = {band: min(max(limit, lo), hi) for band, limit in limits.items()}
+        observed_limit = limits.pop("obs")
+        results.append({"job": y["job"], "scale": scale, "expected": limits, "observed": observed_limit, "clipped": clipped})
+    return results
+
+def read_trex_limits(job_dir):
+    """{band or 'obs': limit} from the 'stats' tree of the first ROOT file below <job_dir>/Limits, or None."""
+    import uproot
+    for path in sorted(glob.glob(os.path.join(job_dir, "Limits", "**", "*.root"), recursive=True)):
+        with uproot.open(path) as f:
+            if "stats" not in f:
+                continue
+            tree = f["stats"]
+            return {band: float(tree[branch].array(library="np")[0])
+                    for branch, band in TREX_BRANCHES.items() if branch in tree}
+    return None
+
+def print_table(results, yields=None):
+    """Limit table; with yields (config_yields entries) the TRexFitter median limit of each job is compared."""
+    trex = {y["job"]: read_trex_limits(y["job_dir"]) for y in yields} if yields else {}
+    header = f"{'Job':<28}{'Scale':>10}" + "".join(f"{f'{band:+d}s' if band else 'Median':>12}" for band in BANDS) + f"{'Observed':>12}"
+    print(header + (f"{'TRexFitter':>12}{'Diff [%]':>10}" if yields else ""))
+    for r in results:
+        line = f"{r['job']:<28}{r['scale']:>10.4g}" + "".join(f"{r['expected'][band]:>12.4g}" for band in BANDS) + f"{r['observed']:>12.4g}"
+        if yields:
+            reference = trex.get(r["job"])
+            if reference and 0 in reference:
+                # TRexFitter fits the unscaled signal: the limit scales as 1 / scale
+                median = r["expected"][0] * r["scale"]
+                line += f"{reference[0]:>12.4g}{100 * (median / reference[0] - 1):>10.2f}"
+            else:
+                line += f"{'-':>12}{'-':>10}"
+        print(line + (" *" if r.get("clipped") else ""))
+    clipped = [f"{r['job']} (x{r['scale']:g})" for r in results if r.get("clipped")]
+    if clipped:
+        print(f"WARNING: * limits clipped to the Min / Max of the POI NormFactor, widen its range: {', '.join(clipped)}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Asymptotic CLs limits of TRexFitter configs without systematics (MC-stat gammas profiled), all points at once.")
+    parser.add_argument("configs", nargs="+", help="Rendered TRexFitter configs (ReadFrom: NTUP or HIST)")
+    parser.add_argument("--scale", type=float, nargs="+", default=[1.0], help="Extra signal scale factors (e.g. magnifications) to scan")
+    parser.add_argument("--cl", type=float, default=CL, help="Confidence level")
+    parser.add_argument("--compare", action="store_true", help="Compare with the limits TRexFitter wrote to <OutputDir>/<Job>/Limits")
+    args = parser.parse_args(argv)
+
+    missing = [c for c in args.configs if not os.path.exists(c)]
+    if missing:
+        print(f"FATAL: configs not found: {missing}")
+        return 1
+    start = time.perf_counter()
+    try:
+        yields = [config_yields(config) for config in args.configs]
+    except (ValueError, KeyError, OSError) as e:
+        print(f"FATAL: {e}")
+        return 1
+    loaded = time.perf_counter()
+    results = grid_limits(yields, args.scale, args.cl)
+    print(f"{len(results)} limits at {args.cl:.0%} CL: inputs read in {loaded - start:.2f} s, "
+          f"limits computed in {time.perf_counter() - loaded:.3f} s")
+    print_table(results, yields if args.compare else None)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+"""
+Synthetic-data benchmarks for the ntuple scoring pipeline.
+
+'generate' writes ntuples with the branch names the scripts read (process_ntuples.FEATURES, the stop FEATURES and
+the readers' INPUT_VARS) in the directory layouts the scripts expect, plus random models and BDT/DNN weights.
+'run' executes process_ntuples.py, process-stop-ntuples.py, create-ntuples-per-signal.py, the k-fold splitter and
+the batched readers on them, each in its own process, and collects the per-stage timings recorded through
+stage_timing (load / scale / predict / write, ...), events/s and peak RSS into one JSON file.
+'compare' lists the differences between two such files.
+
+    python benchmark.py generate --workdir /tmp/bench --events 200000
+    python benchmark.py run --workdir /tmp/bench --output bench_$(git rev-parse --short HEAD).json
+    python benchmark.py compare bench_old.json bench_new.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import subprocess
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+TARGETS = ["process_ntuples", "process_stop", "create_ntuples", "kfold_split", "reader_bdt", "reader_dnn"]
+
+LQ_SIGNALS = ["lq_1p6TeV_merged_600K", "lq_2TeV_merged_600K", "lq_2p4TeV_merged_600K"]
+LQ_BACKGROUNDS = ["znunu_600K", "ttbar", "wlnu"]
+STOP_SIGNALS = ["sT_tN1_1000_102_100", "sT_tN1_1000_202_200", "sT_tN1_1000_3_1"]
+STOP_BACKGROUNDS = ["diboson", "dijet", "singletop", "ttbar", "wlnu", "zll", "znunu"]
+CHANNEL = "sT_bC1"
+BDT_HP = "300_10_1_0.01"
+DNN_HP = "416_160_416_480_0.0001_100_128"
+
+# --- Synthetic inputs ---
+
+def _branch_names():
+    """Every branch read by the benchmarked code, taken from the scripts themselves."""
+    import importlib
+    import process_ntuples
+    import Reader_BDT
+    import Reader_DNN
+    process_stop = importlib.import_module("process-stop-ntuples")
+    names = []
+    for name in process_ntuples.FEATURES + process_stop.FEATURES + Reader_BDT.INPUT_VARS + Reader_DNN.INPUT_VARS + ["weight"]:
+        if name not in names:
+            names.append(name)
+    return names
+
+def _branch_values(name, n, rng):
+    """Plausibly distributed values for a branch, chosen from its name."""
+    lname = name.lower()
+    if name == "weight":
+        return rng.normal(1.0, 0.2, n)
+    if "gn2" in lname:
+        values = rng.integers(1, 6, n)
+    elif "dphi" in lname:
+        values = rng.uniform(0.0, np.pi, n)
+    elif lname.endswith("_phi"):
+        values = rng.uniform(-np.pi, np.pi, n)
+    elif lname.startswith("deta"):
+        values = np.abs(rng.normal(0.0, 1.5, n))
+    elif "eta" in lname:
+        values = rng.normal(0.0, 1.2, n)
+    elif lname.startswith("dr"):
+        values = rng.uniform(0.4, 4.0, n)
+    elif "svmass" in lname:
+        values = rng.exponential(1.5, n)
+    elif lname.startswith("r_"):
+        values = rng.uniform(0.0, 1.0, n)
+    elif "sig" in lname:
+        values = rng.exponential(6.0, n)
+    else:
+        values = 50.0 + rng.exponential(150.0, n)
+    return values.astype(np.float32)
+
+def write_ntuple(path, tree_names, branches, n_events, rng, block=1_000_000):
+    """Writes n_events synthetic entries of branches into each of tree_names (TTrees) in a new ROOT file."""
+    import uproot
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with uproot.recreate(path) as f:
+        for tree_name in tree_names:
+            types = {b: (np.float64 if b == "weight" else np.float32) for b in branches}
+            tree = f.mktree(tree_name, types)
+            for start in range(0, n_events, block):
+                n = min(block, n_events - start)
+                tree.extend({b: _branch_values(b, n, rng) for b in branches})
+
+def _write_keras_model(path, n_inputs, n_outputs, seed):
+    import tensorflow as tf
+    tf.keras.utils.set_random_seed(seed)
+    model = tf.keras.Sequential([
+        tf.keras.layers.Input(shape=(n_inputs,)),
+        tf.keras.layers.Dense(64, activation="relu"),
+        tf.keras.layers.Dense(32, activation="relu"),
+        tf.keras.layers.Dense(n_outputs, activation="sigmoid" if n_outputs == 1 else "softmax"),
+    ])
+    model.save(path)
+
+def _write_scaler(model_path, features, rng):
+    from sklearn.preprocessing import StandardScaler
+    from scaler_sidecar import save_scaler
+    scaler = StandardScaler().fit(np.column_stack([_branch_values(f, 10000, rng) for f in features]))
+    save_scaler(scaler, features, model_path)
+
+def synthetic_bdt_xml(path, variables, n_trees, depth, rng, boost_type="Grad"):
+    """Writes a TMVA-style BDT weights file with random cuts that mva_batch.TMVABDT can evaluate."""
+    samples = {v: _branch_values(v, 1000, rng) for v in variables}
+
+    def node(pos, level):
+        if level == depth:
+            return (f'<Node pos="{pos}" depth="{level}" NCoef="0" IVar="-1" Cut="0.0e+00" cType="1" '
+                    f'res="{rng.normal(0, 0.1):.6e}" rms="0" purity="{rng.random():.4f}" nType="{rng.choice([-1, 1])}"/>')
+        ivar = int(rng.integers(len(variables)))
+        cut = float(rng.choice(samples[variables[ivar]]))
+        return (f'<Node pos="{pos}" depth="{level}" NCoef="0" IVar="{ivar}" Cut="{cut:.9e}" cType="1" res="0" '
+                f'rms="0" purity="0.5" nType="0">{node("l", level + 1)}{node("r", level + 1)}</Node>')
+
+    variables_xml = "".join(f'<Variable VarIndex="{i}" Expression="{v}" Label="{v}" Type="F"/>' for i, v in enumerate(variables))
+    trees = "".join(f'<BinaryTree type="DecisionTree" boostWeight="1.0" itree="{i}">{node("s", 0)}</BinaryTree>' for i in range(n_trees))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(f'<?xml version="1.0"?>\n<MethodSetup Method="BDT::BDT">\n'
+                f'<Options><Option name="BoostType" modified="Yes">{boost_type}</Option></Options>\n'
+                f'<Variables NVar="{len(variables)}">{variables_xml}</Variables>\n'
+                f'<Transformations NTransformations="0"/>\n'
+                f'<Weights NTrees="{n_trees}" AnalysisType="0">{trees}</Weights>\n</MethodSetup>\n')
+
+def synthetic_pykeras_xml(path, variables, model_path):
+    """Writes a TMVA PyKeras weights file pointing at model_path."""
+    variables_xml = "".join(f'<Variable VarIndex="{i}" Expression="{v}" Label="{v}" Type="F"/>' for i, v in enumerate(variables))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(f'<?xml version="1.0"?>\n<MethodSetup Method="PyKeras::Keras">\n'
+                f'<Options><Option name="FilenameTrainedModel" modified="Yes">{os.path.abspath(model_path)}</Option></Options>\n'
+                f'<Variables NVar="{len(variables)}">{variables_xml}</Variables>\n'
+                f'<Transformations NTransformations="0"/>\n</MethodSetup>\n')
+
+def generate(workdir, n_events, seed=1, bdt_trees=300, bdt_depth=4):
+    """Writes all benchmark inputs below workdir."""
+    import Reader_BDT
+    import Reader_DNN
+    import process_ntuples
+    import importlib
+    from run_readers import SAMPLES
+    from kfold_split_trees import split_ttree
+    process_stop = importlib.import_module("process-stop-ntuples")
+
+    rng = np.random.default_rng(seed)
+    branches = _branch_names()
+    start = time.perf_counter()
+
+    print(f"Generating {n_events} events per tree into {workdir} ({len(branches)} branches)")
+    for name in LQ_SIGNALS:
+        write_ntuple(f"{workdir}/flat/sig/lq/flat_tuple_{name}.root", process_ntuples.CATEGORIES, branches, n_events, rng)
+    for name in LQ_BACKGROUNDS:
+        write_ntuple(f"{workdir}/flat/bkg/flat_tuple_{name}.root", process_ntuples.CATEGORIES, branches, n_events, rng)
+    for name in STOP_SIGNALS:
+        write_ntuple(f"{workdir}/run3_btag/all/singlestop/basicSel_{name}.root", ["sel_tree"], branches, n_events, rng)
+    for name in STOP_BACKGROUNDS:
+        write_ntuple(f"{workdir}/run3_btag/all/{name}/basicSel_{name}.root", ["sel_tree"], branches, n_events, rng)
+    for name in SAMPLES:
+        write_ntuple(f"{workdir}/tbc1_untag/all/{name}/basicSel_{name}.root", ["sel_tree"], branches, n_events, rng)
+
+    # Fold files for the readers (the kfold_split target writes its own copy)
+    os.makedirs(f"{workdir}/MLinputs", exist_ok=True)
+    for name in SAMPLES:
+        split_ttree(f"{workdir}/tbc1_untag/all/{name}/basicSel_{name}.root", "sel_tree", f"{workdir}/MLinputs", "SR", name)
+
+    # Models: ML/ carries scaler sidecars (single-pass path), ML_refit/ does not (refit path)
+    for subdir in ("ML", "ML_refit"):
+        os.makedirs(f"{workdir}/{subdir}", exist_ok=True)
+        _write_keras_model(f"{workdir}/{subdir}/best_model_lq.keras", len(process_ntuples.FEATURES), 1, seed)
+        _write_keras_model(f"{workdir}/{subdir}/best_model_stop.keras", len(process_stop.FEATURES), 1, seed)
+    _write_scaler(f"{workdir}/ML/best_model_lq.keras", process_ntuples.FEATURES, rng)
+    _write_scaler(f"{workdir}/ML/best_model_stop.keras", process_stop.FEATURES, rng)
+
+    bdt_parameters = Reader_BDT.parameters_string(BDT_HP)
+    dnn_parameters = Reader_DNN.parameters_string(DNN_HP)
+    dnn_model = f"{workdir}/mva/weights/TrainedModel_benchmark.h5"
+    os.makedirs(os.path.dirname(dnn_model), exist_ok=True)
+    _write_keras_model(dnn_model, len(Reader_DNN.INPUT_VARS), 2, seed)
+    for n in range(1, 6):
+        synthetic_bdt_xml(os.path.join(workdir, Reader_BDT.weights_file(CHANNEL, n, bdt_parameters)), Reader_BDT.INPUT_VARS, bdt_trees, bdt_depth, rng)
+        synthetic_pykeras_xml(os.path.join(workdir, Reader_DNN.weights_file(CHANNEL, n, dnn_parameters, "")), Reader_DNN.INPUT_VARS, dnn_model)
+
+    with open(f"{workdir}/benchmark_inputs.json", "w") as f:
+        json.dump({"events_per_tree": n_events, "seed": seed, "branches": branches, "bdt_trees": bdt_trees, "bdt_depth": bdt_depth}, f, indent=2)
+    print(f"Generated inputs in {time.perf_counter() - start:.1f} s")
+
+# --- In-process targets (run in a child process by 'run') ---
+
+def _target_kfold_split(workdir):
+    from run_readers import SAMPLES
+    from kfold_split_trees import split_ttree
+    outdir = f"{workdir}/kfold_bench"
+    os.makedirs(outdir, exist_ok=True)
+    for name in SAMPLES:
+        split_ttree(f"{workdir}/tbc1_untag/all/{name}/basicSel_{name}.root", "sel_tree", outdir, "SR", name)
+
+def _target_reader(workdir, method):
+    from run_readers import SAMPLES
+    from mva_batch import write_hists
+    if method == "BDT":
+        import Reader_BDT as reader
+        parameters_str, extra = reader.parameters_string(BDT_HP), ()
+    else:
+        import Reader_DNN as reader
+        parameters_str, extra = reader.parameters_string(DNN_HP), ("",)
+    outdir = f"{workdir}/reader_output"
+    os.makedirs(outdir, exist_ok=True)
+    for sample in SAMPLES:
+        hist = None
+        for n in range(1, 6):
+            fold_hist, _ = reader.score_fold_batched(f"{workdir}/MLinputs", sample, n, "validation",
+                                                     os.path.join(workdir, reader.weights_file(CHANNEL, n, parameters_str, *extra)))
+            if hist is None:
+                hist = fold_hist
+            else:
+                hist.merge(fold_hist)
+        outfile_name = os.path.join(outdir, os.path.basename(reader.output_file(sample, CHANNEL, "5fold", parameters_str, *extra)))
+        write_hists(outfile_name, {f"h_score_{sample}": hist})
+
+# --- Runner ---
+
+def _target_command(target, workdir, scaler, io_workers):
+    python = sys.executable
+    models = f"{workdir}/{'ML' if scaler == 'sidecar' else 'ML_refit'}"
+    io = ["--io-workers", str(io_workers)]
+    if target == "process_ntuples":
+        return [python, f"{REPO_DIR}/process_ntuples.py", "--type", "LQ", "--ntuple-base", f"{workdir}/flat",
+                "--model", f"{models}/best_model_lq.keras"] + io
+    if target == "process_stop":
+        return [python, f"{REPO_DIR}/process-stop-ntuples.py", "--ntuple-base", f"{workdir}/run3_btag/all",
+                "--model", f"{models}/best_model_stop.keras"] + io
+    if target == "create_ntuples":
+        return [python, f"{REPO_DIR}/create-ntuples-per-signal.py", "--ntuple-base", f"{workdir}/run3_btag/all",
+                "--model", f"{models}/best_model_stop.keras"] + io
+    return [python, os.path.abspath(__file__), "_target", target, "--workdir", workdir]
+
+def _git_revision():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip())
+        return rev, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def run(workdir, targets, output, scaler="sidecar", io_workers=1, feature_cache="off"):
+    """Runs every target in its own process and writes the collected timings to output."""
+    workdir = os.path.abspath(workdir)
+    with open(f"{workdir}/benchmark_inputs.json") as f:
+        inputs = json.load(f)
+    os.makedirs(f"{workdir}/logs", exist_ok=True)
+    revision, dirty = _git_revision()
+    results = {
+        "revision": revision,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "inputs": {k: inputs[k] for k in ("events_per_tree", "seed", "bdt_trees", "bdt_depth")},
+        "options": {"scaler": scaler, "io_workers": io_workers, "feature_cache": feature_cache},
+        "targets": {},
+    }
+
+    for target in targets:
+        run_dir = f"{workdir}/runs/{target}"
+        shutil.rmtree(run_dir, ignore_errors=True)
+        os.makedirs(run_dir)
+        timings_path = f"{run_dir}/stage_timings.json"
+        env = dict(os.environ, STAGE_TIMINGS=timings_path, TF_CPP_MIN_LOG_LEVEL="2")
+        env["PYTHONPATH"] = os.pathsep.join([REPO_DIR] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else []))
+        env["FEATURE_CACHE"] = feature_cache
+        if feature_cache == "on":
+            env["FEATURE_CACHE_DIR"] = f"{workdir}/feature_cache"
+
+        print(f"Running {target} ...", flush=True)
+        start = time.perf_counter()
+        with open(f"{workdir}/logs/{target}.log", "w") as log:
+            proc = subprocess.run(_target_command(target, workdir, scaler, io_workers), cwd=run_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        wall = time.perf_counter() - start
+
+        entry = {"returncode": proc.returncode, "wall_seconds": wall}
+        if os.path.exists(timings_path):
+            with open(timings_path) as f:
+                timings = json.load(f)
+            stages = timings["stages"]
+            for stats in stages.values():
+                stats["events_per_second"] = stats["events"] / stats["seconds"] if stats["seconds"] > 0 else None
+            events = stages.get("load", {}).get("events", 0)
+            entry.update({
+                "events": events,
+                "events_per_second": events / wall if wall > 0 else None,
+                "peak_rss_mb": timings["peak_rss_mb"],
+                "stages": stages,
+            })
+        results["targets"][target] = entry
+        status = "ok" if proc.returncode == 0 else f"FAILED (exit {proc.returncode}, see logs/{target}.log)"
+        rate = entry.get("events_per_second")
+        rate_str = f"{rate:,.0f} events/s" if rate else "n/a"
+        print(f"  {target}: {wall:.1f} s, {rate_str}, peak RSS {entry.get('peak_rss_mb', 0):.0f} MB, {status}")
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {output}")
+    return 0 if all(t["returncode"] == 0 for t in results["targets"].values()) else 1
+
+def compare(old_path, new_path, threshold=0.10):
+    """Prints per-target and per-stage rate changes; returns 1 if any events/s dropped by more than threshold."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"old: {old.get('revision')} ({old.get('timestamp')})  new: {new.get('revision')} ({new.get('timestamp')})")
+    if old.get("inputs") != new.get("inputs") or old.get("options") != new.get("options"):
+        print("WARNING: the two runs used different inputs or options")
+
+    regressions = 0
+    print(f"{'Target / stage':<32}{'old ev/s':>14}{'new ev/s':>14}{'change':>9}{'old RSS':>10}{'new RSS':>10}")
+    for target in new["targets"]:
+        if target not in old["targets"]:
+            continue
+        o, n = old["targets"][target], new["targets"][target]
+        rows = [(target, o.get("events_per_second"), n.get("events_per_second"), o.get("peak_rss_mb"), n.get("peak_rss_mb"))]
+        for stage in n.get("stages", {}):
+            if stage in o.get("stages", {}):
+                rows.append((f"  {stage}", o["stages"][stage].get("events_per_second"), n["stages"][stage].get("events_per_second"), None, None))
+        for name, o_rate, n_rate, o_rss, n_rss in rows:
+            if not o_rate or not n_rate:
+                continue
+            change = n_rate / o_rate - 1.0
+            flag = ""
+            if change < -threshold:
+                flag = "  <-- regression"
+                regressions += 1
+            rss = f"{o_rss:>10.0f}{n_rss:>10.0f}" if o_rss is not None and n_rss is not None else ""
+            print(f"{name:<32}{o_rate:>14,.0f}{n_rate:>14,.0f}{change:>+9.1%}{rss}{flag}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic-data benchmarks for the ntuple scoring pipeline.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="Write synthetic ntuples, models and weights")
+    gen.add_argument("--workdir", required=True)
+    gen.add_argument("--events", type=int, default=100000, help="Events per tree")
+    gen.add_argument("--seed", type=int, default=1)
+    gen.add_argument("--bdt-trees", type=int, default=300)
+    gen.add_argument("--bdt-depth", type=int, default=4)
+
+    run_parser = sub.add_parser("run", help="Benchmark the pipeline on generated inputs")
+    run_parser.add_argument("--workdir", required=True)
+    run_parser.add_argument("--targets", nargs="+", choices=TARGETS, default=TARGETS)
+    run_parser.add_argument("--output", default="benchmark_results.json")
+    run_parser.add_argument("--scaler", choices=["sidecar", "refit"], default="sidecar", help="Score with the scaler sidecar or refit it")
+    run_parser.add_argument("--io-workers", type=int, default=1)
+    run_parser.add_argument("--feature-cache", choices=["off", "on"], default="off")
+
+    cmp_parser = sub.add_parser("compare", help="Compare two result files")
+    cmp_parser.add_argument("old")
+    cmp_parser.add_argument("new")
+    cmp_parser.add_argument("--threshold", type=float, default=0.10, help="Relative events/s drop reported as a regression")
+
+    target_parser = sub.add_parser("_target", help=argparse.SUPPRESS)
+    target_parser.add_argument("target", choices=["kfold_split", "reader_bdt", "reader_dnn"])
+    target_parser.add_argument("--workdir", required=True)
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        generate(os.path.abspath(args.workdir), args.events, args.seed, args.bdt_trees, args.bdt_depth)
+    elif args.command == "run":
+        sys.exit(run(args.workdir, args.targets, args.output, args.scaler, args.io_workers, args.feature_cache))
+    elif args.command == "compare":
+        sys.exit(compare(args.old, args.new, args.threshold))
+    elif args.target == "kfold_split":
+        _target_kfold_split(args.workdir)
+    else:
+        _target_reader(args.workdir, "BDT" if args.target == "reader_bdt" else "DNN")
@@ -5,15 +5,31 @@ Reads 'sel_tree' from each file, applies model, and writes one ROOT per signal m
 one balanced background ROOT with equal total entries.
 """
 import os
+import argparse
 import uproot
 import pandas as pd
 import numpy as np
-import tensorflow as tf
 from sklearn.preprocessing import StandardScaler
+from scaler_sidecar import load_scaler
+from numpy_model import load_model, ENGINES
+from mva_batch import ScoreHist, write_hists
+from trex_config import hist_file_name
+import feature_cache
+import ntuple_catalog
+import parallel_io
+import stage_timing
+
+parser = argparse.ArgumentParser(description="Create per-signal and balanced background discriminant ntuples.")
+parser.add_argument("--io-workers", type=int, default=1, help="Number of sample files read concurrently")
+parser.add_argument("--ntuple-base", default="/home/sgoswami/monobcntuples/run3_btag/all", help="Base directory of the input ntuples")
+parser.add_argument("--model", default="/home/sgoswami/monobcntuples/ML/best_model_stop.keras", help="Keras model path")
+parser.add_argument("--engine", choices=ENGINES, default="keras", help="'numpy': score with the NumPy export of the model, without TensorFlow")
+parser.add_argument("--hist-output", action="store_true", help="Also write the binned discriminant of every output file to <file>_hists.root (TRexFitter ReadFrom: HIST)")
+args = parser.parse_args()
 
 # --- Configuration ---
-NTUPLE_BASE_PATH = "/home/sgoswami/monobcntuples/run3_btag/all"
-MODEL_PATH       = "/home/sgoswami/monobcntuples/ML/best_model_stop.keras"
+NTUPLE_BASE_PATH = args.ntuple_base
+MODEL_PATH       = args.model
 SUFFIX           = "_stopana"
 BRANCH           = f"discriminant{SUFFIX}"
 FEATURES = [
@@ -22,6 +38,8 @@ FEATURES = [
     "pTjj", "mbb", "pTbb", "dRjj", "dEtajj", "dPhijj", "dRbb", "dEtabb",
     "dPhibb", "jet2_pt", "jet2_eta", "jet2_svmass"
 ]
+# Binning of the discriminant Variable in the TRexFitter configs
+HIST_BINS = (20, 0.0, 1.0)
 
 # Signal and background definitions
 signal_files = {
@@ -44,64 +62,88 @@ def load_df(path):
     if not os.path.exists(path):
         print(f"WARNING: {path} not found")
         return None
+    # check tree and features in the catalog before opening the file
+    missing = ntuple_catalog.missing_branches(path, "sel_tree", FEATURES)
+    if missing is None:
+        print(f"WARNING: sel_tree missing in {path}")
+        return None
+    if missing:
+        print(f"WARNING: missing {missing} in {path}")
+        return None
     with uproot.open(path) as f:
-        if "sel_tree" not in f:
-            print(f"WARNING: sel_tree missing in {path}")
-            return None
-        tree = f["sel_tree"]
-        # check features
-        branches = set(tree.keys())
-        missing = [b for b in FEATURES if b not in branches]
-        if missing:
-            print(f"WARNING: missing {missing} in {path}")
-            return None
-        return tree.arrays(FEATURES, library="pd")
+        return feature_cache.tree_arrays(f["sel_tree"], FEATURES, library="pd")
+
+def write_tree(out_file, tree_name, arr):
+    """Writes arr as the BRANCH of tree_name and, with --hist-output, its unit-weight histogram (named like the tree)."""
+    with stage_timing.stage("write", len(arr)), uproot.recreate(out_file) as out:
+        # mktree keeps the outputs TTrees (plain assignment writes RNTuples in recent uproot)
+        out.mktree(tree_name, {BRANCH: arr.dtype})
+        out[tree_name].extend({BRANCH: arr})
+    if args.hist_output:
+        hist = ScoreHist(*HIST_BINS)
+        hist.fill(arr, np.ones(len(arr)))
+        write_hists(hist_file_name(out_file), {tree_name: hist})
 
 # --- Main processing ---
-# 1) Load all DataFrames and record indices
-dfs = []
-indices = {}
-pos = 0
-for name, path in {**signal_files, **background_files}.items():
-    df = load_df(path)
-    if df is None or df.empty:
-        continue
-    n = len(df)
-    dfs.append(df)
-    indices[name] = (pos, pos + n)
-    pos += n
-if not dfs:
-    raise RuntimeError("No data loaded")
-combined = pd.concat(dfs, ignore_index=True)
+jobs = [(name, (path,)) for name, path in {**signal_files, **background_files}.items()]
+
+with stage_timing.stage("load_model"):
+    model = load_model(MODEL_PATH, args.engine)
+try:
+    scaler = load_scaler(MODEL_PATH, FEATURES)
+except ValueError as e:
+    print(f"FATAL: {e}")
+    raise SystemExit(1)
+preds_by_sample = {}
+if scaler is not None:
+    # 1-3) Training-time scaler available: load, scale and predict one sample at a time
+    loaded = parallel_io.iter_loaded(load_df, jobs, args.io_workers)
+    for name, df in stage_timing.timed_iter("load", loaded, count=lambda item: 0 if item[1] is None else len(item[1])):
+        if df is None or df.empty:
+            continue
+        with stage_timing.stage("scale", len(df)):
+            X = scaler.transform(df[FEATURES].values)
+        with stage_timing.stage("predict", len(df)):
+            preds_by_sample[name] = model.predict(X, batch_size=4096, verbose=0).flatten()
+    if not preds_by_sample:
+        raise RuntimeError("No data loaded")
+else:
+    print(f"WARNING: No scaler sidecar next to {MODEL_PATH}, refitting the scaler on the inference dataset.")
+    # 1) Load all DataFrames and record indices
+    with stage_timing.stage("load"):
+        dfs, indices = parallel_io.load_indexed(load_df, jobs, args.io_workers)
+        if not dfs:
+            raise RuntimeError("No data loaded")
+        combined = pd.concat(dfs, ignore_index=True)
+    stage_timing.add_events("load", len(combined))
 
-# 2) Scale features
-df_features = combined[FEATURES]
-scaler = StandardScaler()
-X_all = scaler.fit_transform(df_features)
+    # 2) Scale features
+    with stage_timing.stage("scale", len(combined)):
+        df_features = combined[FEATURES]
+        scaler = StandardScaler()
+        X_all = scaler.fit_transform(df_features)
 
-# 3) Predict with model
-model = tf.keras.models.load_model(MODEL_PATH)
-preds = model.predict(X_all, batch_size=4096).flatten()
+    # 3) Predict with model
+    with stage_timing.stage("predict", len(X_all)):
+        preds = model.predict(X_all, batch_size=4096).flatten()
+    preds_by_sample = {name: preds[s:e] for name, (s, e) in indices.items()}
 
 # 4) Write per-signal ntuples
 total_signal = 0
 for name in signal_files:
-    if name not in indices:
+    if name not in preds_by_sample:
         continue
-    start, end = indices[name]
-    arr = preds[start:end]
+    arr = preds_by_sample[name]
     total_signal += len(arr)
     out_file = f"discriminant_{name}{SUFFIX}.root"
-    with uproot.recreate(out_file) as out:
-        out[f"{name}{SUFFIX}"] = {BRANCH: arr}
+    write_tree(out_file, f"{name}{SUFFIX}", arr)
     print(f"Wrote {out_file}: {len(arr)} events")
 
 # 5) Build balanced background (S:B = 1:1)
 bkg_preds = []
 for name in background_files:
-    if name in indices:
-        s,e = indices[name]
-        bkg_preds.append(preds[s:e])
+    if name in preds_by_sample:
+        bkg_preds.append(preds_by_sample[name])
 if not bkg_preds:
     raise RuntimeError("No background predictions loaded")
 combined_bkg = np.concatenate(bkg_preds)
@@ -112,8 +154,8 @@ if len(combined_bkg) >= total_signal:
 else:
     bkg_sampled = rng.choice(combined_bkg, size=total_signal, replace=True)
 out_bkg = f"discriminant_background{SUFFIX}.root"
-with uproot.recreate(out_bkg) as out:
-    out[f"background{SUFFIX}"] = {BRANCH: bkg_sampled}
+write_tree(out_bkg, f"background{SUFFIX}", bkg_sampled)
 print(f"Wrote {out_bkg}: {len(bkg_sampled)} balanced events")
 
+feature_cache.report()
 print("Done: generated balanced discriminant ntuples.")
@@ -0,0 +1,262 @@
+"""
+On-disk columnar cache for the feature branches read by the scoring scripts and notebooks.
+Each (file, tree, branch list) is stored once as per-branch .npy files, keyed by the source path, size and
+mtime, so later runs memory-map the columns instead of decompressing ROOT baskets or HDF5 blocks again.
+The cache is kept below a size cap by evicting the least recently used entries. It is off unless enabled, and
+by default lives under $TMPDIR, not in the (quota-limited) home directory.
+
+Environment:
+    FEATURE_CACHE          set to "on" to use the cache (default off)
+    FEATURE_CACHE_DIR      cache location (default $TMPDIR/monobc_features_<uid>)
+    FEATURE_CACHE_MAX_GB   size cap in GB (default 20)
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+import h5_projection
+
+CACHE_DIR = os.environ.get("FEATURE_CACHE_DIR", os.path.join(tempfile.gettempdir(), f"monobc_features_{os.getuid()}"))
+MAX_BYTES = int(float(os.environ.get("FEATURE_CACHE_MAX_GB", "20")) * 1024**3)
+ENABLED = os.environ.get("FEATURE_CACHE", "off").lower() in ("1", "on", "yes", "true")
+
+_stats = {"hits": 0, "misses": 0, "bytes_cached": 0, "bytes_written": 0}
+_lock = threading.Lock()
+
+def cache_key(path, object_name, branches):
+    """Key of a cache entry: source path, size and mtime, the tree (or HDF5 group) name and the branch set."""
+    st = os.stat(path)
+    ident = {
+        "path": os.path.abspath(path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "object": object_name,
+        "branches": sorted(branches),
+    }
+    return hashlib.sha1(json.dumps(ident, sort_keys=True).encode()).hexdigest()
+
+def _count(name, value=1):
+    with _lock:
+        _stats[name] += value
+
+def _lookup(key, branches):
+    """Memory-mapped columns of a cache entry, or None on a miss. A hit refreshes the entry's LRU stamp."""
+    entry = os.path.join(CACHE_DIR, key)
+    meta_path = os.path.join(entry, "meta.json")
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        arrays = {b: np.load(os.path.join(entry, meta["files"][b]), mmap_mode="r") for b in branches}
+        os.utime(meta_path)
+    except (OSError, ValueError, KeyError):
+        return None
+    _count("hits")
+    _count("bytes_cached", sum(a.nbytes for a in arrays.values()))
+    return arrays
+
+class _EntryWriter:
+    """Fills a new cache entry column by column in a temporary directory and publishes it atomically on commit."""
+
+    def __init__(self, key, source, object_name, dtypes, n_entries):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        self.key = key
+        self.tmp = tempfile.mkdtemp(prefix=f".{key}.", dir=CACHE_DIR)
+        self.meta = {"source": os.path.abspath(source), "object": object_name, "n_entries": int(n_entries), "files": {}}
+        self.columns = {}
+        for i, (branch, dtype) in enumerate(dtypes.items()):
+            fname = f"{i:03d}.npy"
+            self.meta["files"][branch] = fname
+            self.columns[branch] = np.lib.format.open_memmap(os.path.join(self.tmp, fname), mode="w+", dtype=dtype, shape=(n_entries,))
+
+    def write(self, start, chunk):
+        for branch, column in self.columns.items():
+            values = chunk[branch]
+            column[start:start + len(values)] = values
+
+    def commit(self):
+        nbytes = 0
+        for column in self.columns.values():
+            column.flush()
+            nbytes += column.nbytes
+        self.columns = {}
+        self.meta["created"] = time.time()
+        with open(os.path.join(self.tmp, "meta.json"), "w") as f:
+            json.dump(self.meta, f, indent=2)
+        try:
+            os.rename(self.tmp, os.path.join(CACHE_DIR, self.key))
+        except OSError:
+            # Another process published the same entry first
+            self.abort()
+            return
+        _count("bytes_written", nbytes)
+        evict()
+
+    def abort(self):
+        self.columns = {}
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+def _open_writer(key, source, object_name, dtypes, n_entries):
+    if n_entries == 0:
+        return None
+    try:
+        return _EntryWriter(key, source, object_name, dtypes, n_entries)
+    except OSError as e:
+        print(f"WARNING: feature cache at {CACHE_DIR} is not writable ({e}), reading without it")
+        return None
+
+def _column_dtypes(arrays):
+    """Dtypes of the arrays, or None if any of them (e.g. a jagged branch) cannot be stored as a plain column."""
+    dtypes = {}
+    for b, a in arrays.items():
+        if a.dtype == object or a.ndim != 1:
+            return None
+        dtypes[b] = a.dtype
+    return dtypes
+
+def _tree_dtypes(tree, branches):
+    """Dtypes of the branches from their interpretations (nothing is read), or None if any is not a plain column."""
+    dtypes = {}
+    for b in branches:
+        interpretation = tree[b].interpretation
+        if getattr(interpretation, "inner_shape", None) != ():
+            return None
+        dtypes[b] = np.dtype(interpretation.numpy_dtype)
+    return dtypes
+
+def _as_library(arrays, branches, library, start=0):
+    if library == "pd":
+        n = len(arrays[branches[0]]) if branches else 0
+        return pd.DataFrame({b: arrays[b] for b in branches}, index=pd.RangeIndex(start, start + n))
+    return {b: arrays[b] for b in branches}
+
+def tree_arrays(tree, branches, library="np"):
+    """Cached drop-in for tree.arrays(branches, library=library) with library "np" or "pd"."""
+    branches = list(branches)
+    if not ENABLED:
+        return tree.arrays(branches, library=library)
+
+    key = cache_key(tree.file.file_path, tree.object_path, branches)
+    arrays = _lookup(key, branches)
+    if arrays is not None:
+        return _as_library(arrays, branches, library)
+
+    _count("misses")
+    dtypes = _tree_dtypes(tree, branches)
+    if dtypes is None:
+        return tree.arrays(branches, library=library)
+    arrays = tree.arrays(branches, library="np")
+    writer = _open_writer(key, tree.file.file_path, tree.object_path, dtypes, tree.num_entries)
+    if writer is not None:
+        writer.write(0, arrays)
+        writer.commit()
+    return _as_library(arrays, branches, library)
+
+def iterate_tree(tree, branches, step_size, library="np"):
+    """
+    Cached drop-in for tree.iterate(branches, step_size=step_size, library=library), with step_size in entries.
+    On a miss the columns are written to the cache while the chunks stream through, so memory stays bounded.
+    """
+    branches = list(branches)
+    if not ENABLED:
+        yield from tree.iterate(branches, step_size=step_size, library=library)
+        return
+
+    key = cache_key(tree.file.file_path, tree.object_path, branches)
+    arrays = _lookup(key, branches)
+    if arrays is not None:
+        for start in range(0, tree.num_entries, step_size):
+            yield _as_library({b: a[start:start + step_size] for b, a in arrays.items()}, branches, library, start)
+        return
+
+    _count("misses")
+    writer, cacheable, completed = None, True, False
+    try:
+        for chunk, report in tree.iterate(branches, step_size=step_size, library="np", report=True):
+            if writer is None and cacheable:
+                dtypes = _column_dtypes(chunk)
+                cacheable = dtypes is not None
+                if cacheable:
+                    writer = _open_writer(key, tree.file.file_path, tree.object_path, dtypes, tree.num_entries)
+            if writer is not None:
+                writer.write(report.tree_entry_start, chunk)
+            if not cacheable:
+                # Not a plain column: hand back uproot's own conversion
+                yield tree.arrays(branches, entry_start=report.tree_entry_start, entry_stop=report.tree_entry_stop, library=library)
+                continue
+            yield _as_library(chunk, branches, library, report.tree_entry_start)
+        completed = True
+    finally:
+        if writer is not None and completed:
+            writer.commit()
+        elif writer is not None:
+            writer.abort()
+
+def h5_columns(path, group="df"):
+    """Column names stored in a pandas fixed-format (or converted column-major) HDF5 file; no values are read."""
+    return h5_projection.column_names(path, group)
+
+def read_h5_columns(path, columns, group="df", library="np"):
+    """Cached, column-projected read of the given columns from a pandas fixed-format HDF5 file."""
+    columns = list(columns)
+    if not ENABLED:
+        return _as_library(h5_projection.read_columns(path, columns, group=group), columns, library)
+
+    key = cache_key(path, group, columns)
+    arrays = _lookup(key, columns)
+    if arrays is not None:
+        return _as_library(arrays, columns, library)
+
+    _count("misses")
+    arrays = h5_projection.read_columns(path, columns, group=group)
+    n_entries = len(arrays[columns[0]]) if columns else 0
+    writer = _open_writer(key, path, group, {c: arrays[c].dtype for c in columns}, n_entries)
+    if writer is not None:
+        writer.write(0, arrays)
+        writer.commit()
+    return _as_library(arrays, columns, library)
+
+def _entries():
+    """(last_used, size_in_bytes, path) of every published cache entry."""
+    entries = []
+    if not os.path.isdir(CACHE_DIR):
+        return entries
+    for name in os.listdir(CACHE_DIR):
+        entry = os.path.join(CACHE_DIR, name)
+        meta_path = os.path.join(entry, "meta.json")
+        if name.startswith(".") or not os.path.exists(meta_path):
+            continue
+        try:
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(meta_path), size, entry))
+        except OSError:
+            continue
+    return entries
+
+def evict(max_bytes=None):
+    """Removes least recently used entries until the cache is below max_bytes (default MAX_BYTES)."""
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    entries = sorted(_entries())
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in entries:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+        print(f"Feature cache: evicted {os.path.basename(entry)} ({size / 1024**2:.1f} MB)")
+
+def stats():
+    with _lock:
+        return dict(_stats)
+
+def report():
+    """Prints the cache hits and misses of this process (nothing if the cache is off)."""
+    if not ENABLED:
+        return
+    s = stats()
+    print(f"Feature cache ({CACHE_DIR}): {s['hits']} hits, {s['misses']} misses, "
+          f"{s['bytes_cached'] / 1024**2:.1f} MB mapped from cache, {s['bytes_written'] / 1024**2:.1f} MB written")
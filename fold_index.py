@@ -0,0 +1,105 @@
+"""
+Fold-index sidecars: a single copy of every sample instead of k-fold ntuple copies.
+kfold_split_trees.py --format index writes <sample>_folds.npz next to where the fold files would go. It holds
+the path of the original ntuple, its tree name and the fold block of every entry (int8). The train/validation/test
+views of a fold are read from the original sel_tree when they are needed, with the same events as the trees of
+<sample>_fold<N>.root:
+
+    fold N: test = block N-1, training = every other block, validation = block N % n_folds
+
+Readers and trainers go through read_fold_arrays / load_index and fall back to the fold files when a sample
+has no sidecar.
+"""
+import os
+import functools
+import numpy as np
+import uproot
+import stage_timing
+
+INDEX_SUFFIX = "_folds.npz"
+PARTS = ("test", "training", "validation")
+MAX_RANGES = 16
+
+def index_path(indir, sample):
+    return os.path.join(indir, f"{sample}{INDEX_SUFFIX}")
+
+def has_index(indir, sample):
+    return os.path.exists(index_path(indir, sample))
+
+def write_index(indir, sample, source, tree_name, block, n_folds):
+    """Writes the sidecar of sample: source file, tree name and the 0-based fold block of every entry."""
+    np.savez(index_path(indir, sample), source=np.array(os.path.abspath(source)), tree=np.array(tree_name),
+             block=np.asarray(block, dtype=np.int8), n_folds=np.array(n_folds))
+
+@functools.lru_cache(maxsize=None)
+def load_index(indir, sample):
+    """{'source', 'tree', 'block', 'n_folds'} of sample's sidecar."""
+    with np.load(index_path(indir, sample)) as f:
+        return {"source": str(f["source"]), "tree": str(f["tree"]), "block": f["block"], "n_folds": int(f["n_folds"])}
+
+def view_entries(block, fold, part, n_folds):
+    """Sorted sel_tree entries of the test / training / validation view of fold (1-based)."""
+    if part == "test":
+        mask = block == fold - 1
+    elif part == "training":
+        mask = block != fold - 1
+    elif part == "validation":
+        mask = block == fold % n_folds
+    else:
+        raise ValueError(f"unknown fold view '{part}', expected one of {PARTS}")
+    return np.flatnonzero(mask)
+
+def _ranges(entries):
+    """Contiguous [start, stop) runs of sorted entries."""
+    if len(entries) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(entries) != 1) + 1
+    starts = entries[np.concatenate([[0], breaks])]
+    stops = entries[np.concatenate([breaks - 1, [len(entries) - 1]])] + 1
+    return list(zip(starts.tolist(), stops.tolist()))
+
+def read_entries(tree, branches, entries):
+    """Arrays of branches at the given sorted entries; contiguous runs are read directly, scattered entries by span."""
+    ranges = _ranges(entries)
+    if not ranges:
+        return {b: np.empty(0, dtype=tree[b].interpretation.numpy_dtype) for b in branches}
+    if len(ranges) <= MAX_RANGES:
+        parts = [tree.arrays(branches, entry_start=start, entry_stop=stop, library="np") for start, stop in ranges]
+        return {b: np.concatenate([p[b] for p in parts]) for b in branches}
+    span = tree.arrays(branches, entry_start=ranges[0][0], entry_stop=ranges[-1][1], library="np")
+    return {b: span[b][entries - ranges[0][0]] for b in branches}
+
+def read_view(indir, sample, fold, part, branches):
+    """Arrays of branches in the test / training / validation view of fold, read from the original ntuple."""
+    index = load_index(indir, sample)
+    entries = view_entries(index["block"], fold, part, index["n_folds"])
+    with uproot.open(index["source"]) as f:
+        return read_entries(f[index["tree"]], list(branches), entries)
+
+def read_fold_arrays(indir, sample, fold, treename, input_vars, weight_branch="weight"):
+    """
+    (X float32, weights float64) of one fold view: from the sidecar if sample has one, otherwise from the
+    treename tree of <sample>_fold<fold>.root.
+    """
+    if not has_index(indir, sample):
+        from mva_batch import read_fold_arrays as read_fold_file
+        return read_fold_file(f"{indir}/{sample}_fold{fold}.root", treename, input_vars, weight_branch)
+    with stage_timing.stage("load"):
+        arrays = read_view(indir, sample, fold, treename, list(input_vars) + [weight_branch])
+        X = np.column_stack([arrays[v].astype(np.float32) for v in input_vars])
+    stage_timing.add_events("load", len(X))
+    return X, arrays[weight_branch].astype(np.float64)
+
+def open_fold_tree(indir, sample, fold, treename):
+    """
+    (TFile, TTree, entries) of one fold view for the ROOT event loops: sel_tree of the original ntuple and the
+    view's entries if sample has a sidecar, otherwise the treename tree of <sample>_fold<fold>.root and all its entries.
+    """
+    from ROOT import TFile
+    if has_index(indir, sample):
+        index = load_index(indir, sample)
+        rfile = TFile(index["source"], "READ")
+        return rfile, rfile.Get(index["tree"]), view_entries(index["block"], fold, treename, index["n_folds"])
+    rfile = TFile(f"{indir}/{sample}_fold{fold}.root", "READ")
+    ttree = rfile.Get(treename)
+    return rfile, ttree, range(ttree.GetEntries())
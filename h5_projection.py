@@ -0,0 +1,170 @@
+"""
+Column-projected reads of the pandas-HDF5 signal inputs (basicSel_mass_*.h5).
+pandas' fixed format stores a DataFrame as df/block{i}_items (column names) and df/block{i}_values
+(rows x columns, one block per dtype). Requested names are mapped to (block, offset) and only those
+columns are read, in row chunks. Files rewritten by convert() store every column as its own chunked,
+compressed dataset, which makes a projection a plain per-column read.
+
+Usage:
+    python h5_projection.py convert basicSel_mass_*.h5 --outdir converted/
+"""
+import os
+import argparse
+import numpy as np
+
+CHUNK_ROWS = 262144
+COLUMN_GROUP = "columns"
+
+def _is_columnar(hf):
+    return hf.attrs.get("layout") == "column-major" and COLUMN_GROUP in hf
+
+def column_map(hf, group="df"):
+    """{column name: (block index, offset within block)} of a pandas fixed-format group."""
+    mapping = {}
+    i = 0
+    while f"{group}/block{i}_items" in hf:
+        for offset, name in enumerate(hf[f"{group}/block{i}_items"][:]):
+            mapping[name.decode() if isinstance(name, bytes) else str(name)] = (i, offset)
+        i += 1
+    return mapping
+
+def _n_rows(hf, group):
+    if _is_columnar(hf):
+        return int(hf.attrs["n_rows"])
+    return hf[f"{group}/block0_values"].shape[0] if f"{group}/block0_values" in hf else 0
+
+def column_names(path, group="df"):
+    """Column names of a pandas fixed-format or converted file, without reading any values."""
+    import h5py
+    with h5py.File(path, "r") as hf:
+        if _is_columnar(hf):
+            return [c.decode() if isinstance(c, bytes) else str(c) for c in hf.attrs["columns"]]
+        return list(column_map(hf, group))
+
+def iter_columns(path, columns, chunk_rows=CHUNK_ROWS, group="df", dtype=np.float32):
+    """
+    Yields (rows, len(columns)) arrays of the requested columns, chunk_rows rows at a time, in the given
+    column order. dtype=None keeps the stored dtype (which must then be common to all columns).
+    Raises KeyError for a column the file does not have.
+    """
+    import h5py
+    columns = list(columns)
+    with h5py.File(path, "r") as hf:
+        n_rows = _n_rows(hf, group)
+        if _is_columnar(hf):
+            datasets = [hf[f"{COLUMN_GROUP}/{c}"] if c in hf[COLUMN_GROUP] else None for c in columns]
+            missing = [c for c, d in zip(columns, datasets) if d is None]
+            if missing:
+                raise KeyError(f"{path}: columns {missing} not found")
+            out_dtype = dtype or np.result_type(*[d.dtype for d in datasets])
+            for start in range(0, n_rows, chunk_rows):
+                stop = min(start + chunk_rows, n_rows)
+                out = np.empty((stop - start, len(columns)), dtype=out_dtype)
+                for j, d in enumerate(datasets):
+                    out[:, j] = d[start:stop]
+                yield out
+            return
+
+        mapping = column_map(hf, group)
+        missing = [c for c in columns if c not in mapping]
+        if missing:
+            raise KeyError(f"{path}: columns {missing} not found")
+        # Per block: the sorted offsets to read (h5py needs increasing indices) and where they go in the output
+        by_block = {}
+        for j, c in enumerate(columns):
+            block, offset = mapping[c]
+            by_block.setdefault(block, []).append((offset, j))
+        selections = []
+        for block, pairs in sorted(by_block.items()):
+            pairs.sort()
+            selections.append((hf[f"{group}/block{block}_values"], [o for o, _ in pairs], [j for _, j in pairs]))
+        out_dtype = dtype or np.result_type(*[values.dtype for values, _, _ in selections])
+        for start in range(0, n_rows, chunk_rows):
+            stop = min(start + chunk_rows, n_rows)
+            out = np.empty((stop - start, len(columns)), dtype=out_dtype)
+            for values, offsets, targets in selections:
+                out[:, targets] = values[start:stop, offsets]
+            yield out
+
+def read_columns(path, columns, chunk_rows=CHUNK_ROWS, group="df"):
+    """{column: 1D array} of the requested columns with their stored dtypes, read as a projection."""
+    import h5py
+    columns = list(columns)
+    with h5py.File(path, "r") as hf:
+        if _is_columnar(hf):
+            dtypes = {c: hf[f"{COLUMN_GROUP}/{c}"].dtype for c in columns if c in hf[COLUMN_GROUP]}
+        else:
+            mapping = column_map(hf, group)
+            dtypes = {c: hf[f"{group}/block{mapping[c][0]}_values"].dtype for c in columns if c in mapping}
+        n_rows = _n_rows(hf, group)
+    missing = [c for c in columns if c not in dtypes]
+    if missing:
+        raise KeyError(f"{path}: columns {missing} not found")
+
+    out = {c: np.empty(n_rows, dtype=dtypes[c]) for c in columns}
+    # Columns sharing a dtype are read together so each block is visited once per chunk
+    for dtype in set(dtypes.values()):
+        same = [c for c in columns if dtypes[c] == dtype]
+        start = 0
+        for chunk in iter_columns(path, same, chunk_rows, group, dtype=None):
+            for j, c in enumerate(same):
+                out[c][start:start + len(chunk)] = chunk[:, j]
+            start += len(chunk)
+    return out
+
+def convert(src, dst, chunk_rows=65536, compression="gzip", compression_opts=4, group="df"):
+    """Rewrites a pandas fixed-format file as one chunked, compressed dataset per column. Returns the row count."""
+    import h5py
+    with h5py.File(src, "r") as hf_in:
+        mapping = column_map(hf_in, group)
+        n_rows = _n_rows(hf_in, group)
+        blocks = {}
+        for name, (block, _) in mapping.items():
+            blocks.setdefault(block, []).append(name)
+        tmp = dst + ".tmp"
+        with h5py.File(tmp, "w") as hf_out:
+            hf_out.attrs["layout"] = "column-major"
+            hf_out.attrs["n_rows"] = n_rows
+            hf_out.attrs["columns"] = list(mapping)
+            hf_out.attrs["source"] = os.path.abspath(src)
+            out_group = hf_out.create_group(COLUMN_GROUP)
+            for block, names in sorted(blocks.items()):
+                values = hf_in[f"{group}/block{block}_values"]
+                datasets = {
+                    name: out_group.create_dataset(
+                        name, shape=(n_rows,), dtype=values.dtype,
+                        chunks=(max(1, min(chunk_rows, n_rows)),) if n_rows else None,
+                        compression=compression if n_rows else None,
+                        compression_opts=compression_opts if n_rows else None,
+                        shuffle=bool(n_rows),
+                    )
+                    for name in names
+                }
+                offsets = [mapping[name][1] for name in names]
+                # Row chunks of the whole block: one sequential read, then scattered into the column datasets
+                for start in range(0, n_rows, chunk_rows):
+                    stop = min(start + chunk_rows, n_rows)
+                    chunk = values[start:stop]
+                    for name, offset in zip(names, offsets):
+                        datasets[name][start:stop] = chunk[:, offset]
+    os.replace(tmp, dst)
+    return n_rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Column-projected access to pandas-HDF5 ntuples.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    conv = sub.add_parser("convert", help="Rewrite files into the chunked, compressed column-major layout")
+    conv.add_argument("files", nargs="+")
+    conv.add_argument("--outdir", required=True)
+    conv.add_argument("--chunk-rows", type=int, default=65536)
+    conv.add_argument("--level", type=int, default=4, help="gzip compression level")
+    args = parser.parse_args()
+
+    os.makedirs(args.outdir, exist_ok=True)
+    for path in args.files:
+        dst = os.path.join(args.outdir, os.path.basename(path))
+        if os.path.abspath(dst) == os.path.abspath(path):
+            print(f"FATAL: refusing to overwrite {path} in place")
+            raise SystemExit(1)
+        n_rows = convert(path, dst, chunk_rows=args.chunk_rows, compression_opts=args.level)
+        print(f"Converted {path} -> {dst} ({n_rows} rows, {os.path.getsize(path) / 1024**2:.1f} MB -> {os.path.getsize(dst) / 1024**2:.1f} MB)")
@@ -0,0 +1,338 @@
+"""
+Adaptive hyperparameter sweep over the --hp strings of TMVA_DNN.py (l1_l2_l3[_l4]_lr_epochs_bs) and
+TMVA_BDT.py (ntrees_depth_minnode_lr).
+
+The space is expanded into hp strings (full grid or a random subset). One fold of the k-fold ntuples is loaded
+and standardised once and stored as .npy files that every trial process memory-maps. Trials run concurrently
+and report the weighted AUC on the fold's held-out test events (the block left out of its training tree; the
+fold's validation tree overlaps the training tree) at rungs of growing budget (epochs for the DNN, trees for the BDT).
+Asynchronous successive halving (ASHA) stops a trial at a rung if it is not in the top 1/eta of the results
+already recorded there. Trials and rung results live in a sqlite database, so an interrupted sweep resumes
+where it stopped.
+
+DNN trials build the TMVA_DNN.py Keras model. BDT trials use scikit-learn's histogram gradient boosting with the
+same trees/depth/min-node/shrinkage as a stand-in for TMVA's BDT, which cannot be trained incrementally in
+process; the winners are then trained with TMVA_BDT.py as usual.
+
+    python hp_sweep.py --method DNN --space 416,256 160,320 416 480 0.0001,0.001 100 128 --workers 4
+    python hp_sweep.py --method BDT --space 300,600 6,10 1,2.5 0.01,0.1 --mode random --n-trials 8
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import itertools
+import numpy as np
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sklearn.metrics import roc_auc_score
+
+SAMPLES = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "ttbar", "singletop", "znunu", "diboson", "dijet", "wlnu", "zll"]
+DEFAULT_SPACES = {
+    "DNN": ["416,256", "160,320", "416", "480", "0.0001,0.001", "100", "128"],
+    "BDT": ["300,600", "6,10", "1,2.5", "0.01,0.1"],
+}
+
+# --- Search space ---
+
+def parse_space(positions):
+    """['416,256', '160', ...] -> [['416', '256'], ['160'], ...]: the choices for every position of the hp string."""
+    return [p.split(",") for p in positions]
+
+def expand_grid(space):
+    return ["_".join(values) for values in itertools.product(*space)]
+
+def sample_space(space, n_trials, seed=0):
+    """n_trials distinct hp strings drawn uniformly from the grid (all of it if it is smaller)."""
+    grid = expand_grid(space)
+    if n_trials >= len(grid):
+        return grid
+    rng = np.random.default_rng(seed)
+    return [grid[i] for i in sorted(rng.choice(len(grid), size=n_trials, replace=False))]
+
+def max_resource(method, hp):
+    """Full budget of a trial: the epochs of a DNN string, the number of trees of a BDT string."""
+    parts = hp.split("_")
+    if method == "DNN":
+        if len(parts) not in (6, 7):
+            raise ValueError(f"DNN hp string {hp} must have 6 or 7 parts")
+        return int(parts[-2])
+    if len(parts) != 4:
+        raise ValueError(f"BDT hp string {hp} must have 4 parts")
+    return int(parts[0])
+
+def rung_resources(max_r, eta=3, n_rungs=3):
+    """Budgets at which a trial is compared with the others: max_r / eta^(n_rungs-1), ..., max_r / eta, max_r."""
+    resources = [max(1, int(round(max_r / eta ** (n_rungs - 1 - k)))) for k in range(n_rungs)]
+    return sorted(set(resources))
+
+# --- Results database ---
+
+def connect(db_path):
+    db = sqlite3.connect(db_path, timeout=120, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("""CREATE TABLE IF NOT EXISTS trials (
+        hp TEXT PRIMARY KEY, status TEXT NOT NULL, best_auc REAL, resource INTEGER,
+        seconds REAL, started REAL, finished REAL, error TEXT)""")
+    db.execute("""CREATE TABLE IF NOT EXISTS rungs (
+        hp TEXT NOT NULL, rung INTEGER NOT NULL, resource INTEGER NOT NULL, auc REAL NOT NULL,
+        PRIMARY KEY (hp, rung))""")
+    db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    return db
+
+def check_config(db, config):
+    """Stores the sweep configuration, or checks that a resumed sweep uses the same one. Returns False on a mismatch."""
+    row = db.execute("SELECT value FROM meta WHERE key='config'").fetchone()
+    if row is None:
+        db.execute("INSERT INTO meta VALUES ('config', ?)", (json.dumps(config, sort_keys=True),))
+        return True
+    stored = json.loads(row[0])
+    if stored != config:
+        print(f"FATAL: the results database was written by a different sweep configuration:\n  stored:  {stored}\n  current: {config}")
+        return False
+    return True
+
+def record_rung(db, hp, rung, resource, auc, eta):
+    """
+    Records the trial's AUC at a rung and returns True if ASHA stops it there: its AUC is below the
+    (1 - 1/eta) quantile of the AUCs other trials recorded at the same rung before it.
+    """
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        recorded = [r[0] for r in db.execute("SELECT auc FROM rungs WHERE rung=? AND hp!=?", (rung, hp))]
+        db.execute("INSERT OR REPLACE INTO rungs VALUES (?, ?, ?, ?)", (hp, rung, resource, auc))
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    if not recorded:
+        return False
+    return auc < np.percentile(recorded, (1 - 1 / eta) * 100)
+
+# --- Shared fold data ---
+
+def prepare_data(indir, samples, fold, input_vars, data_dir):
+    """
+    Loads the training and test trees of <sample>_fold<fold>.root once, standardises them with a scaler
+    fitted on the training events and writes X/y/w_{train,test}.npy to data_dir. The test tree is the one block
+    not in the training tree, so trials are scored on events they were not trained on. Training weights are |weight|
+    rescaled so that both classes have the signal event count (TMVA's NormMode=EqualNumEvents).
+    """
+    import uproot
+    import feature_cache
+    from sklearn.preprocessing import StandardScaler
+
+    parts = {"train": ([], [], []), "test": ([], [], [])}
+    for sample in samples:
+        rfilename = f"{indir}/{sample}_fold{fold}.root"
+        print("reading", rfilename)
+        with uproot.open(rfilename) as f:
+            for treename, part in (("training", "train"), ("test", "test")):
+                arrays = feature_cache.tree_arrays(f[treename], input_vars + ["weight"], library="np")
+                n = len(arrays["weight"])
+                parts[part][0].append(np.column_stack([arrays[v] for v in input_vars]).astype(np.float32))
+                parts[part][1].append(np.full(n, 1 if "sT" in sample else 0, dtype=np.int64))
+                parts[part][2].append(np.abs(arrays["weight"]).astype(np.float32))
+
+    data = {part: tuple(np.concatenate(a) for a in arrays) for part, arrays in parts.items()}
+    X_train, y_train, w_train = data["train"]
+    n_sig = int((y_train == 1).sum())
+    for label in (0, 1):
+        sel = y_train == label
+        if w_train[sel].sum() > 0:
+            w_train[sel] *= n_sig / w_train[sel].sum()
+
+    scaler = StandardScaler().fit(X_train)
+    os.makedirs(data_dir, exist_ok=True)
+    for part, (X, y, w) in data.items():
+        np.save(os.path.join(data_dir, f"X_{part}.npy"), scaler.transform(X).astype(np.float32))
+        np.save(os.path.join(data_dir, f"y_{part}.npy"), y)
+        np.save(os.path.join(data_dir, f"w_{part}.npy"), w)
+    print(f"Prepared fold {fold}: {len(y_train)} training / {len(data['test'][1])} held-out test events in {data_dir}")
+
+def load_data(data_dir):
+    return {
+        part: tuple(np.load(os.path.join(data_dir, f"{name}_{part}.npy"), mmap_mode="r") for name in ("X", "y", "w"))
+        for part in ("train", "test")
+    }
+
+# --- Trials ---
+
+def _build_dnn(hp, n_inputs, acti, optim):
+    """The TMVA_DNN.py model for an hp string (legacy optimizer decay=1e-4 as an inverse-time schedule)."""
+    import tensorflow as tf
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras import layers
+    from tensorflow.keras.layers import LeakyReLU, BatchNormalization
+    from tensorflow.keras.regularizers import l2
+
+    parts = hp.split("_")
+    widths, learnrate = [int(p) for p in parts[:-3]], float(parts[-3])
+    stack = [layers.Input(shape=(n_inputs,))]
+    for width in widths:
+        activation = 'relu' if acti == "relu" else LeakyReLU()
+        stack += [layers.Dense(width, activation=activation, kernel_regularizer=l2()), BatchNormalization()]
+    stack.append(layers.Dense(2, activation='softmax', kernel_regularizer=l2()))
+    model = Sequential(stack)
+
+    schedule = tf.keras.optimizers.schedules.InverseTimeDecay(learnrate, decay_steps=1, decay_rate=0.0001)
+    opti = tf.keras.optimizers.SGD(learning_rate=schedule) if optim == "SGD" else tf.keras.optimizers.Adam(learning_rate=schedule)
+    model.compile(loss="sparse_categorical_crossentropy", optimizer=opti)
+    return model
+
+def _dnn_stages(hp, data, resources, acti, optim, seed):
+    """Yields (resource, held-out AUC) after training the DNN up to every rung's number of epochs."""
+    import tensorflow as tf
+    tf.keras.utils.set_random_seed(seed)
+    X_tr, y_tr, w_tr = data["train"]
+    X_va, y_va, w_va = data["test"]
+    batch_size = int(hp.split("_")[-1])
+    model = _build_dnn(hp, X_tr.shape[1], acti, optim)
+    done = 0
+    for resource in resources:
+        model.fit(np.asarray(X_tr), np.asarray(y_tr), sample_weight=np.asarray(w_tr), epochs=resource,
+                  initial_epoch=done, batch_size=batch_size, shuffle=True, verbose=0)
+        done = resource
+        scores = model.predict(np.asarray(X_va), batch_size=8192, verbose=0)[:, 1]
+        yield resource, roc_auc_score(y_va, scores, sample_weight=w_va)
+
+def _bdt_stages(hp, data, resources, seed):
+    """Yields (resource, held-out AUC) after boosting up to every rung's number of trees."""
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    _, depth, min_node, learnrate = hp.split("_")
+    X_tr, y_tr, w_tr = data["train"]
+    X_va, y_va, w_va = data["test"]
+    model = HistGradientBoostingClassifier(
+        max_depth=int(depth), max_leaf_nodes=None, learning_rate=float(learnrate),
+        min_samples_leaf=max(1, int(float(min_node) / 100 * len(y_tr))),
+        early_stopping=False, warm_start=True, random_state=seed,
+    )
+    for resource in resources:
+        model.set_params(max_iter=resource)
+        model.fit(X_tr, y_tr, sample_weight=w_tr)
+        yield resource, roc_auc_score(y_va, model.predict_proba(X_va)[:, 1], sample_weight=w_va)
+
+def _init_worker(method, threads):
+    if method == "DNN":
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+def run_trial(db_path, data_dir, method, hp, eta, n_rungs, acti, optim, seed):
+    """Runs one trial through its rungs; returns (hp, status, best_auc, resource, seconds). Runs in a worker process."""
+    db = connect(db_path)
+    start = time.perf_counter()
+    db.execute("UPDATE trials SET status='running', started=? WHERE hp=?", (time.time(), hp))
+    data = load_data(data_dir)
+    resources = rung_resources(max_resource(method, hp), eta, n_rungs)
+    stages = _dnn_stages(hp, data, resources, acti, optim, seed) if method == "DNN" else _bdt_stages(hp, data, resources, seed)
+
+    status, best_auc, reached = "complete", float("-inf"), 0
+    for rung, (resource, auc) in enumerate(stages):
+        best_auc, reached = max(best_auc, auc), resource
+        print(f"  {hp}: rung {rung} ({resource}) AUC={auc:.4f}", flush=True)
+        if record_rung(db, hp, rung, resource, auc, eta) and rung < len(resources) - 1:
+            status = "pruned"
+            break
+
+    seconds = time.perf_counter() - start
+    db.execute("UPDATE trials SET status=?, best_auc=?, resource=?, seconds=?, finished=?, error=NULL WHERE hp=?",
+               (status, best_auc, reached, seconds, time.time(), hp))
+    db.close()
+    return hp, status, best_auc, reached, seconds
+
+# --- Sweep driver ---
+
+def sweep(method, hps, sweep_dir, indir, fold, samples, workers, threads, eta=3, n_rungs=3,
+          acti="leakyrelu", optim="Adam", seed=42, retry_failed=False):
+    """Runs (or resumes) a sweep over hps and returns the leaderboard rows (hp, status, best_auc, resource)."""
+    import Reader_BDT
+    import Reader_DNN
+    input_vars = (Reader_DNN if method == "DNN" else Reader_BDT).INPUT_VARS
+    for hp in hps:
+        max_resource(method, hp)
+
+    os.makedirs(sweep_dir, exist_ok=True)
+    db_path = os.path.join(sweep_dir, "results.sqlite")
+    data_dir = os.path.join(sweep_dir, "data")
+    db = connect(db_path)
+    config = {"method": method, "indir": os.path.abspath(indir), "fold": fold, "samples": list(samples),
+              "eta": eta, "n_rungs": n_rungs, "acti": acti, "optim": optim, "seed": seed}
+    if not check_config(db, config):
+        return None
+
+    # Interrupted trials start over: their partial rung results would bias the cutoffs
+    interrupted = [r[0] for r in db.execute("SELECT hp FROM trials WHERE status='running'")]
+    for hp in interrupted:
+        db.execute("DELETE FROM rungs WHERE hp=?", (hp,))
+        db.execute("UPDATE trials SET status='pending' WHERE hp=?", (hp,))
+    if interrupted:
+        print(f"Resuming: {len(interrupted)} interrupted trials will be rerun")
+    db.executemany("INSERT OR IGNORE INTO trials (hp, status) VALUES (?, 'pending')", [(hp,) for hp in hps])
+    wanted = ("pending", "failed") if retry_failed else ("pending",)
+    todo = [hp for hp in hps if db.execute("SELECT status FROM trials WHERE hp=?", (hp,)).fetchone()[0] in wanted]
+    print(f"{len(hps)} trials in the sweep, {len(todo)} to run")
+
+    if todo and not os.path.exists(os.path.join(data_dir, "y_test.npy")):
+        prepare_data(indir, samples, fold, input_vars, data_dir)
+
+    if todo:
+        workers = workers or 1
+        threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        for var in ("OMP_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"):
+            os.environ[var] = str(threads)
+        os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+        print(f"Running {len(todo)} trials on {workers} workers x {threads} threads (eta={eta}, {n_rungs} rungs)")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(method, threads)) as pool:
+            futures = {pool.submit(run_trial, db_path, data_dir, method, hp, eta, n_rungs, acti, optim, seed): hp for hp in todo}
+            for future in as_completed(futures):
+                hp = futures[future]
+                try:
+                    _, status, best_auc, resource, seconds = future.result()
+                except Exception as e:
+                    print(f"WARNING: trial {hp} failed: {e}")
+                    db.execute("UPDATE trials SET status='failed', error=? WHERE hp=?", (str(e), hp))
+                    continue
+                print(f"{hp}: {status} at {resource} with best AUC {best_auc:.4f} ({seconds:.0f} s)")
+
+    rows = db.execute("SELECT hp, status, best_auc, resource FROM trials WHERE hp IN ({}) ORDER BY best_auc DESC".format(
+        ",".join("?" * len(hps))), hps).fetchall()
+    db.close()
+    print(f"\n{'hp':<40}{'status':>10}{'budget':>8}{'best AUC':>10}")
+    for hp, status, best_auc, resource in rows:
+        auc_str = f"{best_auc:.4f}" if best_auc is not None else "-"
+        print(f"{hp:<40}{status:>10}{resource if resource is not None else '-':>8}{auc_str:>10}")
+    complete = [r for r in rows if r[1] == "complete"]
+    if complete:
+        script = "TMVA_DNN.py" if method == "DNN" else "TMVA_BDT.py"
+        print(f"\nBest complete trial: python {script} --hp {complete[0][0]}")
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Adaptive (ASHA) hyperparameter sweep over TMVA --hp strings.")
+    parser.add_argument("--method", choices=["DNN", "BDT"], default="DNN")
+    parser.add_argument("--space", nargs="+", help="Comma-separated choices for every position of the hp string")
+    parser.add_argument("--mode", choices=["grid", "random"], default="grid")
+    parser.add_argument("--n-trials", type=int, default=20, help="Trials drawn in random mode")
+    parser.add_argument("--sweep-dir", default="sweep", help="Holds the results database and the shared fold data")
+    parser.add_argument("--indir", default="/eos/user/m/minlin/monobc/MLinputs/")
+    parser.add_argument("--fold", type=int, default=1)
+    parser.add_argument("--samples", nargs="+", default=SAMPLES)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 4))
+    parser.add_argument("--threads", type=int, help="Threads per trial (default: cores / workers)")
+    parser.add_argument("--eta", type=int, default=3, help="ASHA reduction factor")
+    parser.add_argument("--rungs", type=int, default=3)
+    parser.add_argument("--acti", default="leakyrelu")
+    parser.add_argument("--opt", default="Adam")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--retry-failed", action="store_true")
+    args = parser.parse_args()
+
+    space = parse_space(args.space or DEFAULT_SPACES[args.method])
+    hps = expand_grid(space) if args.mode == "grid" else sample_space(space, args.n_trials, args.seed)
+    rows = sweep(args.method, hps, args.sweep_dir, args.indir, args.fold, args.samples, args.workers, args.threads,
+                 args.eta, args.rungs, args.acti, args.opt, args.seed, args.retry_failed)
+    sys.exit(0 if rows else 1)
@@ -1,75 +1,136 @@
-import ROOT
 import os
+import time
+import argparse
+import numpy as np
+import uproot
+import stage_timing
+import fold_index
+from concurrent.futures import ProcessPoolExecutor
 
-def split_ttree(input_file, tree_name, output_dir, region, sample_name, n_splits=5):
-    """Splits a TTree into n_splits parts for cross-validation and writes test and training TTrees to separate files."""
-    file_in = ROOT.TFile.Open(input_file, "READ")
-    if not file_in or file_in.IsZombie():
+def fold_boundaries(n_entries, n_splits=5):
+    """Entry offsets of the n_splits contiguous folds; the first n_entries % n_splits folds get one extra entry."""
+    sizes = np.full(n_splits, n_entries // n_splits, dtype=np.int64)
+    sizes[:n_entries % n_splits] += 1
+    return np.concatenate([[0], np.cumsum(sizes)])
+
+def split_ttree(input_file, tree_name, output_dir, region, sample_name, n_splits=5, step_size="100 MB"):
+    """
+    Splits a TTree into n_splits parts for cross-validation and writes test, training and validation TTrees
+    for every fold to separate files. The input is read once, in chunks, and the fold assignment is columnar.
+    Returns the number of entries processed.
+    """
+    if not os.path.exists(input_file):
         print(f"Error: Could not open input file {input_file}")
-        return
+        return 0
 
-    tree = file_in.Get(tree_name)
-    if not tree:
-        print(f"Error: Could not find TTree named {tree_name} in file {input_file}")
-        return
+    with uproot.open(input_file) as file_in:
+        if tree_name not in file_in:
+            print(f"Error: Could not find TTree named {tree_name} in file {input_file}")
+            return 0
+        tree = file_in[tree_name]
+        n_entries = tree.num_entries
+        if n_entries == 0:
+            print(f"Warning: TTree {tree_name} in {input_file} is empty, writing empty folds")
 
-    n_entries = tree.GetEntries()
-    entries_per_split = n_entries // n_splits
-    remainder = n_entries % n_splits
+        # Calculate the index ranges for the splits
+        bounds = fold_boundaries(n_entries, n_splits)
 
-    # Calculate the index ranges for the splits
-    indices = []
-    start = 0
-    for i in range(n_splits):
-        end = start + entries_per_split + (1 if i < remainder else 0)
-        indices.append(range(start, end))
-        start = end
+        output_files = [
+            uproot.recreate(os.path.join(output_dir, f"{sample_name}_fold{fold + 1}.root"))
+            for fold in range(n_splits)
+        ]
+        try:
+            # mktree keeps the outputs TTrees (plain assignment writes RNTuples in recent uproot); the trees are
+            # created up front so that empty samples still give valid, empty test/training/validation trees
+            branch_types = {branch: tree[branch].interpretation.numpy_dtype for branch in tree.typenames()}
+            out_trees = [
+                {name: file_out.mktree(name, branch_types) for name in ("test", "training", "validation")}
+                for file_out in output_files
+            ]
+            chunks = tree.iterate(step_size=step_size, library="np", report=True)
+            for chunk, report in stage_timing.timed_iter("load", chunks, count=lambda item: item[1].tree_entry_stop - item[1].tree_entry_start):
+                entry = np.arange(report.tree_entry_start, report.tree_entry_stop)
+                fold_of = np.searchsorted(bounds, entry, side="right") - 1
 
-    for fold in range(n_splits):
-        test_indices = set(indices[fold])  # Current fold's test set indices
-        remove_indices = set(indices[(fold + 1) % n_splits])  # Remove the next fold's indices
+                with stage_timing.stage("write", len(entry)):
+                    for fold in range(n_splits):
+                        test_mask = fold_of == fold  # Current fold's test set
+                        selections = {
+                            "test": test_mask,
+                            "training": ~test_mask,
+                            "validation": fold_of == (fold + 1) % n_splits,  # The next fold's entries
+                        }
+                        for out_tree, mask in selections.items():
+                            if mask.any():
+                                out_trees[fold][out_tree].extend({branch: values[mask] for branch, values in chunk.items()})
+        finally:
+            for file_out in output_files:
+                file_out.close()
 
-        # Define the output file for this fold
+    for fold in range(n_splits):
         output_file = os.path.join(output_dir, f"{sample_name}_fold{fold + 1}.root")
-        file_out = ROOT.TFile(output_file, "RECREATE")
+        print(f"Fold {fold + 1}: Saved test and training TTrees for sample {sample_name} to {output_file}")
+    return n_entries
 
-        # Create TTrees for test and training
-        test_tree = tree.CloneTree(0)
-        test_tree.SetName("test")
-        training_tree = tree.CloneTree(0)
-        training_tree.SetName("training")
-        val_tree = tree.CloneTree(0)
-        val_tree.SetName("validation")
+def write_fold_index(input_file, tree_name, output_dir, sample_name, n_splits=5):
+    """
+    Writes the fold-index sidecar of a sample (fold_index.py) instead of fold files: the same fold assignment
+    as split_ttree, but no event is copied. Returns the number of entries indexed.
+    """
+    if not os.path.exists(input_file):
+        print(f"Error: Could not open input file {input_file}")
+        return 0
 
-        # Fill the test and training TTrees
-        for i in range(n_entries):
-            tree.GetEntry(i)
-            if i in remove_indices:
-                val_tree.Fill()
-            if i in test_indices:
-                test_tree.Fill()
-            else:
-                training_tree.Fill()
+    with uproot.open(input_file) as file_in:
+        if tree_name not in file_in:
+            print(f"Error: Could not find TTree named {tree_name} in file {input_file}")
+            return 0
+        n_entries = file_in[tree_name].num_entries
 
-        # Write TTrees to the output file
-        file_out.cd()
-        test_tree.Write()
-        training_tree.Write()
-        val_tree.Write()
-        file_out.Close()
+    bounds = fold_boundaries(n_entries, n_splits)
+    block = np.repeat(np.arange(n_splits, dtype=np.int8), np.diff(bounds))
+    fold_index.write_index(output_dir, sample_name, input_file, tree_name, block, n_splits)
+    print(f"Saved fold index of sample {sample_name} ({n_entries} entries, {n_splits} folds) to {fold_index.index_path(output_dir, sample_name)}")
+    return n_entries
 
-        print(f"Fold {fold + 1}: Saved test and training TTrees for sample {sample_name} to {output_file}")
+def _split_sample(job):
+    """Worker entry point: splits (or indexes) one sample and returns (sample, entries, seconds)."""
+    sample, input_file, tree_name, output_dir, region, n_splits, step_size, fmt = job
+    start = time.perf_counter()
+    if fmt == "index":
+        n_entries = write_fold_index(input_file, tree_name, output_dir, sample, n_splits)
+    else:
+        n_entries = split_ttree(input_file, tree_name, output_dir, region, sample, n_splits, step_size)
+    return sample, n_entries, time.perf_counter() - start
+
+if __name__ == "__main__":
+    # Configuration
+    samples = ["dijet", "singletop", "diboson", "ttbar", "znunu", "wlnu", "zll", "sT_bC1_1000_202_200", "sT_bC1_1000_102_100"]
+    region = "SR"
+    tree_name = "sel_tree"
+    output_dir = f"/eos/user/m/minlin/monobc/MLinputs/"
 
-    file_in.Close()
+    parser = argparse.ArgumentParser(description="Split sel_tree of every sample into k-fold test/training/validation trees.")
+    parser.add_argument("--workers", type=int, default=min(len(samples), os.cpu_count() or 1), help="Number of samples processed in parallel")
+    parser.add_argument("--step-size", default="100 MB", help="Chunk size for reading sel_tree (entries or e.g. '100 MB')")
+    parser.add_argument("--n-splits", type=int, default=5)
+    parser.add_argument("--format", choices=["trees", "index"], default="trees",
+                        help="'trees': per-fold test/training/validation files; 'index': one <sample>_folds.npz sidecar per sample, read by the loaders from sel_tree")
+    args = parser.parse_args()
+    step_size = int(args.step_size) if args.step_size.isdigit() else args.step_size
 
-# Configuration
-samples = ["dijet", "singletop", "diboson", "ttbar", "znunu", "wlnu", "zll", "sT_bC1_1000_202_200", "sT_bC1_1000_102_100"]
-region = "SR"
-tree_name = "sel_tree"
-output_dir = f"/eos/user/m/minlin/monobc/MLinputs/"
+    jobs = []
+    for sample in samples:
+        input_file = f"/afs/cern.ch/work/m/minlin/private/bcoffea_run3/tbc1_untag/all/{sample}/basicSel_{sample}.root"
+        print(f"Processing sample {sample}...")
+        jobs.append((sample, input_file, tree_name, output_dir, region, args.n_splits, step_size, args.format))
 
-# Loop over samples
-for sample in samples:
-    input_file = f"/afs/cern.ch/work/m/minlin/private/bcoffea_run3/tbc1_untag/all/{sample}/basicSel_{sample}.root"
-    print(f"Processing sample {sample}...")
-    split_ttree(input_file, tree_name, output_dir, region, sample)
+    # Loop over samples in parallel
+    total_entries, wall_start = 0, time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for sample, n_entries, seconds in pool.map(_split_sample, jobs):
+            total_entries += n_entries
+            rate = n_entries / seconds if seconds > 0 else 0.0
+            print(f"Sample {sample}: {n_entries} events in {seconds:.1f} s ({rate:,.0f} events/s)")
+    wall = time.perf_counter() - wall_start
+    print(f"Split {total_entries} events from {len(samples)} samples in {wall:.1f} s ({total_entries / wall if wall > 0 else 0.0:,.0f} events/s)")
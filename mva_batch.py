@@ -0,0 +1,207 @@
+"""
+ROOT-free, batched evaluation of the TMVA-trained BDT and PyKeras DNN weights used by Reader_BDT.py / Reader_DNN.py.
+A fold's tree is read as columns, scored in one vectorized call and filled into a TH1-compatible histogram.
+"""
+import os
+import functools
+import xml.etree.ElementTree as ET
+import numpy as np
+import uproot
+import stage_timing
+
+def read_fold_arrays(path, treename, input_vars, weight_branch="weight"):
+    """Reads input_vars (as a float32 matrix in that column order) and the event weights from one fold tree."""
+    with stage_timing.stage("load"), uproot.open(path) as f:
+        arrays = f[treename].arrays(list(input_vars) + [weight_branch], library="np")
+        X = np.column_stack([arrays[v].astype(np.float32) for v in input_vars])
+    stage_timing.add_events("load", len(X))
+    return X, arrays[weight_branch].astype(np.float64)
+
+def _method_setup(xml_path):
+    root = ET.parse(xml_path).getroot()
+    options = {o.get("name"): (o.text or "").strip() for o in root.iter("Option")}
+    variables = sorted(root.find("Variables").findall("Variable"), key=lambda v: int(v.get("VarIndex")))
+    transformations = root.find("Transformations")
+    if transformations is not None and int(transformations.get("NTransformations", "0")) > 0:
+        raise NotImplementedError(f"{xml_path}: input variable transformations are not supported in batch mode")
+    return root, options, [v.get("Expression") for v in variables]
+
+class TMVABDT:
+    """
+    Vectorized evaluator for a TMVA BDT weights file (MethodBDT::GetMvaValue).
+    Every tree is flattened into node arrays and all trees are walked for a block of events at once.
+    """
+
+    def __init__(self, xml_path, block_size=20000):
+        root, options, self.variables = _method_setup(xml_path)
+        self.block_size = block_size
+        self.boost_type = options.get("BoostType", "AdaBoost")
+        self.use_yes_no_leaf = options.get("UseYesNoLeaf", "True").lower() in ("true", "t", "1")
+
+        var, cut, cut_type, left, right, value = [], [], [], [], [], []
+        roots, boost_weights, max_depth = [], [], 0
+
+        def add_node(node, depth):
+            nonlocal max_depth
+            if int(node.get("NCoef", "0")) > 0:
+                raise NotImplementedError(f"{xml_path}: Fisher cuts are not supported in batch mode")
+            idx = len(var)
+            var.append(max(int(node.get("IVar", "0")), 0))
+            cut.append(float(node.get("Cut", "0")))
+            cut_type.append(int(node.get("cType", "1")) == 1)
+            left.append(idx)
+            right.append(idx)
+            node_type = int(node.get("nType", "0"))
+            if self.boost_type == "Grad":
+                value.append(float(node.get("res", "0")))
+            elif self.use_yes_no_leaf:
+                value.append(float(node_type))
+            else:
+                value.append(float(node.get("purity", "0")))
+            children = {child.get("pos"): child for child in node.findall("Node")}
+            if node_type == 0 and children:
+                left[idx] = add_node(children["l"], depth + 1)
+                right[idx] = add_node(children["r"], depth + 1)
+            else:
+                max_depth = max(max_depth, depth)
+            return idx
+
+        for tree in root.find("Weights").findall("BinaryTree"):
+            roots.append(add_node(tree.find("Node"), 0))
+            boost_weights.append(float(tree.get("boostWeight", "1")))
+
+        # Leaves point to themselves, so walking max_depth steps always ends on a leaf
+        self.var = np.asarray(var, dtype=np.int64)
+        self.cut = np.asarray(cut, dtype=np.float32)
+        self.cut_type = np.asarray(cut_type, dtype=bool)
+        self.left = np.asarray(left, dtype=np.int64)
+        self.right = np.asarray(right, dtype=np.int64)
+        self.value = np.asarray(value, dtype=np.float32).astype(np.float64)
+        self.roots = np.asarray(roots, dtype=np.int64)
+        self.boost_weights = np.asarray(boost_weights, dtype=np.float64)
+        self.max_depth = max_depth
+
+    def _leaf_values(self, X):
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            goes_right = (X[rows, self.var[nodes]] >= self.cut[nodes]) == self.cut_type[nodes]
+            nodes = np.where(goes_right, self.right[nodes], self.left[nodes])
+        return self.value[nodes]
+
+    def evaluate(self, X):
+        """MVA values for X, whose columns follow self.variables."""
+        X = np.asarray(X, dtype=np.float32)
+        scores = np.empty(len(X), dtype=np.float64)
+        norm = self.boost_weights.sum()
+        with stage_timing.stage("predict", len(X)):
+            for start in range(0, len(X), self.block_size):
+                leaves = self._leaf_values(X[start:start + self.block_size])
+                if self.boost_type == "Grad":
+                    scores[start:start + len(leaves)] = 2.0 / (1.0 + np.exp(-2.0 * leaves.sum(axis=1))) - 1.0
+                else:
+                    scores[start:start + len(leaves)] = leaves @ self.boost_weights / norm if norm > 0 else 0.0
+        return scores
+
+class PyKerasModel:
+    """Evaluator for a TMVA PyKeras method: the TrainedModel_<method>.h5 next to the weights file, signal output only."""
+
+    def __init__(self, xml_path, batch_size=65536, engine="keras"):
+        root, options, self.variables = _method_setup(xml_path)
+        model_path = options.get("FilenameTrainedModel", "")
+        if not model_path:
+            method_name = root.get("Method", "").split("::")[-1]
+            model_path = os.path.join(os.path.dirname(xml_path), f"TrainedModel_{method_name}.h5")
+        if engine == "numpy":
+            from numpy_model import load_model
+            self.model = load_model(model_path, "numpy")
+        else:
+            from tensorflow import keras
+            self.model = keras.models.load_model(model_path, compile=False)
+        self.batch_size = batch_size
+
+    def evaluate(self, X):
+        """MVA values for X, whose columns follow self.variables (TMVA reports output node kSignal = 0)."""
+        if len(X) == 0:
+            return np.empty(0, dtype=np.float64)
+        with stage_timing.stage("predict", len(X)):
+            return self.model.predict(np.asarray(X, dtype=np.float32), batch_size=self.batch_size, verbose=0)[:, 0].astype(np.float64)
+
+@functools.lru_cache(maxsize=None)
+def load_evaluator(xml_path, engine="keras"):
+    """
+    TMVABDT or PyKerasModel for a weights file, cached so each process books a fold only once.
+    engine='numpy' runs PyKeras models with the NumPy export of the .h5 model (numpy_model.py).
+    """
+    method = ET.parse(xml_path).getroot().get("Method", "")
+    if method.startswith("BDT::"):
+        return TMVABDT(xml_path)
+    if method.startswith("PyKeras::"):
+        return PyKerasModel(xml_path, engine=engine)
+    raise NotImplementedError(f"{xml_path}: method '{method}' is not supported in batch mode")
+
+class ScoreHist:
+    """Weighted 1D histogram following TH1::Fill conventions: bin 0 is underflow, bin nbins+1 overflow."""
+
+    def __init__(self, nbins, xmin, xmax):
+        self.nbins, self.xmin, self.xmax = nbins, xmin, xmax
+        self.sumw = np.zeros(nbins + 2)
+        self.sumw2 = np.zeros(nbins + 2)
+        self.entries = 0
+        self.tsumw = self.tsumw2 = self.tsumwx = self.tsumwx2 = 0.0
+
+    def fill(self, x, w):
+        with stage_timing.stage("fill", len(x)):
+            self._fill(x, w)
+
+    def _fill(self, x, w):
+        x = np.asarray(x, dtype=np.float64)
+        w = np.asarray(w, dtype=np.float64)
+        finite = ~np.isnan(x)
+        x, w = x[finite], w[finite]
+        bins = np.floor(self.nbins * (x - self.xmin) / (self.xmax - self.xmin)).astype(np.int64) + 1
+        bins[x < self.xmin] = 0
+        bins[x >= self.xmax] = self.nbins + 1
+        self.sumw += np.bincount(bins, weights=w, minlength=self.nbins + 2)
+        self.sumw2 += np.bincount(bins, weights=w * w, minlength=self.nbins + 2)
+        self.entries += len(x)
+        inside = (bins >= 1) & (bins <= self.nbins)
+        xi, wi = x[inside], w[inside]
+        self.tsumw += wi.sum()
+        self.tsumw2 += (wi * wi).sum()
+        self.tsumwx += (wi * xi).sum()
+        self.tsumwx2 += (wi * xi * xi).sum()
+
+    def merge(self, other):
+        self.sumw += other.sumw
+        self.sumw2 += other.sumw2
+        self.entries += other.entries
+        self.tsumw += other.tsumw
+        self.tsumw2 += other.tsumw2
+        self.tsumwx += other.tsumwx
+        self.tsumwx2 += other.tsumwx2
+
+    def rebin(self, factor):
+        """Copy with every factor adjacent bins merged (like TH1::Rebin); nbins must be a multiple of factor."""
+        if self.nbins % factor:
+            raise ValueError(f"cannot rebin {self.nbins} bins by {factor}")
+        out = ScoreHist(self.nbins // factor, self.xmin, self.xmax)
+        for target, source in ((out.sumw, self.sumw), (out.sumw2, self.sumw2)):
+            target[[0, -1]] = source[[0, -1]]
+            target[1:-1] = source[1:-1].reshape(-1, factor).sum(axis=1)
+        out.entries = self.entries
+        out.tsumw, out.tsumw2, out.tsumwx, out.tsumwx2 = self.tsumw, self.tsumw2, self.tsumwx, self.tsumwx2
+        return out
+
+    def to_th1f(self, name, title=""):
+        axis = uproot.writing.identify.to_TAxis("xaxis", "", self.nbins, self.xmin, self.xmax)
+        return uproot.writing.identify.to_TH1x(
+            name, title, self.sumw.astype(np.float32), self.entries,
+            self.tsumw, self.tsumw2, self.tsumwx, self.tsumwx2, self.sumw2, axis,
+        )
+
+def write_hists(path, hists):
+    """Writes {name: ScoreHist} as TH1F objects (with Sumw2) into a new ROOT file."""
+    with stage_timing.stage("write", sum(hist.entries for hist in hists.values())), uproot.recreate(path) as f:
+        for name, hist in hists.items():
+            f[name] = hist.to_th1f(name)
@@ -0,0 +1,225 @@
+"""
+Persistent index of the ROOT files the scripts read and write: for every file its size, mtime and sha256, and
+for every TTree / histogram in it the class, entry count and (for trees) the branch names and types.
+A file is opened only when it is not in the catalog yet or its size or mtime changed, and then only its
+metadata is read, so counting entries, finding tree names and checking for missing branches never decompress
+or read the event data. The sha256 reads the whole file and is computed on the first checksum() call only.
+
+    import ntuple_catalog
+    ntuple_catalog.num_entries("discriminant_background_stopana.root")        # first TTree
+    ntuple_catalog.missing_branches(path, "sel_tree", FEATURES)               # None if there is no sel_tree
+
+    python ntuple_catalog.py /path/to/ntuples discriminant_*.root --prune    # index files / directories
+
+Environment:
+    NTUPLE_CATALOG         catalog file (default ~/.cache/monobc_ntuple_catalog.json)
+"""
+import os
+import sys
+import json
+import fcntl
+import hashlib
+import argparse
+import threading
+
+CATALOG_PATH = os.environ.get("NTUPLE_CATALOG", os.path.join(os.path.expanduser("~"), ".cache", "monobc_ntuple_catalog.json"))
+TREE_CLASSES = ("TTree", "TNtuple", "TNtupleD")
+CHUNK_BYTES = 1 << 24
+
+_lock = threading.Lock()
+_catalog = None
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def scan_file(path):
+    """
+    Catalog entry of a ROOT file from its metadata: {'size', 'mtime_ns', 'sha256' (None until checksum() is called),
+    'objects': {name: {'class', 'entries'[, 'branches']}}}.
+    """
+    import uproot
+    stat = os.stat(path)
+    objects = {}
+    with uproot.open(path) as f:
+        for name, classname in f.classnames(cycle=False).items():
+            if classname in TREE_CLASSES:
+                tree = f[name]
+                objects[name] = {"class": classname, "entries": int(tree.num_entries), "branches": tree.typenames()}
+            elif classname.startswith("TH1"):
+                objects[name] = {"class": classname, "entries": int(f[name].member("fEntries"))}
+            elif "Tree" in classname or "Tuple" in classname:
+                # e.g. ROOT::RNTuple, written by plain `file[name] = {...}` assignment in recent uproot
+                raise ValueError(f"{path}: '{name}' is a {classname}, not a TTree; write it with mktree")
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": None, "objects": objects}
+
+class Catalog:
+    """The catalog file as {absolute path: entry}; lookups refresh stale entries and save them back."""
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        self.entries = self._read()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, changed):
+        """
+        Writes the entries of changed into the catalog file, merged with what other processes wrote meanwhile;
+        the read-merge-replace holds an flock on <catalog>.lock so concurrent writers do not drop each other's entries.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            on_disk = self._read()
+            on_disk.update({key: self.entries[key] for key in changed if key in self.entries})
+            for key in changed:
+                if key not in self.entries:
+                    on_disk.pop(key, None)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(on_disk, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        self.entries = on_disk
+
+    def refresh(self, paths):
+        """Rescans the files of paths that are new or changed since they were indexed; returns the rescanned keys."""
+        changed = []
+        for path in paths:
+            key = os.path.abspath(path)
+            stat = os.stat(key)
+            known = self.entries.get(key)
+            if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+                continue
+            self.entries[key] = scan_file(key)
+            changed.append(key)
+        if changed:
+            self.save(changed)
+        return changed
+
+    def prune(self):
+        """Drops the entries of files that no longer exist; returns their keys."""
+        gone = [key for key in self.entries if not os.path.exists(key)]
+        for key in gone:
+            del self.entries[key]
+        if gone:
+            self.save(gone)
+        return gone
+
+    def entry(self, path):
+        """Up-to-date entry of path (raises FileNotFoundError if the file does not exist)."""
+        self.refresh([path])
+        return self.entries[os.path.abspath(path)]
+
+    def store_checksum(self, path, version, digest):
+        """Stores the sha256 digest of path if the file is still at version (size, mtime_ns) it was hashed at."""
+        key = os.path.abspath(path)
+        known = self.entry(key)
+        if (known["size"], known["mtime_ns"]) == tuple(version):
+            known["sha256"] = digest
+            self.save([key])
+
+    def checksum(self, path):
+        """sha256 of path, hashed once per file version and stored with its entry."""
+        known = self.entry(path)
+        digest = known.get("sha256")
+        if digest is None:
+            digest = _sha256(os.path.abspath(path))
+            self.store_checksum(path, (known["size"], known["mtime_ns"]), digest)
+        return digest
+
+def get_catalog():
+    global _catalog
+    if _catalog is None:
+        _catalog = Catalog()
+    return _catalog
+
+def entry(path):
+    with _lock:
+        return get_catalog().entry(path)
+
+def objects(path):
+    return entry(path)["objects"]
+
+def trees(path):
+    """Names of the TTrees in path, in file order."""
+    return [name for name, obj in objects(path).items() if obj["class"] in TREE_CLASSES]
+
+def first_object(path, prefix):
+    """Name of the first object in path whose class starts with prefix (a string or tuple, e.g. 'TH1'), or None."""
+    return next((name for name, obj in objects(path).items() if obj["class"].startswith(prefix)), None)
+
+def num_entries(path, name=None):
+    """Entries of the TTree (or histogram) name in path; name=None takes the first TTree."""
+    name = name or first_object(path, TREE_CLASSES)
+    return objects(path)[name]["entries"]
+
+def branches(path, tree):
+    """{branch: type name} of tree in path, or None if path has no such tree."""
+    obj = objects(path).get(tree)
+    return obj.get("branches") if obj else None
+
+def missing_branches(path, tree, wanted):
+    """The branches of wanted that tree in path lacks ([] if none), or None if the tree does not exist."""
+    available = branches(path, tree)
+    if available is None:
+        return None
+    return [b for b in wanted if b not in available]
+
+def checksum(path):
+    """Catalog.checksum, with the file hashed outside the lock so other threads' lookups do not wait for it."""
+    with _lock:
+        known = get_catalog().entry(path)
+        if known.get("sha256") is not None:
+            return known["sha256"]
+        version = (known["size"], known["mtime_ns"])
+    digest = _sha256(os.path.abspath(path))
+    with _lock:
+        get_catalog().store_checksum(path, version, digest)
+    return digest
+
+def _root_files(targets):
+    for target in targets:
+        if os.path.isdir(target):
+            for root, dirs, files in os.walk(target):
+                dirs.sort()
+                yield from (os.path.join(root, name) for name in sorted(files) if name.endswith(".root"))
+        else:
+            yield target
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index ROOT files (trees, entries, branches, checksums) in the ntuple catalog.")
+    parser.add_argument("targets", nargs="*", help="ROOT files or directories searched for *.root")
+    parser.add_argument("--prune", action="store_true", help="Drop entries of files that no longer exist")
+    parser.add_argument("--checksum", action="store_true", help="Also compute the sha256 of the targets (reads every byte)")
+    parser.add_argument("--list", action="store_true", help="Print the indexed objects of the targets (or of the whole catalog)")
+    args = parser.parse_args()
+
+    catalog = get_catalog()
+    paths = list(_root_files(args.targets))
+    missing = [p for p in paths if not os.path.exists(p)]
+    if missing:
+        print(f"FATAL: files not found: {missing}")
+        sys.exit(1)
+    changed = catalog.refresh(paths)
+    print(f"{len(paths)} files checked, {len(changed)} (re)indexed, catalog {catalog.path}")
+    if args.checksum:
+        for path in paths:
+            catalog.checksum(path)
+    if args.prune:
+        print(f"Pruned {len(catalog.prune())} entries of deleted files")
+    if args.list:
+        keys = [os.path.abspath(p) for p in paths] or sorted(catalog.entries)
+        for key in keys:
+            print(key)
+            for name, obj in catalog.entries[key]["objects"].items():
+                extra = f", {len(obj['branches'])} branches" if "branches" in obj else ""
+                print(f"    {name:<40}{obj['class']:<10}{obj['entries']:>12} entries{extra}")
@@ -0,0 +1,271 @@
+"""
+NumPy-only inference for the Dense/BatchNormalization/activation Keras models used by the scoring scripts
+(best_model_*.keras and the TMVA_DNN.py .h5 models), so scoring does not have to import TensorFlow.
+
+export() converts a Keras model once into <model>.numpy.npz next to it. Dropout layers are dropped and every
+inference-mode BatchNormalization is folded into a Dense layer: into the preceding one if the Dense output goes
+straight into it, otherwise (BN after the activation, as in TMVA_DNN.py) into the following one.
+NumpyModel.predict then runs the remaining matmuls and activations in float32 batches.
+
+    python numpy_model.py export /path/to/best_model_lq.keras
+    python numpy_model.py check /path/to/best_model_lq.keras --rows 200000
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+FORMAT_VERSION = 1
+ENGINES = ("keras", "numpy")
+
+def numpy_path(model_path):
+    """Path of the exported weights belonging to model_path, e.g. best_model_lq.keras -> best_model_lq.numpy.npz."""
+    root, _ = os.path.splitext(model_path)
+    return f"{root}.numpy.npz"
+
+# --- Export (needs TensorFlow) ---
+
+def _activation_op(activation):
+    """Activation op of a Keras activation function or activation layer (e.g. Dense(activation=LeakyReLU()))."""
+    name = type(activation).__name__
+    if name == "LeakyReLU":
+        slope = getattr(activation, "negative_slope", getattr(activation, "alpha", 0.3))
+        return {"type": "act", "name": "leaky_relu", "alpha": float(slope)}
+    if name == "ReLU":
+        if activation.max_value is not None or float(activation.threshold) != 0.0:
+            raise NotImplementedError("ReLU layers with max_value or threshold are not supported")
+        return {"type": "act", "name": "leaky_relu", "alpha": float(activation.negative_slope)}
+    if name == "Activation":
+        return _activation_op(activation.activation)
+    if name == "ELU":
+        return {"type": "act", "name": "elu", "alpha": float(activation.alpha)}
+    if name == "Softmax":
+        return {"type": "act", "name": "softmax"}
+    fn_name = getattr(activation, "__name__", None)
+    if fn_name not in ACTIVATIONS:
+        raise NotImplementedError(f"activation {fn_name or name} is not supported")
+    return {"type": "act", "name": fn_name}
+
+def _model_ops(model):
+    """Linear list of ops (dense / affine / act) and their arrays for a chain of supported Keras layers."""
+    ops = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in ("InputLayer", "Dropout", "GaussianNoise", "GaussianDropout", "AlphaDropout"):
+            continue
+        if kind == "Dense":
+            weights = layer.get_weights()
+            kernel = weights[0]
+            bias = weights[1] if layer.use_bias else np.zeros(kernel.shape[1])
+            ops.append({"type": "dense", "W": np.asarray(kernel, dtype=np.float64), "b": np.asarray(bias, dtype=np.float64)})
+            if getattr(layer.activation, "__name__", None) != "linear":
+                ops.append(_activation_op(layer.activation))
+        elif kind == "BatchNormalization":
+            if layer.axis not in (-1, [-1], 1, [1]):
+                raise NotImplementedError(f"BatchNormalization over axis {layer.axis} is not supported")
+            mean = np.asarray(layer.moving_mean, dtype=np.float64)
+            var = np.asarray(layer.moving_variance, dtype=np.float64)
+            gamma = np.asarray(layer.gamma, dtype=np.float64) if layer.scale else np.ones_like(mean)
+            beta = np.asarray(layer.beta, dtype=np.float64) if layer.center else np.zeros_like(mean)
+            scale = gamma / np.sqrt(var + layer.epsilon)
+            ops.append({"type": "affine", "scale": scale, "shift": beta - mean * scale})
+        elif kind in ("Activation", "LeakyReLU", "ReLU", "ELU", "Softmax"):
+            ops.append(_activation_op(layer))
+        else:
+            raise NotImplementedError(f"layer {layer.name} of type {kind} is not supported by the NumPy engine")
+    return ops
+
+def fold_batchnorm(ops):
+    """
+    Folds every affine (BatchNormalization) op into an adjacent Dense: Dense -> BN becomes Dense with
+    W * s, b * s + t; BN -> Dense becomes Dense with s[:, None] * W, t @ W + b. Other affine ops are kept.
+    """
+    ops = [dict(op) for op in ops]
+    folded = []
+    i = 0
+    while i < len(ops):
+        op = ops[i]
+        if op["type"] == "affine" and folded and folded[-1]["type"] == "dense":
+            prev = folded[-1]
+            prev["W"] = prev["W"] * op["scale"]
+            prev["b"] = prev["b"] * op["scale"] + op["shift"]
+        elif op["type"] == "affine" and i + 1 < len(ops) and ops[i + 1]["type"] == "dense":
+            nxt = ops[i + 1]
+            nxt["b"] = op["shift"] @ nxt["W"] + nxt["b"]
+            nxt["W"] = op["scale"][:, None] * nxt["W"]
+        else:
+            folded.append(op)
+        i += 1
+    return folded
+
+def export(model_path, out_path=None):
+    """Writes the folded NumPy form of the Keras model at model_path; returns the output path."""
+    from tensorflow import keras
+    model = keras.models.load_model(model_path, compile=False)
+    ops = fold_batchnorm(_model_ops(model))
+    if not any(op["type"] == "dense" for op in ops):
+        raise NotImplementedError(f"{model_path} has no Dense layer")
+
+    arrays, spec = {}, []
+    for i, op in enumerate(ops):
+        entry = {k: v for k, v in op.items() if not isinstance(v, np.ndarray)}
+        for key, value in op.items():
+            if isinstance(value, np.ndarray):
+                arrays[f"op{i}_{key}"] = value.astype(np.float32)
+                entry[key] = f"op{i}_{key}"
+        spec.append(entry)
+    meta = {"version": FORMAT_VERSION, "model": os.path.basename(model_path), "input_dim": int(model.input_shape[-1]), "ops": spec}
+
+    out_path = out_path or numpy_path(model_path)
+    np.savez(out_path, meta=np.array(json.dumps(meta)), **arrays)
+    n_bn = sum(type(layer).__name__ == "BatchNormalization" for layer in model.layers)
+    print(f"Exported {model_path} -> {out_path} ({len(spec)} ops, {n_bn} BatchNormalization layers folded)")
+    return out_path
+
+# --- Inference (NumPy only) ---
+
+def _sigmoid(x):
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+def _gelu(x):
+    from scipy.special import erf
+    return 0.5 * x * (1.0 + erf(x * np.float32(1.0 / np.sqrt(2.0))))
+
+def _selu(x):
+    alpha, scale = 1.6732632423543772, 1.0507009873554805
+    return np.float32(scale) * np.where(x > 0, x, np.float32(alpha) * np.expm1(np.minimum(x, 0)))
+
+def _leaky_relu(x, alpha):
+    if 0.0 <= alpha <= 1.0:
+        return np.maximum(x, np.float32(alpha) * x, out=x)
+    return np.where(x > 0, x, np.float32(alpha) * x)
+
+# Activations may work in place: they only ever see arrays created by the forward pass
+ACTIVATIONS = {
+    "linear": lambda x, op: x,
+    "relu": lambda x, op: np.maximum(x, np.float32(0), out=x),
+    "leaky_relu": lambda x, op: _leaky_relu(x, op.get("alpha", 0.2)),
+    "sigmoid": lambda x, op: _sigmoid(x),
+    "tanh": lambda x, op: np.tanh(x, out=x),
+    "softmax": lambda x, op: _softmax(x),
+    "gelu": lambda x, op: _gelu(x),
+    "elu": lambda x, op: np.where(x > 0, x, np.float32(op.get("alpha", 1.0)) * np.expm1(np.minimum(x, 0))),
+    "selu": lambda x, op: _selu(x),
+    "silu": lambda x, op: x * _sigmoid(x),
+    "swish": lambda x, op: x * _sigmoid(x),
+    "softplus": lambda x, op: np.logaddexp(np.float32(0), x),
+}
+
+class NumpyModel:
+    """Batched float32 forward pass of an exported model, with the predict()/input_shape interface of a Keras model."""
+
+    def __init__(self, ops, input_dim, name="", block_rows=1024):
+        self.ops = ops
+        self.block_rows = block_rows
+        self.name = name
+        self.input_shape = (None, input_dim)
+        last_dense = [op for op in ops if op["type"] == "dense"][-1]
+        self.output_shape = (None, last_dense["W"].shape[1])
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            meta = json.loads(str(f["meta"]))
+            if meta["version"] > FORMAT_VERSION:
+                raise ValueError(f"{path} has format version {meta['version']}, this code understands up to {FORMAT_VERSION}")
+            ops = []
+            for entry in meta["ops"]:
+                op = dict(entry)
+                for key, value in entry.items():
+                    if isinstance(value, str) and value in f.files:
+                        op[key] = np.ascontiguousarray(f[value])
+                ops.append(op)
+        return cls(ops, meta["input_dim"], meta.get("model", ""))
+
+    def __call__(self, X):
+        x = np.array(X, dtype=np.float32) if self.ops[0]["type"] == "act" else np.asarray(X, dtype=np.float32)
+        for op in self.ops:
+            if op["type"] == "dense":
+                x = x @ op["W"]
+                x += op["b"]
+            elif op["type"] == "affine":
+                x = x * op["scale"] + op["shift"]
+            else:
+                x = ACTIVATIONS[op["name"]](x, op)
+        return x
+
+    def predict(self, X, batch_size=4096, verbose=0):
+        """Outputs for X as (n, outputs) float32; batches are capped at block_rows rows to stay in cache."""
+        X = np.asarray(X)
+        batch_size = min(batch_size, self.block_rows)
+        if X.ndim != 2 or X.shape[1] != self.input_shape[1]:
+            raise ValueError(f"expected input of shape (n, {self.input_shape[1]}), got {X.shape}")
+        out = np.empty((len(X), self.output_shape[1]), dtype=np.float32)
+        for start in range(0, len(X), batch_size):
+            out[start:start + batch_size] = self(X[start:start + batch_size])
+        return out
+
+def load_model(model_path, engine="keras"):
+    """
+    Model for scoring with predict(): the Keras model ('keras'), or its NumPy export ('numpy'), which is
+    (re)exported first if it is missing or older than the Keras file.
+    """
+    if engine == "keras":
+        import tensorflow as tf
+        return tf.keras.models.load_model(model_path)
+    if engine != "numpy":
+        raise ValueError(f"unknown engine '{engine}', expected one of {ENGINES}")
+    path = numpy_path(model_path)
+    if not os.path.exists(path) or (os.path.exists(model_path) and os.path.getmtime(path) < os.path.getmtime(model_path)):
+        print(f"WARNING: {path} is missing or older than {model_path}, exporting it now (imports TensorFlow once)")
+        export(model_path, path)
+    return NumpyModel.load(path)
+
+def check(model_path, rows=100000, batch_size=4096, seed=0):
+    """Compares the NumPy engine with Keras on random standardised inputs and times both."""
+    start = time.perf_counter()
+    np_model = load_model(model_path, "numpy")
+    np_start = time.perf_counter() - start
+    X = np.random.default_rng(seed).standard_normal((rows, np_model.input_shape[1])).astype(np.float32)
+
+    start = time.perf_counter()
+    ours = np_model.predict(X, batch_size=batch_size)
+    np_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    keras_model = load_model(model_path, "keras")
+    keras_start = time.perf_counter() - start
+    start = time.perf_counter()
+    ref = keras_model.predict(X, batch_size=batch_size, verbose=0)
+    keras_seconds = time.perf_counter() - start
+
+    diff = float(np.max(np.abs(ours - ref)))
+    print(f"{'Engine':<8}{'Startup (s)':>12}{'Predict (s)':>13}{'Rows/s':>14}")
+    print(f"{'keras':<8}{keras_start:>12.2f}{keras_seconds:>13.2f}{rows / keras_seconds:>14,.0f}")
+    print(f"{'numpy':<8}{np_start:>12.2f}{np_seconds:>13.2f}{rows / np_seconds:>14,.0f}")
+    print(f"Max |numpy - keras| = {diff:.2e}")
+    return diff
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export Keras models for the NumPy inference engine and check them.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_parser = sub.add_parser("export", help="Write <model>.numpy.npz next to each model")
+    export_parser.add_argument("models", nargs="+")
+    check_parser = sub.add_parser("check", help="Compare the NumPy engine with Keras on random inputs")
+    check_parser.add_argument("model")
+    check_parser.add_argument("--rows", type=int, default=100000)
+    check_parser.add_argument("--batch-size", type=int, default=4096)
+    check_parser.add_argument("--atol", type=float, default=1e-5)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        for model_path in args.models:
+            export(model_path)
+    elif check(args.model, args.rows, args.batch_size) > args.atol:
+        print(f"FATAL: the NumPy engine differs from Keras by more than {args.atol}")
+        raise SystemExit(1)
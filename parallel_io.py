@@ -0,0 +1,43 @@
+"""
+Thread-pooled loading of the per-sample input files used by the scoring scripts.
+uproot and h5py spend most of a read decompressing with the GIL released, so several files can be read at once.
+Results are always handed back in job order, so the (start, end) index bookkeeping built from them is the
+same as for a serial loop, whichever read finishes first.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+def iter_loaded(load_fn, jobs, io_workers=1):
+    """
+    Yields (key, load_fn(*args)) for every (key, args) in jobs, in job order.
+    With io_workers > 1 up to io_workers loads run ahead of the consumer in a thread pool; otherwise loads are serial.
+    """
+    if io_workers is None or io_workers <= 1:
+        for key, args in jobs:
+            yield key, load_fn(*args)
+        return
+
+    with ThreadPoolExecutor(max_workers=io_workers) as pool:
+        pending = deque()
+        for key, args in jobs:
+            pending.append((key, pool.submit(load_fn, *args)))
+            if len(pending) >= io_workers:
+                key, future = pending.popleft()
+                yield key, future.result()
+        while pending:
+            key, future = pending.popleft()
+            yield key, future.result()
+
+def load_indexed(load_fn, jobs, io_workers=1):
+    """
+    Loads every job (see iter_loaded) and returns (frames, indices): the non-empty results in job order and
+    {key: (start, end)} giving each key's row range in pd.concat(frames, ignore_index=True).
+    """
+    frames, indices, pos = [], {}, 0
+    for key, df in iter_loaded(load_fn, jobs, io_workers):
+        if df is None or df.empty:
+            continue
+        frames.append(df)
+        indices[key] = (pos, pos + len(df))
+        pos += len(df)
+    return frames, indices
@@ -0,0 +1,140 @@
+"""
+Permutation feature importance (drop in validation AUC when one feature column is shuffled) for the notebook models.
+Instead of one model.predict over the whole validation set per feature, the permuted copies of a block of
+(feature, repeat) pairs are stacked into one array and scored with a single predict call. Every pair is repeated
+n_repeats times with its own permutation, giving a mean, a standard deviation and a confidence interval, and
+blocks can be spread over worker processes. Permutations depend only on (seed, feature, repeat), so the result
+does not depend on the block size or the number of workers.
+
+    python permutation_importance.py --model best_model_stop.keras --data val.npz --repeats 10 --workers 4
+"""
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from sklearn.metrics import roc_auc_score
+
+MAX_BATCH_ROWS = 2_000_000
+
+def _permutation(seed, feature, repeat, n):
+    return np.random.default_rng([seed, feature, repeat]).permutation(n)
+
+def _score_block(model, X, y, sample_weight, pairs, seed, batch_size, metric):
+    """Metric of the model on X with column j permuted, for every (j, repeat) in pairs; j = -1 scores X unchanged."""
+    n = len(X)
+    stacked = np.tile(X, (len(pairs), 1))
+    for k, (j, repeat) in enumerate(pairs):
+        if j >= 0:
+            stacked[k * n:(k + 1) * n, j] = X[_permutation(seed, j, repeat, n), j]
+    pred = np.asarray(model.predict(stacked, batch_size=batch_size, verbose=0)).reshape(len(stacked), -1)[:, 0]
+    return [metric(y, pred[k * n:(k + 1) * n], sample_weight=sample_weight) for k in range(len(pairs))]
+
+# --- Worker processes: each loads the model once ---
+_worker = {}
+
+def _init_worker(model_path, engine, X, y, sample_weight, seed, batch_size, metric):
+    from numpy_model import load_model
+    _worker.update(model=load_model(model_path, engine), X=X, y=y, sample_weight=sample_weight,
+                   seed=seed, batch_size=batch_size, metric=metric)
+
+def _score_block_worker(pairs):
+    w = _worker
+    return pairs, _score_block(w["model"], w["X"], w["y"], w["sample_weight"], pairs, w["seed"], w["batch_size"], w["metric"])
+
+def permutation_importance(model, X, y, features, n_repeats=5, seed=42, batch_size=4096, sample_weight=None,
+                           metric=roc_auc_score, block_pairs=None, workers=1, model_path=None, engine="keras", ci=0.95):
+    """
+    Ranked importance DataFrame with columns 'feature', 'importance' (mean drop of metric over the repeats),
+    'std', 'ci_low' and 'ci_high' (Student-t interval of the mean at level ci, NaN for a single repeat).
+    The baseline metric is in importance_df.attrs['baseline'].
+
+    block_pairs: (feature, repeat) copies of X scored per predict call (default: as many as fit in MAX_BATCH_ROWS rows).
+    workers > 1: blocks are scored in that many processes, which load the model from model_path with
+                 numpy_model.load_model(model_path, engine) ('numpy' avoids a TensorFlow start per worker).
+    The interval only covers the permutation randomness, not the finite size of the validation set.
+    """
+    X = np.ascontiguousarray(np.asarray(X, dtype=np.float32))
+    y = np.asarray(y).ravel()
+    features = list(features)
+    if X.shape[1] != len(features):
+        raise ValueError(f"X has {X.shape[1]} columns but {len(features)} feature names were given")
+
+    pairs = [(-1, 0)] + [(j, r) for j in range(len(features)) for r in range(n_repeats)]
+    block_pairs = block_pairs or max(1, MAX_BATCH_ROWS // max(1, len(X)))
+    blocks = [pairs[i:i + block_pairs] for i in range(0, len(pairs), block_pairs)]
+
+    start = time.perf_counter()
+    scores = {}
+    if workers > 1:
+        if model_path is None:
+            raise ValueError("workers > 1 needs model_path, the workers load the model themselves")
+        import multiprocessing as mp
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn, not fork: a parent with a running TF runtime cannot be forked safely
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"), initializer=_init_worker,
+                                 initargs=(model_path, engine, X, y, sample_weight, seed, batch_size, metric)) as pool:
+            for block, block_scores in pool.map(_score_block_worker, blocks):
+                scores.update(zip(block, block_scores))
+    else:
+        for block in blocks:
+            scores.update(zip(block, _score_block(model, X, y, sample_weight, block, seed, batch_size, metric)))
+    print(f"Scored {len(pairs)} copies of {len(X)} events in {len(blocks)} predict calls ({time.perf_counter() - start:.1f} s)")
+
+    baseline = scores[(-1, 0)]
+    drops = np.array([[baseline - scores[(j, r)] for r in range(n_repeats)] for j in range(len(features))])
+    mean = drops.mean(axis=1)
+    if n_repeats > 1:
+        from scipy.stats import t
+        std = drops.std(axis=1, ddof=1)
+        half = t.ppf(0.5 + ci / 2, n_repeats - 1) * std / np.sqrt(n_repeats)
+    else:
+        std = half = np.full(len(features), np.nan)
+
+    importance_df = (
+        pd.DataFrame({
+            'feature': features,
+            'importance': mean,
+            'std': std,
+            'ci_low': mean - half,
+            'ci_high': mean + half,
+        })
+        .sort_values(by='importance', ascending=False)
+        .reset_index(drop=True)
+    )
+    importance_df.attrs["baseline"] = baseline
+    importance_df.attrs["n_repeats"] = n_repeats
+    return importance_df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Permutation feature importance of a Keras model on a validation set.")
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--data", required=True, help=".npz with X_val, y_val, features (and optionally w_val)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--block-pairs", type=int, default=None, help="Permuted copies per predict call")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--engine", choices=["keras", "numpy"], default="keras")
+    parser.add_argument("--output", default=None, help="CSV for the importance table")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.data):
+        print(f"FATAL: {args.data} not found")
+        raise SystemExit(1)
+    with np.load(args.data) as f:
+        X_val, y_val, features = f["X_val"], f["y_val"], [str(v) for v in f["features"]]
+        w_val = f["w_val"] if "w_val" in f.files else None
+
+    model = None
+    if args.workers <= 1:
+        from numpy_model import load_model
+        model = load_model(args.model, args.engine)
+    importance_df = permutation_importance(model, X_val, y_val, features, args.repeats, args.seed, args.batch_size,
+                                           sample_weight=w_val, block_pairs=args.block_pairs, workers=args.workers,
+                                           model_path=args.model, engine=args.engine)
+    print(f"Baseline Validation AUC: {importance_df.attrs['baseline']:.4f}\n")
+    print("Feature importances (drop in AUC):")
+    print(importance_df.to_string(index=False))
+    if args.output:
+        importance_df.to_csv(args.output, index=False)
@@ -1,10 +1,28 @@
 #!/usr/bin/env python3
 import os
+import argparse
 import uproot
 import pandas as pd
 import numpy as np
-import tensorflow as tf
 from sklearn.preprocessing import StandardScaler
+from scaler_sidecar import load_scaler
+from numpy_model import load_model, ENGINES
+from mva_batch import ScoreHist, write_hists
+from trex_config import hist_file_name
+import feature_cache
+import ntuple_catalog
+import parallel_io
+import stage_timing
+
+# --- Explicitly defined variables matching the model's input ---
+FEATURES = [
+    "jet1_pt", "jet1_eta", "jet1_svmass", "jet1met_dphi", "jet2met_dphi",
+    "jet3met_dphi", "jet4met_dphi", "met_pt", "met_phi", "met_sig", "mjj",
+    "pTjj", "mbb", "pTbb", "dRjj", "dEtajj", "dPhijj", "dRbb", "dEtabb",
+    "dPhibb", "jet2_pt", "jet2_eta", "jet2_svmass"
+]
+# Binning of the discriminant Variable in the TRexFitter configs
+HIST_BINS = (20, 0.0, 1.0)
 
 def load_features_from_file(path, features_list):
     """Load features_list from the 'sel_tree' TTree in the given ROOT file."""
@@ -12,36 +30,38 @@ def load_features_from_file(path, features_list):
         print(f"  WARNING: {path} not found, skipping")
         return None
     try:
+        missing = ntuple_catalog.missing_branches(path, "sel_tree", features_list)
+        if missing is None:
+            print(f"  WARNING: 'sel_tree' not found in {path}, skipping")
+            return None
+        if missing:
+            print(f"  WARNING: missing branches {missing} in {path}, skipping")
+            return None
         with uproot.open(path) as root_file:
-            if "sel_tree" not in root_file:
-                print(f"  WARNING: 'sel_tree' not found in {path}, skipping")
-                return None
-            tree = root_file["sel_tree"]
-            branches = set(tree.keys())
-            missing = [b for b in features_list if b not in branches]
-            if missing:
-                print(f"  WARNING: missing branches {missing} in {path}, skipping")
-                return None
-            return tree.arrays(features_list, library="pd")
+            return feature_cache.tree_arrays(root_file["sel_tree"], features_list, library="pd")
     except Exception as e:
         print(f"  ERROR reading {path}: {e}")
         return None
 
-def main():
+def main(io_workers=1, ntuple_base=None, model_path=None, engine="keras", hist_output=False, hist_weight=None):
+    """
+    Scores every sample and writes one discriminant TTree per sample. hist_output also writes the weighted
+    discriminant histogram of every tree (weights from the hist_weight branch or 1) to <output>_hists.root.
+    """
     print("--- Starting NTuple processing for stop analysis with selected variables ---")
 
-    NTUPLE_BASE_PATH = "/home/sgoswami/monobcntuples/run3_btag/all"
-    MODEL_PATH       = "/home/sgoswami/monobcntuples/ML/best_model_stop.keras"
+    NTUPLE_BASE_PATH = ntuple_base or "/home/sgoswami/monobcntuples/run3_btag/all"
+    MODEL_PATH       = model_path or "/home/sgoswami/monobcntuples/ML/best_model_stop.keras"
     suffix           = "_stopana"
 
-    # --- Explicitly defined variables matching the model's input ---
-    FEATURES = [
-        "jet1_pt", "jet1_eta", "jet1_svmass", "jet1met_dphi", "jet2met_dphi",
-        "jet3met_dphi", "jet4met_dphi", "met_pt", "met_phi", "met_sig", "mjj",
-        "pTjj", "mbb", "pTbb", "dRjj", "dEtajj", "dPhijj", "dRbb", "dEtabb",
-        "dPhibb", "jet2_pt", "jet2_eta", "jet2_svmass"
-    ]
     print(f"Using {len(FEATURES)} selected features for model input.")
+    columns = FEATURES + ([hist_weight] if hist_weight else [])
+    hists = {}
+
+    def fill_hist(tree_name, arr, df):
+        if hist_output:
+            weights = df[hist_weight].values if hist_weight else np.ones(len(arr))
+            hists.setdefault(tree_name, ScoreHist(*HIST_BINS)).fill(arr, weights)
 
     # --- Define signal samples (only sT_tN1 variants) ---
     signal_files = {
@@ -64,7 +84,8 @@ def main():
     # --- Load model & verify input shape matches FEATURES ---
     print(f"\nLoading Keras model from {MODEL_PATH} …")
     try:
-        model = tf.keras.models.load_model(MODEL_PATH)
+        with stage_timing.stage("load_model"):
+            model = load_model(MODEL_PATH, engine)
     except Exception as e:
         print(f"FATAL: could not load model: {e}")
         return
@@ -74,43 +95,94 @@ def main():
         return
     print("Model input dimension matches selected features.")
 
+    parent = os.path.basename(os.path.dirname(NTUPLE_BASE_PATH))
+    output_file = f"{parent}{suffix}.root"
+
+    # --- Training-time scaler: if present, score each sample in a single pass ---
+    try:
+        scaler = load_scaler(MODEL_PATH, FEATURES)
+    except ValueError as e:
+        print(f"FATAL: {e}")
+        return
+    if scaler is not None:
+        print(f"\nScoring samples one at a time, writing discriminants to {output_file}")
+        n_written = 0
+        jobs = [(sample, (path, columns)) for sample, path in all_samples.items()]
+        with uproot.recreate(output_file) as out:
+            loaded = parallel_io.iter_loaded(load_features_from_file, jobs, io_workers)
+            for sample, df in stage_timing.timed_iter("load", loaded, count=lambda item: 0 if item[1] is None else len(item[1])):
+                if df is None or df.empty:
+                    continue
+                with stage_timing.stage("scale", len(df)):
+                    X = scaler.transform(df[FEATURES].values)
+                with stage_timing.stage("predict", len(df)):
+                    arr = model.predict(X, batch_size=4096, verbose=0).flatten()
+                tree_name = f"{sample}{suffix}"
+                with stage_timing.stage("write", len(arr)):
+                    # mktree keeps the outputs TTrees (plain assignment writes RNTuples in recent uproot)
+                    out.mktree(tree_name, {f"discriminant{suffix}": arr.dtype})
+                    out[tree_name].extend({f"discriminant{suffix}": arr})
+                fill_hist(tree_name, arr, df)
+                n_written += len(arr)
+                print(f"  • Wrote {len(arr)} events → TTree '{tree_name}'")
+        if n_written == 0:
+            print("FATAL: no data loaded. Exiting.")
+            return
+        print(f"\n--- Done: created {output_file} ---")
+        if hist_output:
+            write_hists(hist_file_name(output_file), hists)
+            print(f"--- Wrote {len(hists)} discriminant histograms to {hist_file_name(output_file)} ---")
+        return
+    print(f"WARNING: No scaler sidecar next to {MODEL_PATH}, refitting the scaler on the inference dataset.")
+
     # --- Load & index data ---
     print("\nLoading all data to determine scaling parameters...")
-    dfs, indices, pos = [], {}, 0
-    for sample, path in all_samples.items():
-        df = load_features_from_file(path, FEATURES)
-        if df is None or df.empty:
-            continue
-        n = len(df)
-        dfs.append(df)
-        indices[sample] = (pos, pos + n)
-        pos += n
+    jobs = [(sample, (path, columns)) for sample, path in all_samples.items()]
+    with stage_timing.stage("load"):
+        dfs, indices = parallel_io.load_indexed(load_features_from_file, jobs, io_workers)
     if not dfs:
         print("FATAL: no data loaded. Exiting.")
         return
-    combined_df = pd.concat(dfs, ignore_index=True)
+    with stage_timing.stage("load"):
+        combined_df = pd.concat(dfs, ignore_index=True)
+    stage_timing.add_events("load", len(combined_df))
     print(f"  → Loaded {len(combined_df)} total events")
 
     # --- Scale features ---
     print("\nScaling input features...")
-    scaler = StandardScaler()
-    X_all = scaler.fit_transform(combined_df[FEATURES])
+    with stage_timing.stage("scale", len(combined_df)):
+        scaler = StandardScaler()
+        X_all = scaler.fit_transform(combined_df[FEATURES])
 
     # --- Predict ---
     print("\nRunning model predictions on scaled data…")
-    preds = model.predict(X_all, batch_size=4096).flatten()
+    with stage_timing.stage("predict", len(X_all)):
+        preds = model.predict(X_all, batch_size=4096).flatten()
 
     # --- Write output ROOT ---
-    parent = os.path.basename(os.path.dirname(NTUPLE_BASE_PATH))
-    output_file = f"{parent}{suffix}.root"
     print(f"\nWriting discriminants to {output_file}")
-    with uproot.recreate(output_file) as out:
+    with stage_timing.stage("write", len(preds)), uproot.recreate(output_file) as out:
         for sample, (start, end) in indices.items():
             arr = preds[start:end]
             tree_name = f"{sample}{suffix}"
-            out[tree_name] = {f"discriminant{suffix}": arr}
+            out.mktree(tree_name, {f"discriminant{suffix}": arr.dtype})
+            out[tree_name].extend({f"discriminant{suffix}": arr})
+            fill_hist(tree_name, arr, combined_df.iloc[start:end])
             print(f"  • Wrote {len(arr)} events → TTree '{tree_name}'")
     print(f"\n--- Done: created {output_file} ---")
+    if hist_output:
+        write_hists(hist_file_name(output_file), hists)
+        print(f"--- Wrote {len(hists)} discriminant histograms to {hist_file_name(output_file)} ---")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Score the stop-analysis ntuples with the trained model.")
+    parser.add_argument("--io-workers", type=int, default=1, help="Number of sample files read concurrently")
+    parser.add_argument("--ntuple-base", default=None, help="Override the base directory of the input ntuples")
+    parser.add_argument("--model", default=None, help="Override the Keras model path")
+    parser.add_argument("--engine", choices=ENGINES, default="keras", help="'numpy': score with the NumPy export of the model, without TensorFlow")
+    parser.add_argument("--hist-output", action="store_true", help="Also write the binned discriminant of every TTree to <output>_hists.root (TRexFitter ReadFrom: HIST)")
+    parser.add_argument("--hist-weight", default=None, help="Branch with the per-event weight of the --hist-output histograms (default: 1)")
+    args = parser.parse_args()
+    main(io_workers=args.io_workers, ntuple_base=args.ntuple_base, model_path=args.model, engine=args.engine,
+         hist_output=args.hist_output, hist_weight=args.hist_weight)
+    feature_cache.report()
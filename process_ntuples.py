@@ -1,21 +1,42 @@
 import uproot
 import pandas as pd
 import numpy as np
-import tensorflow as tf
 import os
 import argparse
 from sklearn.preprocessing import StandardScaler
+from scaler_sidecar import load_scaler
+from numpy_model import load_model, ENGINES
+from mva_batch import ScoreHist, write_hists
+from trex_config import hist_file_name
+import feature_cache
+import ntuple_catalog
+import parallel_io
+import stage_timing
 
-def main(analysis_type):
+FEATURES = ["jet1_pt", "jet1met_dphi", "met_sig", "met_pt"]
+CATEGORIES = ["c_tagged", "untagged"]
+# Binning of the discriminant Variable in the TRexFitter configs
+HIST_BINS = (20, 0.0, 1.0)
+
+def fill_hist(hists, tree_name, scores, df, weight=None):
+    """Adds scores (weighted by the weight column of df, or 1) to the histogram of tree_name."""
+    weights = df[weight].values if weight else np.ones(len(scores))
+    hists.setdefault(tree_name, ScoreHist(*HIST_BINS)).fill(scores, weights)
+
+def main(analysis_type, chunk_size=None, io_workers=1, ntuple_base=None, model_path=None, engine="keras", hist_output=False, hist_weight=None):
     """
     Processes source ntuples to create discriminant ntuples with correctly scaled inputs.
+    If chunk_size is given, the ntuples are streamed in chunks of that many entries.
+    io_workers > 1 reads that many sample/category inputs concurrently.
+    ntuple_base and model_path override the default input locations.
+    engine='numpy' scores with the TensorFlow-free NumPy export of the model (numpy_model.py).
+    hist_output also writes the weighted discriminant histogram of every TTree (named like the tree, weights from
+    the hist_weight branch or 1) to <output>_hists.root, for TRexFitter configs with ReadFrom: HIST.
     """
     print(f"--- Starting NTuple processing for {analysis_type} with input scaling ---")
 
     # --- Configuration ---
-    NTUPLE_BASE_PATH = "/home/sgoswami/monobcntuples/local-samples/trf-workdir/SR/flattenedNTuples"
-    FEATURES = ["jet1_pt", "jet1met_dphi", "met_sig", "met_pt"]
-    CATEGORIES = ["c_tagged", "untagged"]
+    NTUPLE_BASE_PATH = ntuple_base or "/home/sgoswami/monobcntuples/local-samples/trf-workdir/SR/flattenedNTuples"
 
     # --- Analysis-Specific Settings ---
     if analysis_type == 'LQ':
@@ -38,6 +59,8 @@ def main(analysis_type):
     else:
         print(f"FATAL: Unknown analysis type '{analysis_type}'. Use 'LQ' or 'DM'.")
         return
+    if model_path:
+        MODEL_PATH = model_path
 
     background_files = {
         "znunu": f"{NTUPLE_BASE_PATH}/bkg/flat_tuple_znunu_600K.root",
@@ -47,47 +70,60 @@ def main(analysis_type):
 
     all_samples = {**signal_files, **background_files}
 
+    # --- Training-time scaler: if present, score every sample in a single pass ---
+    try:
+        scaler = load_scaler(MODEL_PATH, FEATURES)
+    except ValueError as e:
+        print(f"FATAL: {e}")
+        return
+    if scaler is None:
+        print(f"WARNING: No scaler sidecar next to {MODEL_PATH}, refitting the scaler on the inference dataset.")
+
+    if chunk_size or scaler is not None:
+        process_streaming(all_samples, CATEGORIES, FEATURES, MODEL_PATH, output_file, analysis_type, chunk_size, scaler=scaler, io_workers=io_workers, engine=engine,
+                          hist_output=hist_output, hist_weight=hist_weight)
+        return
+    columns = FEATURES + ([hist_weight] if hist_weight else [])
+
     # --- Step 1: Load all data from all files into a single DataFrame ---
     print("\nLoading all data to determine scaling parameters...")
-    all_data_dfs = []
-    data_indices = {}
-    current_pos = 0
-
-    for sample_name, path in all_samples.items():
-        for category in CATEGORIES:
-            df = load_features_from_files(path, category, FEATURES)
-            if df is not None and not df.empty:
-                all_data_dfs.append(df)
-                data_indices[(sample_name, category)] = (current_pos, current_pos + len(df))
-                current_pos += len(df)
+    jobs = [((sample_name, category), (path, category, columns)) for sample_name, path in all_samples.items() for category in CATEGORIES]
+    with stage_timing.stage("load"):
+        all_data_dfs, data_indices = parallel_io.load_indexed(load_features_from_files, jobs, io_workers)
 
     if not all_data_dfs:
         print("FATAL: No data could be loaded. Exiting.")
         return
 
-    combined_df = pd.concat(all_data_dfs, ignore_index=True)
+    with stage_timing.stage("load"):
+        combined_df = pd.concat(all_data_dfs, ignore_index=True)
+    stage_timing.add_events("load", len(combined_df))
     print(f"Loaded a total of {len(combined_df)} events.")
 
     # --- Step 2: Scale the features ---
     print("\nScaling input features...")
-    scaler = StandardScaler()
-    scaled_features = scaler.fit_transform(combined_df[FEATURES])
+    with stage_timing.stage("scale", len(combined_df)):
+        scaler = StandardScaler()
+        scaled_features = scaler.fit_transform(combined_df[FEATURES])
 
     # --- Step 3: Load model and get predictions ---
     print(f"Loading Keras model from {MODEL_PATH}...")
     try:
-        model = tf.keras.models.load_model(MODEL_PATH)
+        with stage_timing.stage("load_model"):
+            model = load_model(MODEL_PATH, engine)
     except Exception as e:
         print(f"FATAL: Could not load Keras model. Error: {e}")
         return
 
     print("Running model predictions on scaled data...")
-    all_predictions = model.predict(scaled_features, batch_size=4096)
-    all_discriminants = all_predictions.flatten()
+    with stage_timing.stage("predict", len(scaled_features)):
+        all_predictions = model.predict(scaled_features, batch_size=4096)
+        all_discriminants = all_predictions.flatten()
 
     # --- Step 4: Write the results to the output ROOT file ---
     print(f"\nWriting scores to output file: {output_file}")
-    with uproot.recreate(output_file) as f:
+    hists = {}
+    with stage_timing.stage("write", len(all_discriminants)), uproot.recreate(output_file) as f:
         for (sample_name, category), (start, end) in data_indices.items():
             discriminant_slice = all_discriminants[start:end]
 
@@ -97,10 +133,116 @@ def main(analysis_type):
             # The branch name depends on the analysis type
             discriminant_branch_name = f"discriminant_{analysis_type.lower()}"
 
-            f[tree_name] = {discriminant_branch_name: discriminant_slice}
+            # mktree keeps the outputs TTrees (plain assignment writes RNTuples in recent uproot)
+            f.mktree(tree_name, {discriminant_branch_name: discriminant_slice.dtype})
+            f[tree_name].extend({discriminant_branch_name: discriminant_slice})
             print(f"  -> Wrote {len(discriminant_slice)} events to TTree '{tree_name}'")
+            if hist_output:
+                fill_hist(hists, tree_name, discriminant_slice, combined_df.iloc[start:end], hist_weight)
 
     print(f"\n--- Successfully created {output_file} with correct score distributions ---")
+    if hist_output:
+        write_hists(hist_file_name(output_file), hists)
+        print(f"--- Wrote {len(hists)} discriminant histograms to {hist_file_name(output_file)} ---")
+
+def process_streaming(all_samples, categories, features, model_path, output_file, analysis_type, chunk_size, scaler=None, io_workers=1, engine="keras",
+                      hist_output=False, hist_weight=None):
+    """
+    Two-pass version of main() whose peak memory is bounded by chunk_size instead of the dataset size.
+    Pass 1 accumulates the scaler statistics chunk by chunk, pass 2 scales, predicts and appends each chunk.
+    If a training-time scaler is given, pass 1 is skipped; chunk_size=None then reads one sample/category at a time,
+    with up to io_workers of them read ahead concurrently. hist_output / hist_weight: see main().
+    """
+    columns = features + ([hist_weight] if hist_weight else [])
+    # --- Pass 1: Accumulate scaling parameters ---
+    if scaler is None:
+        print(f"\nPass 1: accumulating scaling parameters in chunks of {chunk_size} events...")
+        scaler = StandardScaler()
+        n_total = 0
+        for sample_name, path in all_samples.items():
+            for category in categories:
+                # Own stage names: "load" / "scale" count each event once, in pass 2 (benchmark.py rates "load")
+                for df in stage_timing.timed_iter("scan", iterate_features_from_files(path, category, columns, chunk_size)):
+                    with stage_timing.stage("fit_scaler", len(df)):
+                        scaler.partial_fit(df[features].values)
+                    n_total += len(df)
+
+        if n_total == 0:
+            print("FATAL: No data could be loaded. Exiting.")
+            return
+        print(f"Accumulated scaling parameters over {n_total} events.")
+
+    print(f"Loading Keras model from {model_path}...")
+    try:
+        with stage_timing.stage("load_model"):
+            model = load_model(model_path, engine)
+    except Exception as e:
+        print(f"FATAL: Could not load Keras model. Error: {e}")
+        return
+
+    # --- Pass 2: Scale, predict and append chunk by chunk ---
+    print(f"\nScoring and writing scores to output file: {output_file}")
+    discriminant_branch_name = f"discriminant_{analysis_type.lower()}"
+    hists = {}
+    with uproot.recreate(output_file) as f:
+        for sample_name, category, chunks in sample_chunks(all_samples, categories, columns, chunk_size, io_workers):
+            tree_name = f"{sample_name}_{category}"
+            n_written = 0
+            for df in stage_timing.timed_iter("load", chunks):
+                with stage_timing.stage("scale", len(df)):
+                    scaled_chunk = scaler.transform(df[features].values)
+                with stage_timing.stage("predict", len(df)):
+                    discriminant_chunk = model.predict(scaled_chunk, batch_size=4096, verbose=0).flatten()
+                with stage_timing.stage("write", len(df)):
+                    if n_written == 0:
+                        # mktree keeps the outputs TTrees (plain assignment writes RNTuples in recent uproot)
+                        f.mktree(tree_name, {discriminant_branch_name: discriminant_chunk.dtype})
+                    f[tree_name].extend({discriminant_branch_name: discriminant_chunk})
+                n_written += len(discriminant_chunk)
+                if hist_output:
+                    fill_hist(hists, tree_name, discriminant_chunk, df, hist_weight)
+            if n_written:
+                print(f"  -> Wrote {n_written} events to TTree '{tree_name}'")
+
+    print(f"\n--- Successfully created {output_file} with correct score distributions ---")
+    if hist_output:
+        write_hists(hist_file_name(output_file), hists)
+        print(f"--- Wrote {len(hists)} discriminant histograms to {hist_file_name(output_file)} ---")
+
+def sample_chunks(all_samples, categories, features, chunk_size, io_workers=1):
+    """
+    Yields (sample, category, chunks) in configuration order. Without chunking and with io_workers > 1,
+    whole sample/category inputs are read ahead in a thread pool.
+    """
+    if chunk_size is None and io_workers > 1:
+        jobs = [((sample_name, category), (path, category)) for sample_name, path in all_samples.items() for category in categories]
+        load = lambda path, category: list(iterate_features_from_files(path, category, features, None))
+        for (sample_name, category), chunks in parallel_io.iter_loaded(load, jobs, io_workers):
+            yield sample_name, category, chunks
+        return
+    for sample_name, path in all_samples.items():
+        for category in categories:
+            yield sample_name, category, iterate_features_from_files(path, category, features, chunk_size)
+
+def iterate_features_from_files(file_paths, category_name, features_list, chunk_size):
+    """Yields DataFrames of at most chunk_size events (or whole files if chunk_size is None) for a given sample/category."""
+    if not isinstance(file_paths, list): file_paths = [file_paths]
+    for path in file_paths:
+        if not os.path.exists(path): continue
+        try:
+            if ntuple_catalog.missing_branches(path, category_name, features_list) != []: continue
+            with uproot.open(path) as root_file:
+                tree = root_file[category_name]
+                if chunk_size is None:
+                    chunks = [feature_cache.tree_arrays(tree, features_list, library="pd")]
+                else:
+                    chunks = feature_cache.iterate_tree(tree, features_list, chunk_size, library="pd")
+                for df in chunks:
+                    if not df.empty:
+                        yield df
+        except Exception as e:
+            print(f"    ERROR processing {path}: {e}")
+            return
 
 def load_features_from_files(file_paths, category_name, features_list):
     """Helper function to load a DataFrame for a given sample/category."""
@@ -109,11 +251,9 @@ def load_features_from_files(file_paths, category_name, features_list):
     for path in file_paths:
         if not os.path.exists(path): continue
         try:
+            if ntuple_catalog.missing_branches(path, category_name, features_list) != []: continue
             with uproot.open(path) as root_file:
-                if category_name in root_file:
-                    tree = root_file[category_name]
-                    if all(b in tree for b in features_list):
-                        dfs.append(tree.arrays(features_list, library="pd"))
+                dfs.append(feature_cache.tree_arrays(root_file[category_name], features_list, library="pd"))
         except Exception as e:
             print(f"    ERROR processing {path}: {e}")
             return None
@@ -122,5 +262,14 @@ def load_features_from_files(file_paths, category_name, features_list):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process ntuples with input scaling for LQ or DM analysis.")
     parser.add_argument("--type", type=str, required=True, choices=['LQ', 'DM'], help="Type of analysis to run: 'LQ' or 'DM'")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Stream the ntuples in chunks of this many events (bounded memory)")
+    parser.add_argument("--io-workers", type=int, default=1, help="Number of sample/category inputs read concurrently (not used with --chunk-size)")
+    parser.add_argument("--ntuple-base", default=None, help="Override the base directory of the input ntuples")
+    parser.add_argument("--model", default=None, help="Override the Keras model path")
+    parser.add_argument("--engine", choices=ENGINES, default="keras", help="'numpy': score with the NumPy export of the model, without TensorFlow")
+    parser.add_argument("--hist-output", action="store_true", help="Also write the binned discriminant of every TTree to <output>_hists.root (TRexFitter ReadFrom: HIST)")
+    parser.add_argument("--hist-weight", default=None, help="Branch with the per-event weight of the --hist-output histograms (default: 1)")
     args = parser.parse_args()
-    main(args.type)
+    main(args.type, chunk_size=args.chunk_size, io_workers=args.io_workers, ntuple_base=args.ntuple_base, model_path=args.model, engine=args.engine,
+         hist_output=args.hist_output, hist_weight=args.hist_weight)
+    feature_cache.report()
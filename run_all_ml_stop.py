@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
-import subprocess
 import os
+import sys
+import argparse
+from trex_jobs import add_arguments, run_from_args
+from trex_config import hist_mode
 
 # --- Main Configuration ---
 # Path to the universal skeleton config file
@@ -23,8 +26,13 @@ SUFFIX = "_stopana"
 
 def main():
     """
-    Generates a TRexFitter config for each stop point without any scale factor adjustments.
+    Generates a TRexFitter config for each stop point without any scale factor adjustments
+    and runs TRexFitter on all of them in parallel (trex_jobs.py).
     """
+    parser = add_arguments(argparse.ArgumentParser(description="Generate and fit the TRexFitter configs of the stop points."))
+    parser.add_argument("--hist", action="store_true", help="ReadFrom: HIST configs reading the *_hists.root files of process-stop-ntuples.py --hist-output")
+    args = parser.parse_args()
+
     print("--- Generating TRexFitter configs for stop analysis (no scaling) ---")
 
     # Read skeleton template
@@ -33,8 +41,9 @@ def main():
             base_config = f.read()
     except FileNotFoundError:
         print(f"FATAL: Skeleton config not found: {SKELETON_CONFIG_PATH}")
-        return
+        return 1
 
+    jobs = []
     for point in STOP_POINTS:
         print(f"\n{'='*50}\nPoint: {point}\n{'='*50}")
 
@@ -54,26 +63,19 @@ def main():
         config_text = base_config
         for placeholder, val in replacements.items():
             config_text = config_text.replace(placeholder, val)
+        if args.hist:
+            config_text = hist_mode(config_text)
 
         # Write out config file
         cfg_name = f"config_{point}.txt"
         with open(cfg_name, "w") as cfg:
             cfg.write(config_text)
         print(f"Generated config: {cfg_name}")
+        jobs.append((point, cfg_name))
 
-        # Run TRexFitter
-        cmd = ["trex-fitter", "nwdpf", cfg_name]
-        print(f"Executing: {' '.join(cmd)}")
-        try:
-            subprocess.run(cmd, check=True)
-            print(f"--- Completed: {point} ---")
-        except subprocess.CalledProcessError:
-            print(f"ERROR: TRexFitter failed for {point}")
-            break
-        except FileNotFoundError:
-            print("ERROR: 'trex-fitter' command not found in PATH.")
-            break
+    # Run TRexFitter on all points
+    return run_from_args(jobs, args)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
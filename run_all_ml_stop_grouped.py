@@ -4,9 +4,12 @@ Generate and run TRexFitter config for stop analysis with separate signal mass-p
 This version creates a separate Sample block for each signal file to ensure correct TTree mapping.
 """
 import os
-import subprocess
-import uproot
+import sys
+import argparse
 import numpy as np
+import ntuple_catalog
+from trex_jobs import add_arguments, run_from_args
+from trex_config import hist_mode, hist_file_name
 
 # --- Configuration ---
 SKELETON             = "trf-stop-ml-config-grouped.txt"
@@ -19,32 +22,39 @@ BACKGROUND_BASENAME  = "discriminant_background_stopana"
 
 BRANCH_NAME          = "discriminant_stopana"
 OUTPUT_CONFIG        = "config_stop_combined.txt"
-TREXFITTER_COMMAND   = ["trex-fitter", "nwdpf", OUTPUT_CONFIG]
 JOB_NAME             = "stop_combined"
 OUTPUT_DIRECTORY     = "./stop_combined_fit_balanced_SnB"
 SIGNAL_LABEL         = "stop combined"
 
+parser = add_arguments(argparse.ArgumentParser(description="Generate and fit the combined stop TRexFitter config."))
+parser.add_argument("--hist", action="store_true", help="ReadFrom: HIST config reading the *_hists.root files of create-ntuples-per-signal.py --hist-output")
+args = parser.parse_args()
+
+def count_entries(base):
+    """(TTree name, entries) of the discriminant file (with --hist: of its histogram), looked up in ntuple_catalog.py."""
+    path = (hist_file_name(base) if args.hist else base) + ".root"
+    name = ntuple_catalog.first_object(path, "TH1" if args.hist else ntuple_catalog.TREE_CLASSES)
+    if name is None:
+        raise RuntimeError(f"No {'histogram' if args.hist else 'TTree'} found in {path}")
+    return name, ntuple_catalog.num_entries(path, name)
+
 # --- 1) Count entries and find TTree names ---
 sig_count = 0
 sig_files_and_trees = []
 for base in SIGNAL_BASENAMES:
-    filename = base + ".root"
+    filename = (hist_file_name(base) if args.hist else base) + ".root"
     if not os.path.exists(filename):
         print(f"ERROR: Signal file not found: {filename}")
         exit()
-    with uproot.open(filename) as f:
-        tree = next(k.split(';')[0] for k in f.keys() if f[k].classname.endswith('TTree'))
-        arr = f[tree][BRANCH_NAME].array(library="np")
-        sig_count += arr.size
-        sig_files_and_trees.append({'basename': base, 'treename': tree})
+    tree, count = count_entries(base)
+    sig_count += count
+    sig_files_and_trees.append({'basename': base, 'treename': tree})
 
-background_filename = BACKGROUND_BASENAME + ".root"
+background_filename = (hist_file_name(BACKGROUND_BASENAME) if args.hist else BACKGROUND_BASENAME) + ".root"
 if not os.path.exists(background_filename):
     print(f"ERROR: Background file not found: {background_filename}")
     exit()
-with uproot.open(background_filename) as f:
-    bkg_tree = next(k.split(';')[0] for k in f.keys() if f[k].classname.endswith('TTree'))
-    bkg_count = f[bkg_tree][BRANCH_NAME].array(library="np").size
+bkg_tree, bkg_count = count_entries(BACKGROUND_BASENAME)
 
 if sig_count == 0:
     raise RuntimeError("No signal entries found in discriminant files")
@@ -95,6 +105,8 @@ placeholders = {
 }
 for k, v in placeholders.items():
     cfg = cfg.replace(k, v)
+if args.hist:
+    cfg = hist_mode(cfg)
 
 # --- 4) Write config and run ---
 with open(OUTPUT_CONFIG, 'w') as outf:
@@ -102,5 +114,5 @@ with open(OUTPUT_CONFIG, 'w') as outf:
 print(f"Wrote {OUTPUT_CONFIG}")
 
 print("Running TRexFitter…")
-subprocess.run(TREXFITTER_COMMAND, check=True)
-print("Done.")
+# Steps whose inputs did not change since the last run are skipped (trex_cache.py)
+sys.exit(run_from_args([(JOB_NAME, OUTPUT_CONFIG)], args))
@@ -1,5 +1,8 @@
-import subprocess
 import os
+import sys
+import argparse
+from trex_jobs import add_arguments, run_from_args
+from trex_config import hist_mode
 
 # --- Main Configuration ---
 
@@ -34,9 +37,14 @@ SIGNAL_POINTS = [
 
 def main():
     """
-    Loops through all signal points, calculates scale factors, generates a config
-    from the skeleton, and runs TrexFitter.
+    Loops through all signal points, calculates scale factors and generates a config
+    from the skeleton, then runs TrexFitter on all configs in parallel (trex_jobs.py).
     """
+    parser = add_arguments(argparse.ArgumentParser(description="Generate and fit the TRexFitter configs of all signal points."))
+    parser.add_argument("--hist", action="store_true", help="ReadFrom: HIST configs reading the *_hists.root files of process_ntuples.py --hist-output")
+    parser.add_argument("--asymptotic", action="store_true", help="Compute the asymptotic CLs limits (MC stat, no systematics) in-process (asymptotic_limits.py) instead of running TRexFitter")
+    args = parser.parse_args()
+
     print(f"--- Starting Standalone TrexFitter Run for All Signal Points ({ANALYSIS_TAG}) ---")
 
     try:
@@ -44,8 +52,9 @@ def main():
             base_config = f.read()
     except FileNotFoundError:
         print(f"FATAL: Skeleton config not found at: {SKELETON_CONFIG_PATH}")
-        return
+        return 1
 
+    jobs = []
     for point in SIGNAL_POINTS:
         point_name_tagged = f"{point['name']}{ANALYSIS_TAG}"
         print(f"\n{'='*50}\nProcessing: {point_name_tagged}\n{'='*50}")
@@ -83,28 +92,24 @@ def main():
             "SIGNAL_SCALE_FACTOR":  f"{final_sf:.8f}",
         }
 
-        # --- 3. Generate and Run TrexFitter Config ---
+        # --- 3. Generate TrexFitter Config ---
         temp_config = base_config
         for placeholder, value in replacements.items():
             temp_config = temp_config.replace(placeholder, value)
+        if args.hist:
+            temp_config = hist_mode(temp_config)
 
         config_filename = f"config_{point_name_tagged}.txt"
         with open(config_filename, "w") as f:
             f.write(temp_config)
         print(f"Generated config: {config_filename} with FINAL magnified SF = {final_sf:.8f}")
+        jobs.append((point_name_tagged, config_filename))
 
-        command = ["trex-fitter", "nwdpf", config_filename]
-        print(f"Executing: {' '.join(command)}")
-
-        try:
-            subprocess.run(command, check=True, text=True)
-            print(f"--- Successfully completed {point_name_tagged} ---")
-        except subprocess.CalledProcessError as e:
-            print(f"--- ERROR: TRexFitter failed for {point_name_tagged} ---")
-            break # Stop if one point fails
-        except FileNotFoundError:
-            print("\nERROR: 'trex-fitter' command not found. Is it in your PATH?")
-            break
+    # --- 4. Run TrexFitter on all points ---
+    if args.asymptotic:
+        import asymptotic_limits
+        return asymptotic_limits.main([config for _, config in jobs])
+    return run_from_args(jobs, args)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
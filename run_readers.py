@@ -0,0 +1,147 @@
+"""
+Runs Reader_BDT.py / Reader_DNN.py batch scoring for a whole sample list in one go.
+Every (sample, fold) pair is an independent work item for a process pool; the per-fold histograms
+are merged into the same per-sample output files the single-sample readers write. A failing item does not stop
+the others; samples with a failed fold are not written, and the failed items are listed at the end.
+With --fine-bins the folds are scored into fine histograms, written as h_score_fine_<sample> next to the usual
+h_score_<sample> (rebinned from them), and the weighted AUC, rejection and S/sqrt(B) are printed per fold and
+overall from the histograms (see score_metrics.py).
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+SAMPLES = ["sT_bC1_1000_102_100", "sT_bC1_1000_202_200", "ttbar", "singletop", "znunu", "diboson", "dijet", "wlnu", "zll"]
+N_FOLDS = 5
+
+def _reader_module(method):
+    if method == "BDT":
+        import Reader_BDT as reader
+    else:
+        import Reader_DNN as reader
+    return reader
+
+def _score_item(item):
+    """Worker entry point: scores one fold of one sample and returns (sample, fold, hist, entries, seconds)."""
+    method, indir, sample, fold, treename, weights_path, engine, bins = item
+    reader = _reader_module(method)
+    start = time.perf_counter()
+    options = {"engine": engine} if method == "DNN" else {}
+    if bins is not None:
+        options["bins"] = bins
+    hist, n_entries = reader.score_fold_batched(indir, sample, fold, treename, weights_path, **options)
+    return sample, fold, hist, n_entries, time.perf_counter() - start
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description="Score all samples and folds with the batched TMVA readers in parallel.")
+    parser.add_argument('--method', choices=["BDT", "DNN"], default="BDT")
+    parser.add_argument('--samples', nargs='+', default=SAMPLES)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of (sample, fold) items scored in parallel')
+    parser.add_argument('--indir', default='/eos/user/m/minlin/monobc/MLinputs/')
+    parser.add_argument('--channel', default='sT_bC1')
+    parser.add_argument('--option', default='5fold')
+    parser.add_argument('--hp', default=None, help='Hyperparameter string (defaults to the one of the chosen reader)')
+    parser.add_argument('--set', default='Validation')
+    parser.add_argument('--cl', default='', help='Class label suffix of the DNN weights')
+    parser.add_argument('--engine', choices=["keras", "numpy"], default="keras", help="DNN only: 'numpy' runs the model without TensorFlow")
+    parser.add_argument('--fine-bins', type=int, default=0, help='Also write fine score histograms with this many bins and print metrics from them')
+    parser.add_argument('--min-background', type=float, default=1.0, help='Minimum background yield of the best S/sqrt(B) cut (with --fine-bins)')
+    args = parser.parse_args(arguments)
+
+    reader = _reader_module(args.method)
+    hp = args.hp or ('300_10_1_0.01' if args.method == "BDT" else '416_160_416_480_0.0001_100_128')
+    parameters_str = reader.parameters_string(hp)
+    treename = "validation" if args.set == "Validation" else "test"
+    extra = (args.cl,) if args.method == "DNN" else ()
+
+    bins = None
+    if args.fine_bins:
+        nbins, xmin, xmax = reader.HIST_BINS
+        if args.fine_bins % nbins:
+            print(f"FATAL: --fine-bins must be a multiple of the {nbins} output bins")
+            return 1
+        bins = (args.fine_bins, xmin, xmax)
+        from score_metrics import ScoreHists
+        fold_metrics = {fold: ScoreHists(*bins) for fold in range(1, N_FOLDS + 1)}
+
+    items = [
+        (args.method, args.indir, sample, fold, treename, reader.weights_file(args.channel, fold, parameters_str, *extra), args.engine, bins)
+        for sample in args.samples for fold in range(1, N_FOLDS + 1)
+    ]
+
+    from mva_batch import write_hists
+    hists = {}
+    entries = {sample: 0 for sample in args.samples}
+    seconds = {sample: 0.0 for sample in args.samples}
+    done = {sample: 0 for sample in args.samples}
+    failed = []
+    wall_start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(_score_item, item): item for item in items}
+        for future in as_completed(futures):
+            try:
+                sample, fold, hist, n_entries, item_seconds = future.result()
+            except Exception as e:
+                _, _, sample, fold = futures[future][:4]
+                print(f"ERROR: sample {sample} fold {fold} failed: {e}")
+                failed.append((sample, fold))
+                continue
+            print(f"Sample {sample} fold {fold}: {n_entries} events in {item_seconds:.1f} s")
+            if bins is not None:
+                metrics = fold_metrics[fold]
+                (metrics.signal if "sT" in sample else metrics.background).merge(hist)
+            if sample in hists:
+                hists[sample].merge(hist)
+            else:
+                hists[sample] = hist
+            entries[sample] += n_entries
+            seconds[sample] += item_seconds
+            done[sample] += 1
+            # All folds of this sample are in: write its output file right away
+            if done[sample] == N_FOLDS:
+                outfile_name = reader.output_file(sample, args.channel, args.option, parameters_str, *extra)
+                print(f"rfile_out: {outfile_name}")
+                hist = hists.pop(sample)
+                if bins is None:
+                    write_hists(outfile_name, {f"h_score_{sample}": hist})
+                else:
+                    write_hists(outfile_name, {f"h_score_{sample}": hist.rebin(args.fine_bins // reader.HIST_BINS[0]),
+                                               f"h_score_fine_{sample}": hist})
+    wall = time.perf_counter() - wall_start
+
+    # --- Summary ---
+    print("")
+    print(f"{'Sample':<24}{'Events':>12}{'Time [s]':>12}{'Events/s':>14}{'Share':>8}")
+    total_seconds = sum(seconds.values())
+    for sample in sorted(args.samples, key=lambda s: seconds[s], reverse=True):
+        rate = entries[sample] / seconds[sample] if seconds[sample] > 0 else 0.0
+        share = seconds[sample] / total_seconds if total_seconds > 0 else 0.0
+        print(f"{sample:<24}{entries[sample]:>12}{seconds[sample]:>12.1f}{rate:>14,.0f}{share:>8.1%}")
+    total_entries = sum(entries.values())
+    print(f"Scored {total_entries} events from {len(args.samples)} samples in {wall:.1f} s wall "
+          f"({total_entries / wall if wall > 0 else 0.0:,.0f} events/s, {args.workers} workers)")
+    if failed:
+        print(f"ERROR: {len(failed)} items failed, outputs not written for samples "
+              f"{', '.join(sorted({sample for sample, _ in failed}))}: "
+              + ", ".join(f"{sample} fold {fold}" for sample, fold in sorted(failed)))
+
+    # --- Metrics from the fine histograms ---
+    if bins is not None:
+        if not any("sT" in s for s in args.samples) or all("sT" in s for s in args.samples):
+            print("WARNING: metrics need both signal (sT*) and background samples, skipping them")
+            return 1 if failed else 0
+        print("")
+        print(f"{'Fold':<8}{'AUC':>10}{'Rej@50%':>10}{'Rej@80%':>10}{'Best cut':>10}{'S/sqrt(B)':>11}")
+        overall = ScoreHists(*bins)
+        for fold, metrics in list(fold_metrics.items()) + [("all", overall)]:
+            if fold != "all":
+                overall.merge(metrics)
+            rej50, rej80 = metrics.rejection([0.5, 0.8])
+            cut, _, _, z = metrics.best_cut(min_background=args.min_background)
+            print(f"{fold!s:<8}{metrics.auc():>10.4f}{rej50:>10.2f}{rej80:>10.2f}{cut:>10.3f}{z:>11.3f}")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,61 @@
+"""
+Training-time input scaling stored as a versioned JSON sidecar next to the Keras model,
+e.g. best_model_lq.keras -> best_model_lq.scaler.json.
+The scoring scripts load it instead of refitting a StandardScaler on the inference dataset.
+"""
+import json
+import os
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+
+SIDECAR_VERSION = 1
+
+def sidecar_path(model_path):
+    """Path of the scaler sidecar belonging to model_path."""
+    root, _ = os.path.splitext(model_path)
+    return f"{root}.scaler.json"
+
+def save_scaler(scaler, features, model_path):
+    """Writes the fitted scaler (mean/scale vectors plus the ordered feature list) next to model_path."""
+    features = list(features)
+    if len(features) != len(scaler.mean_):
+        raise ValueError(f"Scaler was fitted on {len(scaler.mean_)} features but {len(features)} names were given")
+    payload = {
+        "version": SIDECAR_VERSION,
+        "model": os.path.basename(model_path),
+        "features": features,
+        "mean": [float(v) for v in scaler.mean_],
+        "scale": [float(v) for v in scaler.scale_],
+        "n_samples_seen": int(np.max(scaler.n_samples_seen_)),
+    }
+    path = sidecar_path(model_path)
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2)
+    print(f"Saved scaler sidecar: {path}")
+    return path
+
+def load_scaler(model_path, features=None):
+    """
+    Returns the StandardScaler stored next to model_path, or None if there is no sidecar.
+    Raises ValueError if the sidecar is from a newer version or its feature list differs from features.
+    """
+    path = sidecar_path(model_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        payload = json.load(f)
+
+    version = payload.get("version", 0)
+    if version > SIDECAR_VERSION:
+        raise ValueError(f"Scaler sidecar {path} has version {version}, this code understands up to {SIDECAR_VERSION}")
+    if features is not None and list(features) != payload["features"]:
+        raise ValueError(f"Scaler sidecar {path} was fitted on {payload['features']}, expected {list(features)}")
+
+    scaler = StandardScaler()
+    scaler.mean_ = np.asarray(payload["mean"], dtype=np.float64)
+    scaler.scale_ = np.asarray(payload["scale"], dtype=np.float64)
+    scaler.var_ = scaler.scale_ ** 2
+    scaler.n_features_in_ = len(scaler.mean_)
+    scaler.n_samples_seen_ = payload.get("n_samples_seen", 0)
+    print(f"Loaded scaler sidecar: {path} ({len(payload['features'])} features)")
+    return scaler
@@ -0,0 +1,160 @@
+"""
+Weighted classifier metrics from fine-binned score histograms instead of per-event arrays.
+ScoreHists accumulates weighted signal and background score histograms (mva_batch.ScoreHist) chunk by chunk,
+per fold or per sample, and merges them; ROC, AUC, background rejection at fixed signal efficiency and the
+cumulative S/sqrt(B) of a cut on the score are then computed from the bin contents in O(bins). Events inside
+one bin are treated as tied, so with the default 10000 bins the AUC agrees with the unbinned value to ~1e-4.
+
+The reader outputs can be used directly (run_readers.py --fine-bins writes h_score_fine_<sample>):
+
+    python score_metrics.py reader_output/*.root --signal sT_bC1_1000_102_100 --efficiencies 0.5 0.8
+"""
+import os
+import re
+import argparse
+import numpy as np
+from mva_batch import ScoreHist
+
+FINE_BINS = (10000, 0.0, 1.0)
+
+def roc_from_counts(sig, bkg):
+    """
+    (fpr, tpr) of the cuts score >= lower bin edge, from the tightest (nothing selected) to the loosest
+    (everything selected). sig / bkg are weighted bin contents including under- and overflow.
+    """
+    s = np.concatenate([[0.0], np.cumsum(sig[::-1])])
+    b = np.concatenate([[0.0], np.cumsum(bkg[::-1])])
+    if s[-1] <= 0 or b[-1] <= 0:
+        raise ValueError("ROC needs a positive total signal and background weight")
+    return b / b[-1], s / s[-1]
+
+def auc_from_counts(sig, bkg):
+    """Area under the weighted ROC curve; events in the same bin count as ties (trapezoidal rule)."""
+    fpr, tpr = roc_from_counts(sig, bkg)
+    return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+def rejection_from_counts(sig, bkg, efficiencies):
+    """Background rejection 1/eff_B at the given signal efficiencies (linear interpolation along the ROC)."""
+    fpr, tpr = roc_from_counts(sig, bkg)
+    # tpr is non-decreasing; take the lowest fpr reaching each efficiency
+    tpr_unique, first = np.unique(tpr, return_index=True)
+    eff_b = np.interp(np.atleast_1d(efficiencies), tpr_unique, fpr[first])
+    with np.errstate(divide="ignore"):
+        return np.where(eff_b > 0, 1.0 / np.maximum(eff_b, 1e-300), np.inf)
+
+def significance_from_counts(sig, bkg, edges, min_background=0.0):
+    """
+    (cuts, S, B, S/sqrt(B)) for every cut score >= edge, where S and B are the weighted yields above the cut.
+    Cuts keeping a background yield of min_background or less get a significance of 0.
+    """
+    # Lower edges of the regular bins; underflow is always rejected, overflow always kept
+    s = np.cumsum(sig[::-1])[::-1][1:-1]
+    b = np.cumsum(bkg[::-1])[::-1][1:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(b > min_background, s / np.sqrt(np.where(b > 0, b, 1.0)), 0.0)
+    return edges[:-1], s, b, z
+
+class ScoreHists:
+    """Weighted signal / background score histograms with the same binning, filled incrementally."""
+
+    def __init__(self, nbins=FINE_BINS[0], xmin=FINE_BINS[1], xmax=FINE_BINS[2]):
+        self.signal = ScoreHist(nbins, xmin, xmax)
+        self.background = ScoreHist(nbins, xmin, xmax)
+
+    @property
+    def edges(self):
+        return np.linspace(self.signal.xmin, self.signal.xmax, self.signal.nbins + 1)
+
+    def fill(self, scores, labels, weights=None):
+        """Adds a chunk of events; labels are 1 for signal, 0 for background, weights default to 1."""
+        scores = np.asarray(scores, dtype=np.float64).ravel()
+        labels = np.asarray(labels).ravel().astype(bool)
+        weights = np.ones(len(scores)) if weights is None else np.asarray(weights, dtype=np.float64).ravel()
+        self.signal.fill(scores[labels], weights[labels])
+        self.background.fill(scores[~labels], weights[~labels])
+        return self
+
+    def merge(self, other):
+        self.signal.merge(other.signal)
+        self.background.merge(other.background)
+        return self
+
+    def roc(self):
+        return roc_from_counts(self.signal.sumw, self.background.sumw)
+
+    def auc(self):
+        return auc_from_counts(self.signal.sumw, self.background.sumw)
+
+    def rejection(self, efficiencies):
+        return rejection_from_counts(self.signal.sumw, self.background.sumw, efficiencies)
+
+    def significance(self, min_background=0.0):
+        return significance_from_counts(self.signal.sumw, self.background.sumw, self.edges, min_background)
+
+    def best_cut(self, min_background=0.0):
+        """(cut, S, B, S/sqrt(B)) of the cut with the highest S/sqrt(B)."""
+        cuts, s, b, z = self.significance(min_background)
+        k = int(np.argmax(z))
+        return float(cuts[k]), float(s[k]), float(b[k]), float(z[k])
+
+    def summary(self, efficiencies=(0.5, 0.8, 0.9), min_background=0.0):
+        """Dict with the weighted AUC, the rejections at the given signal efficiencies and the best S/sqrt(B) cut."""
+        cut, s, b, z = self.best_cut(min_background)
+        result = {"auc": self.auc(), "signal_yield": float(self.signal.sumw.sum()), "background_yield": float(self.background.sumw.sum())}
+        for eff, rej in zip(efficiencies, self.rejection(efficiencies)):
+            result[f"rejection@{eff:g}"] = float(rej)
+        result.update({"best_cut": cut, "best_S": s, "best_B": b, "best_S/sqrt(B)": z})
+        return result
+
+def hist_from_root(path, name):
+    """ScoreHist with the contents (including flow bins) of a regular-binned TH1 written by the readers."""
+    import uproot
+    with uproot.open(path) as f:
+        th1 = f[name]
+        edges = th1.axis().edges()
+        hist = ScoreHist(len(edges) - 1, float(edges[0]), float(edges[-1]))
+        hist.sumw = np.asarray(th1.values(flow=True), dtype=np.float64)
+        hist.sumw2 = np.asarray(th1.variances(flow=True), dtype=np.float64)
+        hist.entries = int(th1.member("fEntries"))
+    return hist
+
+def from_reader_outputs(paths, signal_samples, prefix="h_score_fine_"):
+    """
+    ScoreHists from Reader_*.py / run_readers.py output files: every histogram named <prefix><sample> counts as
+    signal if sample is in signal_samples, as background otherwise. Falls back to the h_score_ histograms.
+    """
+    import uproot
+    hists = None
+    for path in paths:
+        with uproot.open(path) as f:
+            names = [key.split(";")[0] for key in f.keys()]
+        chosen = [n for n in names if n.startswith(prefix)] or [n for n in names if n.startswith("h_score_")]
+        for name in chosen:
+            sample = re.sub(r"^h_score_(fine_)?", "", name)
+            hist = hist_from_root(path, name)
+            if hists is None:
+                hists = ScoreHists(hist.nbins, hist.xmin, hist.xmax)
+            target = hists.signal if sample in signal_samples else hists.background
+            if (hist.nbins, hist.xmin, hist.xmax) != (target.nbins, target.xmin, target.xmax):
+                raise ValueError(f"{path}:{name} has a different binning than the histograms read before")
+            target.merge(hist)
+    if hists is None:
+        raise ValueError("no score histograms found")
+    return hists
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Weighted ROC/AUC, rejection and S/sqrt(B) from reader score histograms.")
+    parser.add_argument("files", nargs="+", help="Reader output files with h_score_[fine_]<sample> histograms")
+    parser.add_argument("--signal", nargs="+", required=True, help="Sample names counted as signal")
+    parser.add_argument("--efficiencies", type=float, nargs="+", default=[0.5, 0.8, 0.9])
+    parser.add_argument("--min-background", type=float, default=1.0, help="Minimum background yield for the S/sqrt(B) scan")
+    args = parser.parse_args()
+
+    missing = [f for f in args.files if not os.path.exists(f)]
+    if missing:
+        print(f"FATAL: input files not found: {missing}")
+        raise SystemExit(1)
+    hists = from_reader_outputs(args.files, set(args.signal))
+    print(f"{hists.signal.nbins} bins in [{hists.signal.xmin}, {hists.signal.xmax}]")
+    for key, value in hists.summary(args.efficiencies, args.min_background).items():
+        print(f"{key:<20}{value:>14.6g}")
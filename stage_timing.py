@@ -0,0 +1,68 @@
+"""
+Per-stage wall time and event counts for the scoring scripts, the k-fold splitter and the readers.
+Timing is always collected (it costs a perf_counter call per stage); it is only written out when the
+STAGE_TIMINGS environment variable names a JSON file, which is how benchmark.py reads it back.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import resource
+from contextlib import contextmanager
+
+_stages = {}
+_start = time.perf_counter()
+
+def _record(name, seconds, events):
+    entry = _stages.setdefault(name, {"seconds": 0.0, "events": 0})
+    entry["seconds"] += seconds
+    entry["events"] += int(events)
+
+@contextmanager
+def stage(name, events=0):
+    """Times the enclosed block as part of stage name, which processed events events."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - start, events)
+
+def add_events(name, events):
+    """Adds events to a stage whose size is only known after it ran."""
+    _record(name, 0.0, events)
+
+def timed_iter(name, iterable, count=len):
+    """Yields from iterable, timing every next() as stage name and counting count(item) events per item."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            _record(name, time.perf_counter() - start, 0)
+            return
+        _record(name, time.perf_counter() - start, count(item) if count else 0)
+        yield item
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is in kB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+def summary():
+    return {
+        "wall_seconds": time.perf_counter() - _start,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {name: dict(entry) for name, entry in _stages.items()},
+    }
+
+def dump(path=None):
+    """Writes summary() to path (default: $STAGE_TIMINGS); does nothing if neither is set."""
+    path = path or os.environ.get("STAGE_TIMINGS")
+    if not path:
+        return
+    with open(path, "w") as f:
+        json.dump(summary(), f, indent=2)
+
+atexit.register(dump)
@@ -0,0 +1,220 @@
+"""
+Streaming tf.data input pipeline over the ROOT (sel_tree) and pandas-HDF5 ntuples read by load_root_data /
+load_h5_data in the Keras notebooks, so training starts on the first chunks and datasets larger than RAM
+can be used.
+
+Every file is read in row chunks (through feature_cache / h5_projection) by a parallel interleave across files.
+Chunks are cut into small permuted blocks, mixed by a shuffle buffer, rebatched, standardised in a map stage
+and prefetched. Elements are (x, y, sample_weight) batches, so model.fit() picks the weights up directly.
+
+    python tf_pipeline.py --sig sig.root --bkg ttbar.root znunu.root --features jet1_pt met_sig --measure-only
+"""
+import os
+import time
+import argparse
+import itertools
+import numpy as np
+import tensorflow as tf
+import uproot
+from sklearn.preprocessing import StandardScaler
+import feature_cache
+import h5_projection
+import ntuple_catalog
+
+CHUNK_ROWS = 65536
+BLOCK_ROWS = 256
+
+def _is_h5(path):
+    return path.endswith((".h5", ".hdf5"))
+
+def read_chunks(path, features, weight="weight", tree_name="sel_tree", chunk_rows=CHUNK_ROWS):
+    """
+    Yields (X, w) row chunks of one file: X is (rows, len(features)) float32, w the weight column
+    (ones if the file has none). ROOT files without tree_name are skipped with a warning.
+    """
+    features = list(features)
+    k = len(features)
+    if _is_h5(path):
+        use_w = weight in h5_projection.column_names(path)
+        for chunk in h5_projection.iter_columns(path, features + ([weight] if use_w else []), chunk_rows):
+            yield chunk[:, :k], (chunk[:, k] if use_w else np.ones(len(chunk), dtype=np.float32))
+        return
+
+    available = ntuple_catalog.branches(path, tree_name)
+    if available is None:
+        print(f"WARNING: {path} has no '{tree_name}', skipping")
+        return
+    use_w = weight in available
+    with uproot.open(path) as f:
+        tree = f[tree_name]
+        for arrays in feature_cache.iterate_tree(tree, features + ([weight] if use_w else []), step_size=chunk_rows):
+            X = np.empty((len(arrays[features[0]]), k), dtype=np.float32)
+            for j, b in enumerate(features):
+                X[:, j] = arrays[b]
+            w = np.asarray(arrays[weight], dtype=np.float32) if use_w else np.ones(len(X), dtype=np.float32)
+            yield X, w
+
+def fit_scaler(sources, features, part=None, n_folds=5, fold=1, **read_kwargs):
+    """StandardScaler fitted in one streaming pass over the (selected rows of the) sources."""
+    scaler = StandardScaler()
+    for path, _ in sources:
+        offset = 0
+        for X, _ in read_chunks(path, features, **read_kwargs):
+            keep = _part_mask(offset, len(X), part, n_folds, fold)
+            offset += len(X)
+            if keep is not None:
+                X = X[keep]
+            if len(X):
+                scaler.partial_fit(X)
+    return scaler
+
+def _part_mask(offset, n, part, n_folds, fold):
+    """Row mask of a chunk for part 'train' / 'val' (entry % n_folds == fold - 1 is validation), or None for all rows."""
+    if part is None:
+        return None
+    is_val = (np.arange(offset, offset + n) % n_folds) == (fold - 1)
+    return is_val if part == "val" else ~is_val
+
+def make_dataset(sources, features, batch_size, scaler=None, part=None, n_folds=5, fold=1,
+                 shuffle=True, shuffle_rows=1_000_000, cycle_length=4, cache=None, abs_weights=False,
+                 seed=None, chunk_rows=CHUNK_ROWS, block_rows=BLOCK_ROWS, weight="weight", tree_name="sel_tree"):
+    """
+    tf.data.Dataset of (x, y, sample_weight) batches over sources, a list of (path, label) pairs.
+
+    part / n_folds / fold: None for all rows, or 'train' / 'val' for a deterministic split on the entry number.
+    scaler: a fitted StandardScaler (see fit_scaler, scaler_sidecar.load_scaler) applied as a map stage.
+    shuffle_rows: approximate size of the shuffle buffer in rows; files are also read in shuffled order.
+    cycle_length: files read concurrently by the interleave.
+    cache: None, "" (in memory) or a file prefix for Dataset.cache; later epochs then skip the ntuple reads
+           (the block order inside the cache is fixed, the shuffle buffer still mixes blocks every epoch).
+    """
+    sources = [(str(path), int(label)) for path, label in sources]
+    features = list(features)
+    k = len(features)
+    epoch_counter = itertools.count()
+
+    def file_blocks(i):
+        path, label = sources[int(i)]
+        rng = np.random.default_rng(None if seed is None else (seed, int(i), next(epoch_counter)))
+        offset = 0
+        for X, w in read_chunks(path, features, weight, tree_name, chunk_rows):
+            keep = _part_mask(offset, len(X), part, n_folds, fold)
+            offset += len(X)
+            if keep is not None:
+                X, w = X[keep], w[keep]
+            if abs_weights:
+                w = np.abs(w)
+            order = rng.permutation(len(X)) if shuffle else np.arange(len(X))
+            y = np.full(len(X), label, dtype=np.float32)
+            for start in range(0, len(X), block_rows):
+                sel = order[start:start + block_rows]
+                yield X[sel], y[sel], w[sel]
+
+    signature = (
+        tf.TensorSpec(shape=(None, k), dtype=tf.float32),
+        tf.TensorSpec(shape=(None,), dtype=tf.float32),
+        tf.TensorSpec(shape=(None,), dtype=tf.float32),
+    )
+    files = tf.data.Dataset.range(len(sources))
+    if shuffle:
+        files = files.shuffle(len(sources), seed=seed)
+    ds = files.interleave(
+        lambda i: tf.data.Dataset.from_generator(file_blocks, output_signature=signature, args=(i,)),
+        cycle_length=max(1, min(cycle_length, len(sources))),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not shuffle,
+    )
+    if cache is not None:
+        ds = ds.cache(cache)
+    if shuffle:
+        ds = ds.shuffle(max(1, shuffle_rows // block_rows), seed=seed)
+    ds = ds.rebatch(batch_size)
+
+    if scaler is not None:
+        mean = tf.constant(np.asarray(scaler.mean_, dtype=np.float32))
+        inv_scale = tf.constant(1.0 / np.asarray(scaler.scale_, dtype=np.float32))
+        ds = ds.map(lambda x, y, w: ((x - mean) * inv_scale, y, w), num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+class SamplesPerSecond(tf.keras.callbacks.Callback):
+    """Prints and records the training throughput of every epoch (steps x batch_size over the epoch's wall time)."""
+
+    def __init__(self, batch_size):
+        super().__init__()
+        self.batch_size = batch_size
+        self.rates = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._steps = 0
+        self._start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._steps += 1
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self._start
+        rate = self._steps * self.batch_size / seconds if seconds > 0 else 0.0
+        self.rates.append(rate)
+        if logs is not None:
+            logs["samples_per_second"] = rate
+        print(f"Epoch {epoch + 1}: ~{rate:,.0f} samples/s ({self._steps} steps in {seconds:.1f} s)")
+
+def measure(dataset, max_batches=None):
+    """Iterates the dataset without training; returns (rows, seconds, rows/s) of the input pipeline alone."""
+    rows, start = 0, time.perf_counter()
+    for n, (x, _, _) in enumerate(dataset):
+        rows += int(x.shape[0])
+        if max_batches and n + 1 >= max_batches:
+            break
+    seconds = time.perf_counter() - start
+    return rows, seconds, rows / seconds if seconds > 0 else 0.0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train (or just time) the Keras DNN on a streaming tf.data pipeline.")
+    parser.add_argument("--sig", nargs="+", required=True, help="Signal ntuples (ROOT or pandas-HDF5)")
+    parser.add_argument("--bkg", nargs="+", required=True, help="Background ntuples (ROOT or pandas-HDF5)")
+    parser.add_argument("--features", nargs="+", required=True)
+    parser.add_argument("--tree", default="sel_tree")
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--lr", type=float, default=5e-5)
+    parser.add_argument("--shuffle-rows", type=int, default=1_000_000)
+    parser.add_argument("--cycle-length", type=int, default=4, help="Files read concurrently")
+    parser.add_argument("--cache", help="Dataset.cache file prefix for the training set ('' for memory)")
+    parser.add_argument("--abs-weights", action="store_true")
+    parser.add_argument("--measure-only", action="store_true", help="Time one pass of the input pipeline and exit")
+    parser.add_argument("--output", default="best_model.keras")
+    args = parser.parse_args()
+
+    sources = [(f, 1) for f in args.sig] + [(f, 0) for f in args.bkg]
+    missing = [f for f, _ in sources if not os.path.exists(f)]
+    if missing:
+        print(f"FATAL: input files not found: {missing}")
+        raise SystemExit(1)
+
+    print("--- Fitting the input scaler (one streaming pass) ---")
+    scaler = fit_scaler(sources, args.features, part="train", tree_name=args.tree)
+    common = dict(scaler=scaler, shuffle_rows=args.shuffle_rows, cycle_length=args.cycle_length,
+                  abs_weights=args.abs_weights, tree_name=args.tree)
+    train_ds = make_dataset(sources, args.features, args.batch_size, part="train", cache=args.cache, **common)
+
+    if args.measure_only:
+        rows, seconds, rate = measure(train_ds)
+        print(f"Input pipeline: {rows} rows in {seconds:.1f} s = {rate:,.0f} samples/s")
+        raise SystemExit(0)
+
+    from scaler_sidecar import save_scaler
+    from tensorflow.keras.optimizers import Adam
+    from tensorflow.keras.callbacks import EarlyStopping
+    from tensorflow.keras.metrics import AUC
+    from train_kfold import build_model
+
+    val_ds = make_dataset(sources, args.features, args.batch_size, part="val", shuffle=False, cache="", **common)
+    model = build_model(len(args.features))
+    model.compile(optimizer=Adam(learning_rate=args.lr), loss='binary_crossentropy', weighted_metrics=[AUC(name='auc')])
+    throughput = SamplesPerSecond(args.batch_size)
+    model.fit(train_ds, validation_data=val_ds, epochs=args.epochs, verbose=2,
+              callbacks=[EarlyStopping(monitor='val_auc', patience=20, mode='max', restore_best_weights=True), throughput])
+    model.save(args.output)
+    save_scaler(scaler, args.features, args.output)
+    print(f"Mean training throughput: {np.mean(throughput.rates):,.0f} samples/s")
@@ -0,0 +1,201 @@
+"""
+Bulk loading of the k-fold ntuples (<sample>_fold<N>.root) into a TMVA DataLoader.
+Whole trees are handed to TMVA with an abs(weight) weight expression instead of adding events one by one.
+For training several folds in one process, every sample is read once instead (load_fold_data) and the
+per-fold training/test sets are added from memory (add_fold_arrays, run_folds).
+"""
+import os
+import shutil
+import tempfile
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import uproot
+import ROOT
+from ROOT import TMVA, TFile
+import feature_cache
+import fold_index
+
+WEIGHT_EXPRESSION = "abs(weight)"
+
+def is_signal(sample):
+    return "sT" in sample
+
+def tree_weight_sum(tree):
+    """Sum of |weight| over a tree, computed in one columnar pass."""
+    return ROOT.RDataFrame(tree).Define("abs_weight", "std::abs(weight)").Sum("abs_weight").GetValue()
+
+def add_fold_trees(loader, indir, samples, fold):
+    """
+    Adds the 'training' tree of every <sample>_fold<fold>.root as training events and its 'validation' tree as test events.
+    Returns (open_files, weight_sums). The files must stay open until training and evaluation are done.
+    """
+    loader.SetSignalWeightExpression(WEIGHT_EXPRESSION)
+    loader.SetBackgroundWeightExpression(WEIGHT_EXPRESSION)
+
+    weight_sums = {"s_test_weights": 0., "s_train_weights": 0., "b_test_weights": 0., "b_train_weights": 0.}
+    open_files = []
+    for sample in samples:
+        print("")
+        print("Sample:", sample)
+        rfilename = indir+"/"+sample+"_fold"+str(fold)+".root"
+        print("reading", rfilename)
+        rfile = TFile(rfilename, "READ")
+        open_files.append(rfile)
+        prefix = "s" if is_signal(sample) else "b"
+        for treename, treetype, tag in (("training", TMVA.Types.kTraining, "train"), ("validation", TMVA.Types.kTesting, "test")):
+            tree = rfile.Get(treename)
+            print(treename, "nentries", tree.GetEntries())
+            if is_signal(sample):
+                loader.AddSignalTree(tree, 1.0, treetype)
+            else:
+                loader.AddBackgroundTree(tree, 1.0, treetype)
+            weight_sums[f"{prefix}_{tag}_weights"] += tree_weight_sum(tree)
+    return open_files, weight_sums
+
+# --- All folds from one read ---
+# Fold file N (kfold_split_trees.py) holds contiguous block N-1 as 'test', every other block as 'training'
+# and block N as 'validation'. Reading the 'test' tree of every fold file therefore yields each event once,
+# and the training/validation trees of any fold can be rebuilt in memory from the block numbers.
+# Samples with a fold-index sidecar (fold_index.py) are read from sel_tree once, with the blocks of the sidecar.
+
+N_FOLDS = 5
+
+_ADD_EVENTS_CODE = """
+#include "TMVA/DataLoader.h"
+#include <cstdint>
+#include <vector>
+void tmva_inputs_add_events(TMVA::DataLoader& loader, const char* class_name, int tree_type,
+                            const float* X, const double* w, const int64_t* rows, int64_t n_rows, int n_vars)
+{
+    std::vector<Double_t> event(n_vars);
+    const auto type = static_cast<TMVA::Types::ETreeType>(tree_type);
+    for (long long i = 0; i < n_rows; ++i) {
+        const float* row = X + rows[i] * n_vars;
+        for (int j = 0; j < n_vars; ++j) event[j] = row[j];
+        loader.AddEvent(class_name, type, event, w[rows[i]]);
+    }
+}
+"""
+_add_events_declared = False
+
+def parse_folds(value, n_folds=N_FOLDS):
+    """'all' -> [1..n_folds]; '1,3' -> [1, 3]."""
+    if value == "all":
+        return list(range(1, n_folds + 1))
+    folds = [int(f) for f in value.split(",")]
+    if any(f < 1 or f > n_folds for f in folds):
+        raise ValueError(f"folds must be between 1 and {n_folds}: {value}")
+    return folds
+
+def has_fold_index(indir, samples):
+    """True if every sample has a fold-index sidecar, i.e. there are no per-fold trees to add."""
+    return all(fold_index.has_index(indir, sample) for sample in samples)
+
+def load_fold_data(indir, samples, input_vars, n_folds=N_FOLDS):
+    """
+    Reads every sample once: {sample: (X float32 (n, nvar), |weight| float64, block int8)} in sel_tree entry order,
+    where block is the 0-based fold block of each event.
+    """
+    data = {}
+    for sample in samples:
+        if fold_index.has_index(indir, sample):
+            index = fold_index.load_index(indir, sample)
+            if index["n_folds"] != n_folds:
+                raise ValueError(f"{fold_index.index_path(indir, sample)} has {index['n_folds']} folds, expected {n_folds}")
+            print("reading", index["source"], "with", fold_index.index_path(indir, sample))
+            with uproot.open(index["source"]) as f:
+                arrays = feature_cache.tree_arrays(f[index["tree"]], input_vars + ["weight"], library="np")
+            X = np.column_stack([arrays[v] for v in input_vars]).astype(np.float32)
+            data[sample] = (np.ascontiguousarray(X), np.abs(arrays["weight"].astype(np.float64)), index["block"])
+            print(sample, "events", len(data[sample][1]))
+            continue
+        Xs, ws, blocks = [], [], []
+        for fold in range(1, n_folds + 1):
+            rfilename = indir+"/"+sample+"_fold"+str(fold)+".root"
+            print("reading", rfilename)
+            with uproot.open(rfilename) as f:
+                arrays = feature_cache.tree_arrays(f["test"], input_vars + ["weight"], library="np")
+            Xs.append(np.column_stack([arrays[v] for v in input_vars]).astype(np.float32))
+            ws.append(np.abs(arrays["weight"].astype(np.float64)))
+            blocks.append(np.full(len(ws[-1]), fold - 1, dtype=np.int8))
+        data[sample] = (np.ascontiguousarray(np.concatenate(Xs)), np.concatenate(ws), np.concatenate(blocks))
+        print(sample, "events", len(data[sample][1]))
+    return data
+
+def fold_rows(block, fold, n_folds=N_FOLDS):
+    """(training rows, validation rows) of fold (1-based), matching the trees kfold_split_trees.py writes."""
+    return np.flatnonzero(block != fold - 1), np.flatnonzero(block == fold % n_folds)
+
+def add_fold_arrays(loader, data, samples, fold, n_folds=N_FOLDS):
+    """
+    In-memory counterpart of add_fold_trees: adds the training rows of fold as training events and its validation
+    rows as test events, weighted by |weight|, from load_fold_data() output. Returns weight_sums.
+    """
+    global _add_events_declared
+    if not _add_events_declared:
+        ROOT.gInterpreter.Declare(_ADD_EVENTS_CODE)
+        _add_events_declared = True
+
+    weight_sums = {"s_test_weights": 0., "s_train_weights": 0., "b_test_weights": 0., "b_train_weights": 0.}
+    for sample in samples:
+        X, w, block = data[sample]
+        train_rows, test_rows = fold_rows(block, fold, n_folds)
+        class_name = "Signal" if is_signal(sample) else "Background"
+        prefix = "s" if is_signal(sample) else "b"
+        for rows, treetype, tag in ((train_rows, TMVA.Types.kTraining, "train"), (test_rows, TMVA.Types.kTesting, "test")):
+            rows = rows.astype(np.int64)
+            ROOT.tmva_inputs_add_events(loader, class_name, int(treetype), X, w, rows, len(rows), X.shape[1])
+            weight_sums[f"{prefix}_{tag}_weights"] += float(w[rows].sum())
+        print("Sample:", sample, "fold", fold, "training", len(train_rows), "validation", len(test_rows))
+    return weight_sums
+
+def share_fold_data(data, directory):
+    """Writes load_fold_data() output to .npy files in directory; returns {sample: (X path, w path, block path)}."""
+    paths = {}
+    for i, (sample, arrays) in enumerate(data.items()):
+        paths[sample] = tuple(os.path.join(directory, f"{i:03d}_{name}.npy") for name in ("X", "w", "block"))
+        for path, array in zip(paths[sample], arrays):
+            np.save(path, array)
+    return paths
+
+def open_fold_data(paths):
+    """share_fold_data() files as copy-on-write memory maps: the pages are shared by all processes reading them."""
+    return {sample: tuple(np.load(path, mmap_mode="c") for path in sample_paths) for sample, sample_paths in paths.items()}
+
+def _run_fold(train_fn, args, data_paths, fold):
+    return train_fn(*args, open_fold_data(data_paths), fold)
+
+def run_folds(train_fn, args, fold_data, folds, jobs=1):
+    """
+    Calls train_fn(*args, fold_data, fold) for every fold, in up to jobs processes. Returns the folds that failed.
+    The workers are spawned, not forked: forking after ROOT/cling (and for the DNN TensorFlow) have started their
+    threads is not safe. They get fold_data as memory-mapped .npy files in a temporary directory (under TMPDIR),
+    so the arrays are written once and their pages are shared instead of copied into every worker.
+    """
+    failed = []
+    if jobs <= 1:
+        for fold in folds:
+            try:
+                train_fn(*args, fold_data, fold)
+            except Exception as e:
+                print(f"ERROR: fold {fold} failed: {e}")
+                failed.append(fold)
+        return failed
+
+    share_dir = tempfile.mkdtemp(prefix="tmva_fold_data_")
+    try:
+        data_paths = share_fold_data(fold_data, share_dir)
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=mp.get_context("spawn")) as pool:
+            futures = {pool.submit(_run_fold, train_fn, args, data_paths, fold): fold for fold in folds}
+            for future in as_completed(futures):
+                fold = futures[future]
+                try:
+                    future.result()
+                    print(f"Fold {fold} finished")
+                except Exception as e:
+                    print(f"ERROR: fold {fold} failed: {e}")
+                    failed.append(fold)
+    finally:
+        shutil.rmtree(share_dir, ignore_errors=True)
+    return sorted(failed)
@@ -0,0 +1,248 @@
+"""
+Headless k-fold training of the tf-5fold.ipynb Keras DNN with all folds trained at once.
+The dataset is written once by write_dataset() (e.g. from the notebook after loading) as .npy files; every
+fold worker memory-maps it read-only, so no copy of the feature matrix is pickled or held per worker.
+Each fold's StandardScaler is fitted on its training rows and applied per batch. The best checkpoint of
+fold k is written to model_fold_{k}.h5 with its scaler sidecar, as in the notebook loop.
+Every fold also keeps a full-state checkpoint in <outdir>/checkpoints/fold_{k} (training_checkpoint.py); with
+--resume an interrupted fold continues from its last checkpoint, reusing the saved scaler instead of refitting
+it on the data, and finished folds are skipped.
+
+    python train_kfold.py --data kfold_data --outdir . --workers 5 --threads 4
+    python train_kfold.py --data kfold_data --outdir . --resume
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sklearn.model_selection import StratifiedKFold
+from sklearn.preprocessing import StandardScaler
+import tensorflow as tf
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.layers import Dense, Input
+from tensorflow.keras.optimizers import Adam
+from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau, ModelCheckpoint
+from tensorflow.keras.metrics import AUC, Precision, Recall
+from scaler_sidecar import save_scaler
+from training_checkpoint import TrainingCheckpoint, load_state, restore_weights
+
+FOLD_INDEX = "fold_index.npy"
+
+def write_dataset(outdir, X, y, w, features, folds=5, random_state=42):
+    """
+    Writes X (float32, row-major), y, w and the feature list to outdir, plus the StratifiedKFold(folds,
+    shuffle=True, random_state) assignment of every row as fold_index.npy (validation fold number, 1-based).
+    """
+    os.makedirs(outdir, exist_ok=True)
+    X = np.ascontiguousarray(np.asarray(X, dtype=np.float32))
+    y = np.asarray(y, dtype=np.int64)
+    w = np.asarray(w, dtype=np.float32)
+    fold_index = np.zeros(len(y), dtype=np.int8)
+    skf = StratifiedKFold(n_splits=folds, shuffle=True, random_state=random_state)
+    for fold, (_, va_idx) in enumerate(skf.split(np.zeros(len(y)), y), 1):
+        fold_index[va_idx] = fold
+    np.save(os.path.join(outdir, "X.npy"), X)
+    np.save(os.path.join(outdir, "y.npy"), y)
+    np.save(os.path.join(outdir, "w.npy"), w)
+    np.save(os.path.join(outdir, FOLD_INDEX), fold_index)
+    with open(os.path.join(outdir, "meta.json"), "w") as f:
+        json.dump({"features": list(features), "folds": folds, "random_state": random_state, "n_rows": len(y)}, f, indent=2)
+    print(f"Wrote dataset {X.shape} with {folds} folds to {outdir}")
+
+def build_model(input_dim):
+    model = Sequential([
+        Input(shape=(input_dim,)),
+        Dense(128, kernel_initializer='he_normal', activation='gelu'),
+        Dense(64, kernel_initializer='he_normal', activation='gelu'),
+        Dense(32, kernel_initializer='he_normal', activation='gelu'),
+        Dense(1, activation='sigmoid')
+    ])
+    return model
+
+class FoldBatches(tf.keras.utils.PyDataset):
+    """
+    (x, y, sample_weight) batches of the given rows of memory-mapped arrays, standardised on the fly.
+    With shuffle the row order of an epoch depends only on (seed, epoch), so a resumed training that starts at
+    set_epoch(initial_epoch) sees the same batches as an uninterrupted one.
+    """
+
+    def __init__(self, X, y, w, rows, mean, scale, batch_size, shuffle=False, seed=0):
+        super().__init__()
+        self.X, self.y, self.w = X, y, w
+        self.rows = rows
+        self.mean = mean.astype(np.float32)
+        self.inv_scale = (1.0 / scale).astype(np.float32)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.set_epoch(0)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+        self.order = np.random.default_rng([self.seed, epoch]).permutation(self.rows) if self.shuffle else self.rows
+
+    def __len__(self):
+        return (len(self.rows) + self.batch_size - 1) // self.batch_size
+
+    def __getitem__(self, i):
+        idx = self.order[i * self.batch_size:(i + 1) * self.batch_size]
+        if self.shuffle:
+            # Same batch contents, but rows are gathered from the memmap in file order
+            idx = np.sort(idx)
+        xb = (self.X[idx] - self.mean) * self.inv_scale
+        return xb, self.y[idx], self.w[idx]
+
+    def on_epoch_end(self):
+        self.set_epoch(self.epoch + 1)
+
+def fit_scaler(X, rows, chunk_rows=1_000_000):
+    """StandardScaler fitted on X[rows], reading at most chunk_rows rows at a time."""
+    scaler = StandardScaler()
+    for start in range(0, len(rows), chunk_rows):
+        scaler.partial_fit(X[rows[start:start + chunk_rows]])
+    return scaler
+
+def _init_worker(intra_threads, inter_threads):
+    tf.config.threading.set_intra_op_parallelism_threads(intra_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_threads)
+
+def train_fold(data_dir, fold, outdir, lr, epochs, batch_size, patience, seed, checkpoint_every=1, resume=False):
+    """
+    Trains one fold and returns a summary dict; runs inside a worker process.
+    checkpoint_every: epochs between full-state checkpoints (0: none). resume: continue from the last checkpoint.
+    """
+    start = time.perf_counter()
+    tf.keras.utils.set_random_seed(seed + fold)
+    X = np.load(os.path.join(data_dir, "X.npy"), mmap_mode="r")
+    y = np.load(os.path.join(data_dir, "y.npy"), mmap_mode="r")
+    w = np.load(os.path.join(data_dir, "w.npy"), mmap_mode="r")
+    fold_index = np.load(os.path.join(data_dir, FOLD_INDEX), mmap_mode="r")
+    with open(os.path.join(data_dir, "meta.json")) as f:
+        features = json.load(f)["features"]
+
+    tr_idx = np.flatnonzero(fold_index != fold)
+    va_idx = np.flatnonzero(fold_index == fold)
+    checkpoint = os.path.join(outdir, f"model_fold_{fold}.h5")
+    state_dir = os.path.join(outdir, "checkpoints", f"fold_{fold}")
+    state = load_state(state_dir) if resume else None
+
+    if state is not None:
+        print(f"Fold {fold}: resuming after epoch {state['epoch']}{' (finished)' if state['finished'] else ''}")
+        mean, scale = np.array(state["extra"]["scaler_mean"]), np.array(state["extra"]["scaler_scale"])
+    else:
+        scaler = fit_scaler(X, tr_idx)
+        save_scaler(scaler, features, checkpoint)
+        mean, scale = scaler.mean_, scaler.scale_
+
+    model = build_model(input_dim=X.shape[1])
+    model.compile(
+        optimizer=Adam(learning_rate=lr),
+        loss='binary_crossentropy',
+        weighted_metrics=[AUC(name='auc'), 'accuracy', Precision(name='precision'), Recall(name='recall')]
+    )
+    if state is not None:
+        restore_weights(model, state_dir, state)
+
+    train_data = FoldBatches(X, y, w, tr_idx, mean, scale, batch_size, shuffle=True, seed=seed + fold)
+    val_data = FoldBatches(X, y, w, va_idx, mean, scale, batch_size)
+
+    callbacks = [
+        EarlyStopping(monitor='val_auc', patience=patience, mode='max', verbose=1),
+        ReduceLROnPlateau(monitor='val_auc', factor=0.2, patience=5, mode='max', verbose=1, min_lr=1e-7),
+        ModelCheckpoint(checkpoint, monitor='val_auc', save_best_only=True, mode='max')
+    ]
+    if state is not None and state["finished"]:
+        history_dict = state["history"]
+    elif checkpoint_every > 0 or state is not None:
+        extra = {"scaler_mean": [float(v) for v in mean], "scaler_scale": [float(v) for v in scale]}
+        # Goes last: it restores the counters of the other callbacks after their on_train_begin resets
+        state_checkpoint = TrainingCheckpoint(state_dir, callbacks, max(1, checkpoint_every), extra, state)
+        train_data.set_epoch(state_checkpoint.initial_epoch)
+        # shuffle=False: the rows are already permuted per epoch; Keras' own batch shuffling is not reproducible on resume
+        model.fit(train_data, validation_data=val_data, epochs=epochs, initial_epoch=state_checkpoint.initial_epoch,
+                  shuffle=False, callbacks=callbacks + [state_checkpoint], verbose=2)
+        history_dict = state_checkpoint.history
+    else:
+        history = model.fit(train_data, validation_data=val_data, epochs=epochs, shuffle=False, callbacks=callbacks, verbose=2)
+        history_dict = {k: [float(v) for v in vals] for k, vals in history.history.items()}
+    with open(os.path.join(outdir, f"history_fold_{fold}.json"), "w") as f:
+        json.dump(history_dict, f, indent=2)
+    val_auc = history_dict.get("val_auc", [float("nan")])
+    return {
+        "fold": fold,
+        "train": len(tr_idx),
+        "val": len(va_idx),
+        "epochs": len(val_auc),
+        "best_val_auc": max(val_auc),
+        "seconds": time.perf_counter() - start,
+        "checkpoint": checkpoint,
+    }
+
+def train_all(data_dir, outdir, folds=None, workers=None, threads=None, inter_threads=1,
+              lr=1e-6, epochs=100, batch_size=1024, patience=15, seed=42, checkpoint_every=1, resume=False):
+    """Trains (or resumes) the given folds (default: all) concurrently; returns the per-fold summaries in fold order."""
+    with open(os.path.join(data_dir, "meta.json")) as f:
+        meta = json.load(f)
+    folds = folds or list(range(1, meta["folds"] + 1))
+    workers = workers or len(folds)
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    os.makedirs(outdir, exist_ok=True)
+    print(f"Training folds {folds} on {meta['n_rows']} rows: {workers} workers x {threads} intra-op / {inter_threads} inter-op threads")
+
+    # Thread pools are sized when TF starts in the worker; the environment covers OpenMP/oneDNN as well
+    for var in ("OMP_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"):
+        os.environ[var] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = str(inter_threads)
+
+    results, failed = {}, []
+    # spawn, not fork: a forked TF runtime is not usable in the child
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                             initializer=_init_worker, initargs=(threads, inter_threads)) as pool:
+        futures = {pool.submit(train_fold, data_dir, fold, outdir, lr, epochs, batch_size, patience, seed,
+                               checkpoint_every, resume): fold for fold in folds}
+        for future in as_completed(futures):
+            fold = futures[future]
+            try:
+                results[fold] = future.result()
+            except Exception as e:
+                print(f"WARNING: fold {fold} failed: {e}")
+                failed.append(fold)
+                continue
+            r = results[fold]
+            print(f"Fold {fold} done: best val_auc={r['best_val_auc']:.4f} after {r['epochs']} epochs ({r['seconds']:.0f} s)")
+
+    print(f"\n{'Fold':>4}{'Train':>12}{'Val':>12}{'Epochs':>8}{'Best val AUC':>14}{'Time (s)':>10}")
+    for fold in sorted(results):
+        r = results[fold]
+        print(f"{fold:>4}{r['train']:>12}{r['val']:>12}{r['epochs']:>8}{r['best_val_auc']:>14.4f}{r['seconds']:>10.0f}")
+    if failed:
+        print(f"FATAL: folds {sorted(failed)} failed")
+    return [results[fold] for fold in sorted(results)]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train all k folds of the Keras DNN concurrently.")
+    parser.add_argument("--data", required=True, help="Directory written by write_dataset()")
+    parser.add_argument("--outdir", default=".", help="Where model_fold_{k}.h5 and the histories go")
+    parser.add_argument("--folds", type=int, nargs="+", help="Folds to train (default: all)")
+    parser.add_argument("--workers", type=int, help="Concurrent folds (default: one per fold)")
+    parser.add_argument("--threads", type=int, help="Intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--inter-op-threads", type=int, default=1)
+    parser.add_argument("--lr", type=float, default=1e-6)
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--patience", type=int, default=15, help="EarlyStopping patience on val_auc")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--checkpoint-every", type=int, default=1, help="Epochs between full-state checkpoints (0: none)")
+    parser.add_argument("--resume", action="store_true", help="Continue every fold from its last checkpoint in <outdir>/checkpoints")
+    args = parser.parse_args()
+
+    results = train_all(args.data, args.outdir, args.folds, args.workers, args.threads, args.inter_op_threads,
+                        args.lr, args.epochs, args.batch_size, args.patience, args.seed, args.checkpoint_every, args.resume)
+    with open(os.path.join(args.data, "meta.json")) as f:
+        n_folds = len(args.folds) if args.folds else json.load(f)["folds"]
+    if len(results) != n_folds:
+        sys.exit(1)
@@ -0,0 +1,108 @@
+"""
+Full-state checkpoints of a Keras training, so a preempted fold continues where it stopped instead of restarting.
+TrainingCheckpoint is a Keras callback that every `every` epochs writes <directory>/epoch_<N>.weights.h5 (model
+weights and optimizer state) and then state.json with the next epoch, the learning rate, the history so far, the counters
+and best values of the EarlyStopping / ReduceLROnPlateau / ModelCheckpoint callbacks it tracks and any extra
+state of the caller (e.g. the fitted scaler). state.json is replaced atomically once the model file is complete,
+so it always points to a consistent checkpoint.
+
+    state = load_state(ckpt_dir) if resume else None
+    model = build_and_compile()
+    if state:
+        restore_weights(model, ckpt_dir, state)
+    checkpoint = TrainingCheckpoint(ckpt_dir, callbacks, extra={...}, state=state)
+    model.fit(..., initial_epoch=checkpoint.initial_epoch, callbacks=callbacks + [checkpoint])
+
+With fixed seeds a resumed run ends with the same weights as an uninterrupted one, provided the batch order
+depends only on (seed, epoch) (see train_kfold.FoldBatches) and the model has no dropout or other random
+layers. EarlyStopping(restore_best_weights=True) is not covered: its best weights are not part of the state.
+"""
+import os
+import glob
+import json
+import keras
+
+STATE_FILE = "state.json"
+CALLBACK_STATE = ("wait", "best", "best_epoch", "stopped_epoch", "cooldown_counter")
+
+def _plain(value):
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    return float(value)
+
+def load_state(directory):
+    """The last complete checkpoint state of directory, or None if there is none."""
+    path = os.path.join(directory, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def restore_weights(model, directory, state):
+    """Loads the weights and optimizer state of the checkpoint described by state into a compiled model."""
+    # The optimizer variables only exist once it is built; unbuilt, their saved values would be skipped
+    model.optimizer.build(model.trainable_variables)
+    model.load_weights(os.path.join(directory, state["model"]))
+
+class TrainingCheckpoint(keras.callbacks.Callback):
+    """
+    Writes a checkpoint every `every` epochs, when training stops early and at the end of training.
+    callbacks: the EarlyStopping / ReduceLROnPlateau / ModelCheckpoint instances whose counters are saved; they
+               must come before this callback in the list passed to fit so that their on_train_begin resets run first.
+    state: a loaded state to continue from; its callback counters and learning rate are restored at train begin.
+    """
+
+    def __init__(self, directory, callbacks=(), every=1, extra=None, state=None):
+        super().__init__()
+        self.directory = directory
+        self.tracked = list(callbacks)
+        self.every = max(1, every)
+        self.extra = dict(extra or {})
+        self.state = state
+        self.history = {k: list(v) for k, v in state["history"].items()} if state else {}
+        self.initial_epoch = state["epoch"] if state else 0
+        self._epoch = self._saved = self.initial_epoch
+        os.makedirs(directory, exist_ok=True)
+
+    def on_train_begin(self, logs=None):
+        if self.state is None:
+            return
+        for callback, saved in zip(self.tracked, self.state["callbacks"]):
+            for attr, value in saved.items():
+                setattr(callback, attr, value)
+        self.model.optimizer.learning_rate = self.state["learning_rate"]
+
+    def on_epoch_end(self, epoch, logs=None):
+        for key, value in (logs or {}).items():
+            self.history.setdefault(key, []).append(float(value))
+        self._epoch = epoch + 1
+        if self._epoch % self.every == 0 or self.model.stop_training:
+            self.save(self._epoch)
+
+    def on_train_end(self, logs=None):
+        self.save(self._epoch, finished=True)
+
+    def save(self, epoch, finished=False):
+        if epoch == self._saved and not finished:
+            return
+        model_name = f"epoch_{epoch}.weights.h5"
+        if not os.path.exists(os.path.join(self.directory, model_name)) or epoch != self._saved:
+            self.model.save_weights(os.path.join(self.directory, model_name))
+        state = {
+            "epoch": epoch,
+            "model": model_name,
+            "finished": finished,
+            "learning_rate": float(keras.ops.convert_to_numpy(self.model.optimizer.learning_rate)),
+            "callbacks": [{attr: _plain(getattr(cb, attr)) for attr in CALLBACK_STATE if hasattr(cb, attr)} for cb in self.tracked],
+            "history": self.history,
+            "extra": self.extra,
+        }
+        tmp = os.path.join(self.directory, STATE_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, os.path.join(self.directory, STATE_FILE))
+        self._saved = epoch
+        # Older model files are no longer referenced
+        for path in glob.glob(os.path.join(self.directory, "epoch_*.weights.h5")):
+            if os.path.basename(path) != model_name:
+                os.remove(path)
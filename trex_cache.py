@@ -0,0 +1,129 @@
+"""
+Incremental TRexFitter runs: the steps of a job (n, w, f, d, p, l, s) are run one at a time and a step is
+skipped when its inputs are the same as when it last succeeded and its outputs are still in the job directory.
+The key of a step is a sha256 over the config text it depends on and the contents of the files it reads:
+
+    n        config without NormFactor / Fit / Limit / Significance blocks + the ntuple (or HIST input) files
+    w, d     whole config + Histograms/ written by n
+    f, l, s  whole config + RooStats/ written by w
+    p        whole config + Histograms/ + Fits/ written by f
+
+so changing only a NormFactor (e.g. the signal scale factor) reruns w, d, f and p but does not re-read the
+ntuples. An input the catalog cannot read (e.g. a truncated file) is hashed byte for byte instead, so the step
+reruns and TRexFitter reports the real error. Keys are stored in <OutputDir>/<Job>/trex_steps.json together with the content hashes of the files
+seen so far; a file is only hashed again when its size or modification time has changed. The ntuple / HIST
+inputs are hashed once for all jobs through the shared ntuple catalog (ntuple_catalog.py).
+Actions without a cache entry (e.g. r for the ranking) are always run, after the cached steps.
+"""
+import os
+import json
+import hashlib
+import trex_config
+import ntuple_catalog
+
+STEP_ORDER = "nwfdpls"
+STEP_INPUTS = {"n": (), "w": ("Histograms",), "d": ("Histograms",), "f": ("RooStats",), "l": ("RooStats",),
+               "s": ("RooStats",), "p": ("Histograms", "Fits")}
+STEP_OUTPUTS = {"n": "Histograms", "w": "RooStats", "f": "Fits", "d": "Plots", "p": "Plots", "l": "Limits", "s": "Significance"}
+NOT_IN_HISTOGRAMS = ("NormFactor", "Fit", "Limit", "Significance")
+STAMP_FILE = "trex_steps.json"
+CHUNK_BYTES = 1 << 24
+
+def file_digest(path, memo):
+    """sha256 of a file's contents; memo ({path: {size, mtime_ns, sha256}}) avoids re-reading unchanged files."""
+    stat = os.stat(path)
+    known = memo.get(path)
+    if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+        return known["sha256"]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+            h.update(chunk)
+    memo[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": h.hexdigest()}
+    return memo[path]["sha256"]
+
+def dir_digest(path, memo):
+    """sha256 over the relative names and contents of all files below path ('' if it does not exist)."""
+    if not os.path.isdir(path):
+        return ""
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            full = os.path.join(root, name)
+            h.update(os.path.relpath(full, path).encode())
+            h.update(file_digest(full, memo).encode())
+    return h.hexdigest()
+
+def input_digest(path, memo):
+    """Catalog sha256 of an ntuple / HIST input, or its file_digest if uproot cannot scan it (truncated, RNTuple, ...)."""
+    try:
+        return ntuple_catalog.checksum(path)
+    except (OSError, ValueError) as e:
+        print(f"WARNING: cannot index {path} ({e}), hashing its bytes instead")
+        return file_digest(path, memo)
+
+def step_key(step, blocks, job_dir, memo):
+    h = hashlib.sha256(step.encode())
+    if step == "n":
+        h.update(trex_config.render([b for b in blocks if b["type"] not in NOT_IN_HISTOGRAMS]).encode())
+        for path in trex_config.input_files(blocks):
+            h.update(path.encode())
+            h.update(input_digest(path, memo).encode() if os.path.exists(path) else b"missing")
+    else:
+        h.update(trex_config.render(blocks).encode())
+        for name in STEP_INPUTS[step]:
+            h.update(name.encode())
+            h.update(dir_digest(os.path.join(job_dir, name), memo).encode())
+    return h.hexdigest()
+
+def _has_outputs(job_dir, step):
+    out = os.path.join(job_dir, STEP_OUTPUTS[step])
+    return os.path.isdir(out) and bool(os.listdir(out))
+
+def load_stamps(job_dir):
+    path = os.path.join(job_dir, STAMP_FILE)
+    if not os.path.exists(path):
+        return {"steps": {}, "files": {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_stamps(job_dir, stamps):
+    os.makedirs(job_dir, exist_ok=True)
+    tmp = os.path.join(job_dir, STAMP_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(stamps, f, indent=1)
+    os.replace(tmp, os.path.join(job_dir, STAMP_FILE))
+
+def run_steps(config, actions, execute, force=False):
+    """
+    Runs the actions of config step by step through execute(step) -> exit code (None: not runnable), skipping
+    steps whose key and outputs are unchanged. Returns (exit code of the first failing step or 0, steps run, steps skipped).
+    """
+    blocks = trex_config.read_config(config)
+    job_dir = trex_config.job_dir(blocks)
+    stamps = load_stamps(job_dir)
+    cached = [s for s in STEP_ORDER if s in actions]
+    uncached = "".join(a for a in actions if a not in STEP_ORDER)
+
+    ran, skipped = "", ""
+    for step in cached:
+        key = step_key(step, blocks, job_dir, stamps["files"])
+        if not force and stamps["steps"].get(step) == key and _has_outputs(job_dir, step):
+            skipped += step
+            continue
+        # Forget the old key first: a step that fails or is interrupted must not look up to date next time
+        stamps["steps"].pop(step, None)
+        save_stamps(job_dir, stamps)
+        returncode = execute(step)
+        if returncode != 0:
+            return returncode, ran, skipped
+        ran += step
+        stamps["steps"][step] = key
+        save_stamps(job_dir, stamps)
+    if uncached:
+        returncode = execute(uncached)
+        if returncode != 0:
+            return returncode, ran, skipped
+        ran += uncached
+    return 0, ran, skipped
@@ -0,0 +1,141 @@
+"""
+Minimal reader for TRexFitter config files, enough to know what a job reads and where it writes.
+A config is a sequence of blocks: an unindented `Type: "Name"` header line (Job, Fit, Limit, Region, Sample,
+NormFactor, Systematic, ...) followed by indented `Key: value` option lines. Comments start with % or #.
+
+    blocks = read_config("config_LQ_2TeV.txt")
+    job_dir(blocks)       -> "./LQ_2TeV_ML_ctagged_fit/LQ_2TeV"
+    input_files(blocks)   -> ["./discriminant_ntuples_lq_ctagged.root"]
+
+hist_mode(text) turns a ReadFrom: NTUP config into one that reads the pre-binned histograms the scoring
+scripts write with --hist-output (one TH1 per TTree, named like the tree, in <ntuple file>_hists.root).
+"""
+import os
+import re
+import itertools
+
+HIST_SUFFIX = "_hists"
+
+def _strip_comment(line):
+    for marker in ("%", "#"):
+        pos = line.find(marker)
+        # A marker inside a quoted value (e.g. "t#bar{t}") is not a comment
+        while pos >= 0 and line[:pos].count('"') % 2 == 1:
+            pos = line.find(marker, pos + 1)
+        if pos >= 0:
+            line = line[:pos]
+    return line.rstrip()
+
+def unquote(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1]
+    return value
+
+def split_values(value):
+    """'"a", "b"' or 'a,b' -> ['a', 'b']."""
+    return [unquote(v) for v in value.split(",") if v.strip()]
+
+def parse_config(text):
+    """
+    List of blocks {'type', 'name', 'options'}, in file order. options maps every key to its raw value string;
+    lines that are not `Key: value` are ignored.
+    """
+    blocks = []
+    for raw in text.splitlines():
+        line = _strip_comment(raw)
+        if not line.strip() or ":" not in line:
+            continue
+        key, value = line.split(":", 1)
+        if not line[0].isspace():
+            blocks.append({"type": key.strip(), "name": unquote(value), "options": {}})
+        elif blocks:
+            blocks[-1]["options"][key.strip()] = value.strip()
+    return blocks
+
+def read_config(path):
+    with open(path) as f:
+        return parse_config(f.read())
+
+def render(blocks):
+    """Canonical text of blocks (no comments, normalised spacing), e.g. for hashing a subset of a config."""
+    lines = []
+    for block in blocks:
+        lines.append(f'{block["type"]}: "{block["name"]}"')
+        lines.extend(f"    {key}: {value}" for key, value in block["options"].items())
+    return "\n".join(lines) + "\n"
+
+def job(blocks):
+    for block in blocks:
+        if block["type"] == "Job":
+            return block
+    raise ValueError("config has no Job block")
+
+def job_dir(blocks):
+    """Directory TRexFitter writes the job's Histograms/, RooStats/, Fits/, Plots/, ... to: <OutputDir>/<Job name>."""
+    job_block = job(blocks)
+    return os.path.join(unquote(job_block["options"].get("OutputDir", "./")), job_block["name"])
+
+def _option(options, *keys):
+    for key in keys:
+        if key in options:
+            return split_values(options[key])
+    return None
+
+def hist_file_name(ntuple_file):
+    """Histogram file written next to an ntuple file: x.root -> x_hists.root, x -> x_hists."""
+    stem, ext = (ntuple_file[:-5], ".root") if ntuple_file.endswith(".root") else (ntuple_file, "")
+    return stem + HIST_SUFFIX + ext
+
+def _hist_files(value):
+    return ", ".join(f'"{hist_file_name(name)}"' for name in split_values(value))
+
+def hist_mode(text):
+    """
+    ReadFrom: HIST version of a rendered NTUP config: NtuplePath(s) / NtupleName(s) become HistoPath(s) /
+    HistoName(s), NtupleFile(s) point to the _hists files and the Region Variable lines are dropped, since
+    the binning is that of the histograms. Comments and layout are kept.
+    """
+    lines = []
+    for raw in text.splitlines():
+        match = re.match(r"(\s+)(\w+)(\s*):(.*)$", _strip_comment(raw))
+        if not match:
+            lines.append(raw)
+            continue
+        indent, key, space, value = match.groups()
+        if key == "ReadFrom":
+            raw = f"{indent}ReadFrom: HIST"
+        elif key == "Variable":
+            continue
+        elif key.startswith("NtupleFile"):
+            raw = f"{indent}Histo{key[len('Ntuple'):]}{space}: {_hist_files(value)}"
+        elif key.startswith("Ntuple"):
+            raw = f"{indent}Histo{key[len('Ntuple'):]}{space}:{value}"
+        lines.append(raw)
+    return "\n".join(lines) + ("\n" if text.endswith("\n") else "")
+
+def input_files(blocks):
+    """
+    Files the n step reads: every combination of paths and files of the Job, Sample and Systematic blocks
+    (NtuplePath(s) x NtupleFile(s) for ReadFrom: NTUP, HistoPath(s) x HistoFile(s) for ReadFrom: HIST), as
+    <path>/<file>.root. Paths are relative to the directory trex-fitter runs in.
+    """
+    job_options = job(blocks)["options"]
+    prefix = "Histo" if unquote(job_options.get("ReadFrom", "NTUP")).upper().startswith("HIST") else "Ntuple"
+    job_paths = _option(job_options, f"{prefix}Paths", f"{prefix}Path") or ["./"]
+    job_files = _option(job_options, f"{prefix}Files", f"{prefix}File") or []
+
+    files = set()
+    for block in blocks:
+        if block["type"] not in ("Job", "Sample", "Systematic"):
+            continue
+        options = block["options"]
+        paths = _option(options, f"{prefix}Paths", f"{prefix}Path") or job_paths
+        names = _option(options, f"{prefix}Files", f"{prefix}File") or job_files
+        # Systematic variations may point to their own files
+        for key, value in options.items():
+            if block["type"] == "Systematic" and key.startswith(f"{prefix}File") and key not in (f"{prefix}File", f"{prefix}Files"):
+                names = names + split_values(value)
+        for path, name in itertools.product(paths, names):
+            files.add(os.path.join(path, name if name.endswith(".root") else name + ".root"))
+    return sorted(files)
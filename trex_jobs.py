@@ -0,0 +1,163 @@
+"""
+Local scheduler for TRexFitter jobs: runs `trex-fitter <actions> <config>` for many configs at once with a
+bounded number of workers, instead of one signal point after the other.
+Every job writes its stdout / stderr to <log_dir>/<name>.out / .err (all attempts, each under a header line),
+failed jobs are retried up to `retries` times, and by default a failing job does not stop the others. The
+status and timing of every job is printed as a table at the end.
+By default the steps of a job are run one at a time through trex_cache.py, which skips the steps whose
+inputs (config, ntuples, outputs of earlier steps) have not changed since they last succeeded; --no-cache
+runs all actions in one trex-fitter call, --force reruns every step.
+
+    python trex_jobs.py config_LQ_2TeV.txt config_DM_1p0TeV.txt --workers 2 --retries 1
+
+The executable is looked up on PATH, so a stand-in `trex-fitter` script can be used for tests.
+"""
+import os
+import sys
+import time
+import argparse
+import traceback
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+TREX_COMMAND = "trex-fitter"
+DEFAULT_ACTIONS = "nwdpf"
+
+def add_arguments(parser):
+    """Scheduler options shared by the run_all_* drivers."""
+    parser.add_argument("--workers", type=int, default=None, help="Jobs run at the same time (default: one per job, up to the number of cores)")
+    parser.add_argument("--retries", type=int, default=0, help="Reruns of a failed job")
+    parser.add_argument("--stop-on-error", action="store_true", help="Do not start new jobs once one has failed")
+    parser.add_argument("--log-dir", default="trex_logs", help="Directory of the per-job .out/.err files")
+    parser.add_argument("--actions", default=DEFAULT_ACTIONS, help="TRexFitter actions, e.g. nwdpf or dp")
+    parser.add_argument("--no-cache", action="store_true", help="Run all actions in one call, without skipping unchanged steps")
+    parser.add_argument("--force", action="store_true", help="Rerun every step even if its inputs are unchanged")
+    return parser
+
+def run_job(name, config, actions=DEFAULT_ACTIONS, log_dir="trex_logs", retries=0, command=TREX_COMMAND,
+            incremental=False, force=False):
+    """
+    Runs `command actions config` (with incremental: one call per step that is not up to date, see trex_cache.py);
+    a failing call is repeated until it succeeds or has failed retries + 1 times. An exception of the incremental
+    bookkeeping (e.g. an unreadable config) is written to <name>.err and makes the job 'failed'.
+    Returns {'name', 'config', 'status' ('ok', 'failed' or 'no-command'), 'retries', 'returncode', 'ran', 'cached',
+    'seconds', 'log'}, where ran / cached are the steps that were run / skipped.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    out_path = os.path.join(log_dir, f"{name}.out")
+    err_path = os.path.join(log_dir, f"{name}.err")
+    result = {"name": name, "config": config, "status": "failed", "retries": 0, "returncode": None,
+              "ran": "", "cached": "", "log": out_path}
+    start = time.perf_counter()
+    with open(out_path, "w") as out, open(err_path, "w") as err:
+
+        def execute(step_actions):
+            cmd = [command, step_actions, config]
+            for attempt in range(1, retries + 2):
+                result["retries"] += attempt > 1
+                for log in (out, err):
+                    log.write(f"=== attempt {attempt}: {' '.join(cmd)}\n")
+                    log.flush()
+                try:
+                    proc = subprocess.run(cmd, stdout=out, stderr=err)
+                except FileNotFoundError:
+                    # Retrying cannot help when the executable is missing
+                    err.write(f"ERROR: '{command}' not found in PATH\n")
+                    return None
+                if proc.returncode == 0:
+                    break
+            return proc.returncode
+
+        crashed = False
+        if incremental:
+            import trex_cache
+            try:
+                returncode, result["ran"], result["cached"] = trex_cache.run_steps(config, actions, execute, force)
+            except Exception:
+                err.write("ERROR: incremental run failed\n")
+                traceback.print_exc(file=err)
+                returncode, crashed = None, True
+        else:
+            returncode = execute(actions)
+            result["ran"] = actions if returncode == 0 else ""
+    result["returncode"] = returncode
+    result["status"] = "failed" if crashed else "no-command" if returncode is None else "ok" if returncode == 0 else "failed"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def _placeholder_result(name, config, status, error=""):
+    """run_jobs result of a job that did not run to the end of run_job (cancelled, or run_job raised)."""
+    return {"name": name, "config": config, "status": status, "retries": 0, "returncode": None, "ran": "", "cached": "",
+            "seconds": 0.0, "log": "", "error": error}
+
+def run_jobs(jobs, workers=None, retries=0, stop_on_error=False, log_dir="trex_logs", actions=DEFAULT_ACTIONS,
+             command=TREX_COMMAND, incremental=False, force=False):
+    """
+    Runs the (name, config) jobs concurrently in up to workers threads (each waits on its trex-fitter process)
+    and returns the run_job results in the order of jobs. With stop_on_error, jobs that have not started when
+    one fails are marked 'cancelled'; running jobs are left to finish. A job whose run_job raises (e.g. its log
+    files cannot be opened) is recorded as 'failed' with the exception text under 'error'.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    configs = dict(jobs)
+    print(f"Running {len(jobs)} TRexFitter jobs ({actions}) with {workers} workers, logs in {log_dir}/")
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_job, name, config, actions, log_dir, retries, command, incremental, force): name
+                   for name, config in jobs}
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = _placeholder_result(name, configs[name], "failed", f"{type(e).__name__}: {e}")
+            results[name] = result
+            retried = f" after {result['retries']} retries" if result["retries"] else ""
+            if result["status"] == "ok":
+                cached = f", cached: {result['cached']}" if result["cached"] else ""
+                print(f"--- Completed: {name}{retried} (ran: {result['ran'] or '-'}{cached}, {result['seconds']:.0f} s) ---")
+                continue
+            if result.get("error"):
+                print(f"ERROR: job {name} could not be run: {result['error']}")
+            else:
+                print(f"ERROR: TRexFitter failed for {name}{retried}, see {result['log']} and .err")
+            if stop_on_error:
+                for pending, pending_name in futures.items():
+                    if pending.cancel():
+                        results[pending_name] = _placeholder_result(pending_name, configs[pending_name], "cancelled")
+    return [results[name] for name, _ in jobs]
+
+def print_table(results):
+    """Status / timing table of run_jobs results; returns the number of jobs that did not succeed."""
+    print("")
+    print(f"{'Job':<32}{'Status':<12}{'Ran':>8}{'Cached':>8}{'Retries':>9}{'Exit':>6}{'Time [s]':>10}  Log")
+    for r in results:
+        code = "" if r["returncode"] is None else str(r["returncode"])
+        print(f"{r['name']:<32}{r['status']:<12}{r['ran'] or '-':>8}{r['cached'] or '-':>8}{r['retries']:>9}{code:>6}"
+              f"{r['seconds']:>10.1f}  {r['log'] or r.get('error', '')}")
+    failed = [r["name"] for r in results if r["status"] != "ok"]
+    print(f"{len(results) - len(failed)}/{len(results)} jobs succeeded" + (f", failed: {', '.join(failed)}" if failed else ""))
+    return len(failed)
+
+def run_from_args(jobs, args):
+    """Runs jobs with the add_arguments options and prints the table; returns the exit code for the driver."""
+    results = run_jobs(jobs, args.workers, args.retries, args.stop_on_error, args.log_dir, args.actions,
+                       incremental=not args.no_cache, force=args.force)
+    return 1 if print_table(results) else 0
+
+if __name__ == "__main__":
+    parser = add_arguments(argparse.ArgumentParser(description="Run trex-fitter on several configs in parallel."))
+    parser.add_argument("configs", nargs="+", help="TRexFitter config files")
+    args = parser.parse_args()
+
+    missing = [c for c in args.configs if not os.path.exists(c)]
+    if missing:
+        print(f"FATAL: configs not found: {missing}")
+        sys.exit(1)
+    jobs = [(os.path.splitext(os.path.basename(c))[0], c) for c in args.configs]
+    sys.exit(run_from_args(jobs, args))